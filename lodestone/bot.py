@@ -1,7 +1,6 @@
 from javascript import require, On, Once
 from javascript.proxy import Proxy
 from rich.console import Console
-from tinydb import TinyDB, Query
 
 import requests
 import os
@@ -15,13 +14,19 @@ from importlib.metadata import version as version_checker
 import dataclasses
 
 try:
-    from logger import logger
+    from logger import logger, pipeline, JsonlSink, WebhookSink, daily_thread
     from utils import cprop, send_webhook
+    from chatlog import ChatLog, Retention
+    from commands import Command, CommandDispatcher, ArgumentError, RateLimit, ResultCache
+    from executors import HandlerExecutor
+    from outbound import ChatScheduler
 except ImportError:
-    from .logger import logger
+    from .logger import logger, pipeline, JsonlSink, WebhookSink, daily_thread
     from .utils import cprop, send_webhook
-
-User = Query()
+    from .chatlog import ChatLog, Retention
+    from .commands import Command, CommandDispatcher, ArgumentError, RateLimit, ResultCache
+    from .executors import HandlerExecutor
+    from .outbound import ChatScheduler
 
 
 filestruc = "/"
@@ -30,6 +35,8 @@ if os.name == 'nt':
 
 __all__ = ['Bot', 'createBot']
 
+_NO_COMPARE = object() # `get_data` without a value to compare against
+
 class GameState:
     """
     Stores information about the current game state. Should not initialize manually
@@ -254,14 +261,15 @@ class CommandContext:
     full_message: Proxy
     bot: 'Bot'
 
-    def respond(self, *message, whisper = False, whisper_to: str = sender):
+    def respond(self, *message, whisper = False, whisper_to: str = None):
         """
-        Respond to the command. Use whisper_to only if whisper is True
+        Respond to the command. Use whisper_to only if whisper is True, it defaults to the sender.
+        Responses jump ahead of other queued chat
         """
         if whisper:
-            self.bot.whisper(whisper_to, *message)
+            self.bot.whisper(whisper_to or self.sender, *message, priority="high")
         else:
-            self.bot.chat(*message)
+            self.bot.chat(*message, priority="high")
 
 class Bot:
     def __init__(
@@ -284,7 +292,14 @@ class Bot:
             defaultChatPatterns: bool = True,
             checkTimeoutInterval: int = 60 * 10000,
             ls_disable_logs: bool = False,
+            ls_log_format: str = None,
+            ls_log_file: str = None,
+            ls_log_levels: dict = None,
             ls_enable_chat_logging: bool = False,
+            ls_chat_log_path: str = "chatlog.db",
+            ls_chat_retention: Retention = None,
+            ls_chat_rate: float = 1.0,
+            ls_chat_burst: int = 5,
             ls_skip_checks: bool = False,
             ls_disable_viewer: bool = False,
             ls_stop_bot_on_death: bool = False,
@@ -303,6 +318,11 @@ class Bot:
             os.environ["DEBUG"] = "minecraft-protocol"
         else:
             os.environ["DEBUG"] = ""
+        self.logger = logger.bind("bot", source=username) # the sinks of this bot only take its own records
+        if ls_log_format or ls_log_levels:
+            # the console format ("json" for production) and the levels by category (like {"emit": "debug"}) are shared by every bot in the process
+            pipeline.configure(renderer=ls_log_format, levels=ls_log_levels)
+        self.log_file_sink = pipeline.add_sink(JsonlSink(ls_log_file, sources=(username,))) if ls_log_file else None
 
         self.local_host = host
         self.local_auth = auth
@@ -323,6 +343,10 @@ class Bot:
         self.viewer_port = ls_viewer_port
         self.disable_logs = ls_disable_logs
         self.enable_chat_logging = ls_enable_chat_logging
+        self.chat_log_path = ls_chat_log_path
+        self.chat_retention = ls_chat_retention
+        self.chat_rate = ls_chat_rate
+        self.chat_burst = ls_chat_burst
         self.skip_checks = ls_skip_checks
         self.disable_viewer = ls_disable_viewer
         self.discord_webhook = ls_discord_webhook
@@ -333,15 +357,8 @@ class Bot:
         self.check_timeout_interval = checkTimeoutInterval
 
         self.custom_command_prefix = "!"
-        self.custom_commands = {}
-        """
-        {
-            "cmd_name": {
-                "sender": sender or None,
-                "callback": Callable[[CommandContext], None]
-            }
-        }
-        """
+        self.custom_commands = CommandDispatcher(self.custom_command_prefix)
+        self.handler_executors = {} # "event.handler" -> HandlerExecutor, for handlers that don't run inline
 
         self.console = Console()
         self.extra_data = {}
@@ -353,8 +370,12 @@ class Bot:
         else:
             self.node_version, self.pip_version, self.python_version = "unknown", "unknown", "unknown"
 
-        if self.discord_webhook is not None:
-            pass # needs plugin
+        self.webhook_sink = None
+        if self.discord_webhook is not None: # bot and chat logs go to discord in the background, batched
+            self.webhook_sink = pipeline.add_sink(WebhookSink(
+                self.discord_webhook, categories=("bot", "chat"), sources=(self.local_username,), thread_name=daily_thread if self.use_discord_forums else None,
+                footer={"text": self.local_username, "icon_url": f"https://mc-heads.net/avatar/{self.local_username}/600.png"},
+            ))
 
         self.mineflayer = require('mineflayer')
         self.pathfinder = require('mineflayer-pathfinder')
@@ -372,8 +393,14 @@ class Bot:
         self.use_return = ls_use_return
         self.msa_status = False
         self.server_name = f"{self.local_host}".lower().replace(".", "")
+        # outgoing chat, whispers and commands are rate limited by default; ls_chat_rate=None sends straight away like before
+        self.chat_scheduler = ChatScheduler(self.__send_chat, self.chat_rate, self.chat_burst) if self.chat_rate else None
         if self.enable_chat_logging:
-            self.chat_database = TinyDB(f"{self.server_name}Database.json")
+            self.chat_log = ChatLog(self.chat_log_path, retention=self.chat_retention)
+            if os.path.exists(f"{self.server_name}Database.json"):
+                migrated = self.chat_log.migrate_tinydb(f"{self.server_name}Database.json", self.server_name)
+                if migrated:
+                    self.log(f"Moved {migrated} messages from {self.server_name}Database.json to {self.chat_log_path}", info=True)
         self.script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
         self.bot: Proxy = self.__create_bot()
         self.proxy = self.bot
@@ -415,21 +442,21 @@ class Bot:
                 self.log(message='Python command not found, make sure python is installed!', error=True, discord=False)
                 sys.exit(1)
 
-    def log(self, message, icon="🤖", error=False, info=False, warning=False, chat=False, image_url="", console=True, discord=True):
+    def log(self, message, icon="🤖", error=False, info=False, warning=False, chat=False, image_url="", console=True, discord=True, category=None):
+        """
+        Logs a message. It is only queued here, the sinks (console, files, discord) write it in the background, see `logger.LogPipeline`.
+        `category` defaults to "chat" for chat and "bot" for everything else. `console` and `discord` False leave out those sinks
+        """
         if not self.disable_logs:
-            if self.use_return:
-                logger.info(f"[{icon}] {message}")
-            if console:
-                if error:
-                    logger.error(f"[{icon}] {message}")
-                elif info:
-                    logger.info(f"[{icon}] {message}")
-                elif warning:
-                    logger.warning(f"[{icon}] {message}")
-                elif chat:
-                    logger.info(f"[{icon}] {message}")
-                else:
-                    logger.info(f"[{icon}] {message}")
+            category = category or ("chat" if chat else "bot")
+            skip = ()
+            if not console and not self.use_return:
+                skip += ("stdout",)
+            if not discord:
+                skip += ("webhook",)
+            level = "error" if error else "warning" if warning else "info"
+            fields = {"image_url": image_url} if image_url else {}
+            self.logger.log(level, f"[{icon}] {message}", category, skip, **fields)
         
     @staticmethod
     def __find_files(base, pattern):
@@ -452,7 +479,7 @@ class Bot:
             if int(node_version[:2]) >= 18:
                 pass
             else:
-                logger.warning(f"""
+                self.logger.warning(f"""
                                 Detected node version {node_version[:2]} which isn't supported!
                                 This may cause problems. Please update to node 18 or above!
                                 """)
@@ -506,22 +533,44 @@ class Bot:
         self.log(
             f'Coordinates: {int(self.bot.entity.position.x)}, {int(self.bot.entity.position.y)}, {int(self.bot.entity.position.z)}',
             info=True)
-        self.register_command("@!version", return_str=f"{version_checker('lodestone')}")
+        self.register_command("@!version", returns=lambda ctx: version_checker('lodestone'), respond_result=True, cache_ttl=3600, sender_rate=0.2)
 
-    def on(self, event: str):
+    def on(self, event: str, executor: str = "inline", max_queue: int = 100, policy: str = "drop_oldest", workers: int = 1):
         """
-        Decorator for event registering
+        Decorator for event registering. Handlers run on the bridge's callback thread (`inline`) unless an `executor` is given:
+        `thread` runs them in the background with a queue of at most `max_queue`
+        events, and `policy` (`drop_oldest`, `reject` or `block`, see `HandlerExecutor`) says what happens when it's full. See `handler_metrics`
 
         ```python
         @bot.on('messagestr')
         def chat(_, message, *args):
             ...
+
+        @bot.on('build_schematic', executor="thread")
+        def build(_, file):
+            ...
         ```
         """
         def inner(function):
-            On(self.proxy, event)(function)
+            On(self.proxy, event)(self.__handler(f"{event}.{function.__name__}", function, executor, max_queue, policy, workers))
         return inner
 
+    def __handler(self, name: str, function, executor: str, max_queue: int, policy: str, workers: int):
+        "`function` itself when inline, otherwise a function queueing the call on its own `HandlerExecutor`"
+        if executor == "inline":
+            return function
+        run = HandlerExecutor(function, executor, max_queue, policy, workers, name)
+        self.handler_executors[name] = run
+        def handler(*args):
+            run.submit(*args)
+        handler.__name__ = function.__name__
+        handler.__doc__ = function.__doc__
+        return handler
+
+    def handler_metrics(self) -> dict:
+        "Queue depth, dropped and rejected calls and latencies of every handler that doesn't run inline"
+        return {name: run.snapshot() for name, run in self.handler_executors.items()}
+
     def once(self, event: str):
         """
         Decorator for event registering
@@ -545,7 +594,8 @@ class Bot:
         ```
         """
         self.bot.emit(event, *params)
-        self.log(f"Emitting event {repr(event)}", info=True, discord=False)
+        if not self.disable_logs:
+            self.logger.debug(f"[🤖] Emitting event {repr(event)}", "emit") # filtered and sampled, see `logger.LogPipeline`
 
     def add_method(self, target_name=None):
         """
@@ -702,7 +752,7 @@ class Bot:
     def __setup_events(self):
         @self.once("login")
         def on_login(*_):
-            logger.info("Logged in successfully!")
+            self.logger.info("Logged in successfully!")
             self.logged_in = True
             self.log(f"Connected to {self.local_host}", info=True)
             self.log(f'Logged in as {self.bot.username}', info=True)
@@ -742,24 +792,21 @@ class Bot:
             if self.enable_chat_logging:
                 if not sender:
                     sender = "unknown"
-                if not self.chat_database.contains(User.username == sender):
-                    self.chat_database.insert({'username': sender, 'messages': [message]})
-                else:
-                    user = self.chat_database.get(User.username == sender)
-                    existing_messages = user['messages']
-                    existing_messages.extend([f"{message}"])
-                    self.chat_database.update({'messages': existing_messages}, User.username == sender)
+                self.chat_log.append(self.server_name, sender, f"{message}")
                 self.log(f"{sender}: {message}", icon="💬", chat=True)
 
-            if message.startswith(self.custom_command_prefix):
-                command = message.removeprefix(self.custom_command_prefix)
-                commanded = self.custom_commands.get(command, None)
-                if commanded:
-                    if sender == commanded["sender"]:
-                        cmd, *params = command.split()
-                        commanded["callback"](CommandContext(
-                            sender, cmd, command, params, time.time(), args[1], self
-                        ))
+            matched = self.custom_commands.match(message)
+            if matched:
+                commanded, words = matched
+                if commanded.allows(sender) and commanded.admit(sender):
+                    try:
+                        arguments = commanded.parse(words)
+                    except ArgumentError as e:
+                        self.whisper(sender, str(e))
+                        return
+                    commanded.callback(CommandContext(
+                        sender, commanded.name, message.removeprefix(self.custom_command_prefix), arguments, time.time(), args[1], self
+                    ))
 
     def __start_viewer(self):
         try:
@@ -769,17 +816,38 @@ class Bot:
             self.log("There was an error while starting the viewer!", warning=True)
             
     
-    def chat(self, *message):
+    def chat(self, *message, priority: str = "normal"):
         """
-        Send a message in the chat
+        Send a message in the chat. Messages are queued and sent at `ls_chat_rate` per second (1 by default, None sends right away),
+        `priority` ("high", "normal" or "low") picks the queue. Long messages are split into several
         """
-        self.bot.chat(' '.join(message))
+        self.__queue_chat("chat", None, ' '.join(f"{part}" for part in message), priority)
         
-    def whisper(self, username, *message):
+    def whisper(self, username, *message, priority: str = "normal"):
         """
-        Send a whisper to a user with a message
+        Send a whisper to a user with a message, queued like `chat`
         """
-        self.bot.whisper(username, ' '.join(message))
+        self.__queue_chat("whisper", username, ' '.join(f"{part}" for part in message), priority)
+
+    def __queue_chat(self, kind: str, target, text: str, priority: str):
+        if self.chat_scheduler:
+            self.chat_scheduler.submit(kind, text, target, priority)
+        else:
+            self.__send_chat(kind, target, text)
+
+    def __send_chat(self, kind: str, target, text: str):
+        if kind == "whisper":
+            self.bot.whisper(target, text)
+        else:
+            self.bot.chat(text)
+
+    def wait_for_chat(self, timeout: float = None) -> bool:
+        "Waits until all queued chat, whispers and commands are sent. Returns False on timeout"
+        return self.chat_scheduler.join(timeout) if self.chat_scheduler else True
+
+    def chat_metrics(self) -> dict:
+        "Queue depth per priority, sent, split and coalesced messages and send latency of the outgoing chat"
+        return self.chat_scheduler.snapshot() if self.chat_scheduler else {}
 
     def command_safe(self, arg):
         if isinstance(arg, str) and arg.count(' '):
@@ -794,7 +862,10 @@ class Bot:
         else:
             return arg
 
-    def command(self, command: str, *args):
+    def command(self, command: str, *args, priority: str = "high"):
+        """
+        Send a command, `command("tp", "Steve", 0, 64, 0)` sends `/tp Steve 0 64 0`. Commands go ahead of normal chat in the queue
+        """
         converted_args = []
         for arg in args:
             parsed = self.command_safe(arg)
@@ -802,28 +873,28 @@ class Bot:
                 converted_args.extend(parsed)
             else:
                 converted_args.append(parsed)
-        self.chat('/' + command, *converted_args)
+        self.__queue_chat("command", None, ' '.join(f"{part}" for part in ['/' + command, *converted_args]), priority)
 
 
-    def chat_history(self, username: str, server="") -> list:
+    def chat_history(self, username: str = None, since=None, until=None, contains: str = None, limit: int = 100, cursor: tuple = None, server="") -> list:
         """
-        Get all the chat history from a player in the database
+        Search the logged chat, newest first. Every filter is optional: `since` and `until` are unix times or datetimes,
+        `contains` matches messages with all of its words. `server` defaults to the current server, None searches all of them.
+        Returns a page of at most `limit` messages as dicts (server, sender, time, message), pass its `cursor` back for the next page
+
+        ```python
+        page = bot.chat_history("Steve", contains="diamonds", since=time.time() - 86400)
+        older = bot.chat_history("Steve", contains="diamonds", cursor=page.cursor)
+        ```
         """
         if not self.enable_chat_logging:
             self.log(f"Chat logging is not enabled, set enableChatLogging=True in the bot config", warning=True)
             return []
         if server == "":
             server = self.local_host
-        if os.path.exists(f"{server}".lower().replace(".", "") + "Database.json"):
-            server_history = TinyDB(f"{server}".lower().replace(".", "") + "Database.json")
-            user = server_history.get(User.username == username)
-            if user:
-                return user['messages']
-            else:
-                self.log(f"{username} has no chat history", warning=True)
-        else:
-            self.log(f"{server} has no database", warning=True)
-            return []
+        if server is not None:
+            server = f"{server}".lower().replace(".", "")
+        return self.chat_log.query(server, username, since, until, contains, limit, cursor)
         
     def clear_logs(self):
         """
@@ -832,18 +903,26 @@ class Bot:
         if not self.enable_chat_logging:
             self.log(f"Chat logging is not enabled, set enableChatLogging=True in the bot config", warning=True)
             return
-        self.chat_database.truncate()
-        self.log("All databases are cleared!")
+        self.chat_log.clear(self.server_name)
+        self.log(f"Chat logs of {self.local_host} are cleared!")
     
     def stop(self):
         """
         Stop the bot and all running code
         """
     
+        if self.chat_scheduler:
+            self.chat_scheduler.close(5) # the queued messages go out while still connected
         self.bot.end()
+        if self.enable_chat_logging:
+            self.chat_log.close()
         if not self.disable_viewer:
             self.bot.viewer.close()
         self.log("Ended bot!", warning=True)
+        pipeline.flush(5) # so the last records, "Ended bot!" included, get to this bot's sinks before they are removed
+        for sink in (self.log_file_sink, self.webhook_sink):
+            if sink:
+                pipeline.remove_sink(sink)
         return
         
     def server_data(self, server:str=None) -> dict:
@@ -869,7 +948,7 @@ class Bot:
         self.extra_data[item] = value
         return value
 
-    def get_data(self, item, default: object = None, compare: object = type()):
+    def get_data(self, item, default: object = None, compare: object = _NO_COMPARE):
         """
         Gets custom data that is set prior. Also take in an optional compare parameter to do assertion with the obtained data.
         Default parameter for 'default' is None
@@ -883,7 +962,7 @@ class Bot:
         ```
         """
         result = self.extra_data.get(item, default)
-        if not compare == type(): # there's a comparison
+        if compare is not _NO_COMPARE: # there's a comparison
             if result != compare:
                 raise AssertionError(
                     f"Incorrect value in custom data! Queried {repr(item)}={repr(result)}, instead expected {repr(item)}={repr(compare)}"
@@ -895,13 +974,23 @@ class Bot:
         Sets the bot's command prefix. This should not be empty as it will speed up responding to chat
         """
         self.custom_command_prefix = new_prefix
+        self.custom_commands.prefix = new_prefix
 
-    def register_command(self, command_name: str, sender = None, returns: str | Callable[[CommandContext], None] = None, whisper: bool = True):
+    def register_command(self, command_name: str, sender = None, returns: str | Callable[[CommandContext], None] = None, whisper: bool = True,
+                         aliases: list = None, arguments: list = None, executor: str = "inline", max_queue: int = 100, policy: str = "drop_oldest",
+                         sender_rate: float = None, sender_burst: int = 3, global_rate: float = None, global_burst: int = 10, cache_ttl: float = None,
+                         respond_result: bool = False):
         """
         Registers a custom command that the bot listen to. You can only register one callback to a command. Subsequent registers will overwrite the previous ones
         If you set the `sender` parameter the bot will only respond if the senders match.
         You can pass an function with the `returns` parameter. DO NOT CALL.
         Your custom function needs to accept a context argument of type CommandContext.
+        `aliases` are other names for the command. With `arguments` (types like int, or any function taking the word) the words after
+        the command are parsed into `ctx.arguments`, and a sender using it wrong gets the usage whispered. A `str` at the end takes the rest of the message.
+        `executor`, `max_queue` and `policy` work like they do for `on`.
+        With `respond_result` a callback returning something other than None responds with it. `sender_rate` and `global_rate` limit uses per second
+        per sender and in total (with bursts of `sender_burst` and `global_burst`), uses over the limit are ignored. With `cache_ttl` (needs `respond_result`)
+        the result is reused for that many seconds for the same arguments instead of calling the callback again
 
         Alternatively, you can use this as a decorator too!
 
@@ -918,18 +1007,51 @@ class Bot:
             ctx.respond(f"It is now {current_time}", whisper=True)
         ```
 
+        ```python
+        @bot.register_command("stats", arguments=[str], sender_rate=0.5, respond_result=True, cache_ttl=60)
+        def stats(ctx):
+            return lookup_stats(ctx.arguments[0]) # slow, but at most once a minute per player name
+        ```
+
+        ```python
+        @bot.register_command("tp", aliases=["teleport"], arguments=[int, int, int])
+        def teleport(ctx):
+            x, y, z = ctx.arguments
+            ctx.bot.command("tp", x, y, z)
+        ```
+
         """
-        command_sender = sender
+        if cache_ttl and not respond_result:
+            raise ValueError("cache_ttl caches the result the command responds with, it needs respond_result=True")
+        cache = ResultCache(cache_ttl) if cache_ttl else None
+        def register(callback):
+            def invoke(ctx):
+                key = None
+                if cache:
+                    try:
+                        key = tuple(ctx.arguments)
+                        hash(key)
+                    except TypeError:
+                        key = None # unhashable arguments aren't cached
+                    result = cache.get(key) if key is not None else None
+                    if result is not None:
+                        ctx.respond(f"{result}", whisper=whisper)
+                        return
+                result = callback(ctx)
+                if respond_result and result is not None:
+                    if key is not None:
+                        cache.put(key, result)
+                    ctx.respond(f"{result}", whisper=whisper)
+            invoke.__name__ = getattr(callback, "__name__", command_name)
+            self.custom_commands.register(Command(
+                command_name, self.__handler(f"command.{command_name}", invoke, executor, max_queue, policy, 1), sender,
+                tuple(arguments) if arguments is not None else None, tuple(aliases or ()),
+                RateLimit(sender_rate, sender_burst) if sender_rate else None, RateLimit(global_rate, global_burst) if global_rate else None
+            ))
         if isinstance(returns, str):
-            self.custom_commands[command_name] = {
-                "sender": command_sender,
-                "callback": lambda ctx: ctx.respond(returns, whisper=whisper)
-            }
+            register(lambda ctx: ctx.respond(returns, whisper=whisper))
         elif callable(returns):
-            self.custom_commands[command_name] = {
-                "sender": command_sender,
-                "callback": returns
-            }
+            register(returns)
         elif returns is None:
             def inner(func):
                 def wrapper(ctx):
@@ -939,10 +1061,7 @@ class Bot:
                 wrapper.__doc__ = func.__doc__
                 wrapper.__dict__ = func.__dict__
 
-                self.custom_commands[command_name] = {
-                    "sender": command_sender,
-                    "callback": func
-                }
+                register(func)
                 return wrapper
             return inner
         else:
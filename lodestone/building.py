@@ -0,0 +1,648 @@
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+_MISSING = object()
+
+def greedy_boxes(cells: dict, max_volume: int = 32768) -> list:
+    """
+    Merges cells of identical state into cuboids. `cells` maps (x, y, z) -> state.
+    Boxes grow along x, then z, then y as long as every cell inside has the same state and
+    the volume stays under `max_volume` (the vanilla /fill limit).
+
+    Returns a list of (state, (x1, y1, z1), (x2, y2, z2)) with inclusive corners
+    """
+    remaining = dict(cells)
+    boxes = []
+    for x, y, z in sorted(cells, key=lambda p: (p[1], p[2], p[0])):
+        state = remaining.get((x, y, z), _MISSING)
+        if state is _MISSING:
+            continue # already part of a box
+
+        x2 = x
+        while remaining.get((x2 + 1, y, z), _MISSING) == state and x2 + 2 - x <= max_volume:
+            x2 += 1
+        width = x2 - x + 1
+
+        z2 = z
+        while (z2 + 2 - z) * width <= max_volume and all(
+                remaining.get((i, y, z2 + 1), _MISSING) == state for i in range(x, x2 + 1)):
+            z2 += 1
+        area = width * (z2 - z + 1)
+
+        y2 = y
+        while (y2 + 2 - y) * area <= max_volume and all(
+                remaining.get((i, y2 + 1, k), _MISSING) == state
+                for k in range(z, z2 + 1) for i in range(x, x2 + 1)):
+            y2 += 1
+
+        for j in range(y, y2 + 1):
+            for k in range(z, z2 + 1):
+                for i in range(x, x2 + 1):
+                    del remaining[(i, j, k)]
+        boxes.append((state, (x, y, z), (x2, y2, z2)))
+    return boxes
+
+# same order as the faces in Build.get_possible_directions: down, up, north, south, west, east
+FACE_DIRECTIONS = [(0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1), (-1, 0, 0), (1, 0, 0)]
+
+# index of a block's half (the `half` or `type` property) in the face tables
+HALVES = {"top": 1, "bottom": 2}
+
+def shape_face_flags(shapes) -> np.ndarray:
+    """
+    Whether a block with these collision shapes has a face to place against, as a [6, 3] bool array by direction
+    (the neighbour in FACE_DIRECTIONS, so its face pointing back) and half of the placed block (any, top, bottom)
+    """
+    flags = np.zeros((6, 3), dtype=bool)
+    for i, (dx, dy, dz) in enumerate(FACE_DIRECTIONS):
+        dx, dy, dz = -dx, -dy, -dz
+        for shape in shapes:
+            x0, y0, z0, x1, y1, z1 = shape
+            # center of the face of this shape pointing in the direction
+            center_y = (y0 + y1) / 2 + (y1 - y0) / 2 * dy
+            half_height = (y1 - y0) / 2
+            flags[i, 0] = True
+            # the face has to reach into the right half of the block, sideways faces get moved up or down as far as they go
+            top_y = center_y + half_height - 0.001 if dy == 0 and center_y <= 0.5 else center_y
+            if top_y > 0.5:
+                flags[i, HALVES["top"]] = True
+            bottom_y = center_y - (half_height - 0.001) if dy == 0 and center_y >= 0.5 else center_y
+            if bottom_y < 0.5:
+                flags[i, HALVES["bottom"]] = True
+    return flags
+
+class FaceTable:
+    """
+    `shape_face_flags` by state id, filled in the first time a state comes up. `shapes_of(state_id)` gives the collision shapes of a state
+    """
+    def __init__(self, shapes_of):
+        self.shapes_of = shapes_of
+        self.flags = np.zeros((1, 6, 3), dtype=bool) # state 0 (air) has nothing to place against
+        self.known = np.ones(1, dtype=bool)
+
+    def lookup(self, states: np.ndarray) -> np.ndarray:
+        "The flags ([..., 6, 3]) of an array of state ids"
+        states = np.asarray(states)
+        self._learn(states)
+        return self.flags[states]
+
+    def faces(self, neighbours: np.ndarray, halves: np.ndarray) -> np.ndarray:
+        """
+        For a batch of placements, which of their (n, 6) `neighbours` (states in FACE_DIRECTIONS order) have a face to place against
+        for the half (`halves`, (n,) indices into the tables) of the placed block
+        """
+        self._learn(neighbours)
+        return self.flags[neighbours, np.arange(6), halves[:, None]]
+
+    def _learn(self, states: np.ndarray):
+        if states.size and states.max() >= len(self.known):
+            size = int(states.max()) + 1
+            self.flags = np.concatenate((self.flags, np.zeros((size - len(self.known), 6, 3), dtype=bool)))
+            self.known = np.concatenate((self.known, np.zeros(size - len(self.known), dtype=bool)))
+        for state in np.unique(states[~self.known[states]]).tolist():
+            self.flags[state] = shape_face_flags(self.shapes_of(state))
+            self.known[state] = True
+
+GRAVITY_BLOCKS = {
+    "sand", "red_sand", "gravel", "suspicious_sand", "suspicious_gravel",
+    "anvil", "chipped_anvil", "damaged_anvil", "dragon_egg", "pointed_dripstone", "scaffolding"
+}
+
+def is_gravity_block(name: str) -> bool:
+    "Whether the block falls (or breaks) without a block below it"
+    return name in GRAVITY_BLOCKS or name.endswith("concrete_powder")
+
+class ActionGraph:
+    """
+    Dependency graph over build actions, keyed by their (x, y, z) position.
+    An action becomes ready once all the actions it depends on are completed, so repeatedly building from `ready()` gives a topological order
+    """
+    def __init__(self):
+        self.actions = {}
+        self.waiting_on = {}
+        self.dependents = {}
+        self.ready_keys = {} # insertion ordered set
+        self.failed = set()
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add_many(self, actions, dependencies_of):
+        """
+        Adds actions to the graph. `dependencies_of(action)` returns the positions the action has to wait for.
+        Positions without an action in the graph are ignored
+        """
+        actions = list(actions)
+        for action in actions:
+            self.actions[action['xyz']] = action
+        for action in actions:
+            key = action['xyz']
+            waiting = {dep for dep in dependencies_of(action) if dep in self.actions and dep != key}
+            self.waiting_on[key] = waiting
+            for dep in waiting:
+                self.dependents.setdefault(dep, []).append(key)
+            if not waiting:
+                self.ready_keys[key] = None
+
+    def ready(self) -> list:
+        "Actions that have nothing left to wait for"
+        return [self.actions[key] for key in self.ready_keys]
+
+    def complete(self, key):
+        "Marks an action as done and releases whatever was waiting on it"
+        if self.actions.pop(key, None) is None:
+            return
+        self.ready_keys.pop(key, None)
+        self.failed.discard(key)
+        self.waiting_on.pop(key, None)
+        for dependent in self.dependents.pop(key, ()):
+            waiting = self.waiting_on.get(dependent)
+            if waiting is None:
+                continue
+            waiting.discard(key)
+            if not waiting and dependent not in self.failed:
+                self.ready_keys[dependent] = None
+
+    def fail(self, key):
+        "Takes a failed action out of the ready set. Its dependents keep waiting on it"
+        if key in self.actions:
+            self.ready_keys.pop(key, None)
+            self.failed.add(key)
+
+    def retry(self, key):
+        "Puts a failed action back into the ready set"
+        if key in self.actions:
+            self.failed.discard(key)
+            if not self.waiting_on.get(key):
+                self.ready_keys[key] = None
+
+    def release_blocked(self) -> int:
+        """
+        Releases the actions waiting only on failed ones, or the ones with the fewest unmet dependencies if the dependencies form a cycle.
+        Only needed when nothing is ready. Returns how many got released
+        """
+        blocked = [key for key, waiting in self.waiting_on.items() if waiting and key not in self.failed]
+        if not blocked:
+            return 0
+        released = [key for key in blocked if self.waiting_on[key] <= self.failed]
+        if not released: # a cycle
+            fewest = min(len(self.waiting_on[key]) for key in blocked)
+            released = [key for key in blocked if len(self.waiting_on[key]) == fewest]
+        for key in released:
+            self.waiting_on[key] = set()
+            self.ready_keys[key] = None
+        return len(released)
+
+
+def file_hash(path: str) -> str:
+    "sha1 of a file, read in blocks"
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class BuildCheckpoint:
+    """
+    Progress of a build on disk. The file starts with a header (schematic hash, origin, volume) and a snapshot of the completed bitmap,
+    after which newly completed and failed positions are appended every `interval` seconds. Positions are stored as indices into the volume
+    """
+    def __init__(self, path: str, schematic_hash: str, at, start, size, interval: float = 30):
+        self.path = path
+        self.schematic_hash = schematic_hash
+        self.at = tuple(at)
+        self.start = tuple(start)
+        self.size = tuple(size)
+        self.interval = interval
+        self.completed = bytearray((self.size[0] * self.size[1] * self.size[2] + 7) // 8)
+        self.errors = set()
+        self._done = []
+        self._errors = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock() # the bitmap, errors and pending records: the builder marks and flushes while a background diff sets and saves
+
+    def index(self, xyz) -> int:
+        return ((xyz[1] - self.start[1]) * self.size[2] + xyz[2] - self.start[2]) * self.size[0] + xyz[0] - self.start[0]
+
+    def position(self, index: int) -> tuple:
+        x = index % self.size[0]
+        z = index // self.size[0] % self.size[2]
+        y = index // (self.size[0] * self.size[2])
+        return (x + self.start[0], y + self.start[1], z + self.start[2])
+
+    def is_completed(self, xyz) -> bool:
+        index = self.index(xyz)
+        return bool(self.completed[index >> 3] >> (index & 7) & 1)
+
+    def set_completed(self, xyz, completed: bool):
+        "Updates the bitmap without logging it, used while diffing. Call `save()` afterwards"
+        index = self.index(xyz)
+        with self._lock: # a background diff and the builder can share a byte
+            if completed:
+                self.completed[index >> 3] |= 1 << (index & 7)
+                self.errors.discard(index)
+            else:
+                self.completed[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def mark_done(self, xyz):
+        index = self.index(xyz)
+        with self._lock:
+            self.completed[index >> 3] |= 1 << (index & 7)
+            self.errors.discard(index)
+            self._done.append(index)
+        self._maybe_flush()
+
+    def mark_error(self, xyz):
+        index = self.index(xyz)
+        with self._lock:
+            self.errors.add(index)
+            self._errors.append(index)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        "Appends the positions completed or failed since the last flush"
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._done and not self._errors:
+                return
+            with open(self.path, "a") as f:
+                if self._done:
+                    f.write(json.dumps({"done": self._done}) + "\n")
+                if self._errors:
+                    f.write(json.dumps({"errors": self._errors}) + "\n")
+            self._done = []
+            self._errors = []
+
+    def save(self):
+        "Rewrites the file as a header and a single snapshot"
+        header = {"hash": self.schematic_hash, "at": self.at, "start": self.start, "size": self.size}
+        with self._lock:
+            snapshot = {"bitmap": base64.b64encode(zlib.compress(bytes(self.completed))).decode(), "error_set": sorted(self.errors)}
+            with open(self.path + ".tmp", "w") as f:
+                f.write(json.dumps(header) + "\n")
+                f.write(json.dumps(snapshot) + "\n")
+            os.replace(self.path + ".tmp", self.path)
+            self._done = []
+            self._errors = []
+            self._last_flush = time.monotonic()
+
+    @classmethod
+    def load(cls, path: str, interval: float = 30):
+        "Reads a checkpoint back, or returns None if there is none"
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return None
+        header = json.loads(lines[0])
+        checkpoint = cls(path, header["hash"], header["at"], header["start"], header["size"], interval)
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break # torn write at the end of the file
+            if "bitmap" in record:
+                checkpoint.completed = bytearray(zlib.decompress(base64.b64decode(record["bitmap"])))
+                checkpoint.errors = set(record["error_set"])
+            for index in record.get("done", ()):
+                checkpoint.completed[index >> 3] |= 1 << (index & 7)
+                checkpoint.errors.discard(index)
+            checkpoint.errors.update(record.get("errors", ()))
+        return checkpoint
+
+    def incomplete_chunks(self) -> set:
+        "Chunk columns (x >> 4, z >> 4) that still have positions which aren't completed"
+        chunks = set()
+        volume = self.size[0] * self.size[1] * self.size[2]
+        for byte_index, byte in enumerate(self.completed):
+            if byte == 0xFF:
+                continue
+            for bit in range(8):
+                index = byte_index * 8 + bit
+                if index < volume and not byte >> bit & 1:
+                    x, _, z = self.position(index)
+                    chunks.add((x >> 4, z >> 4))
+        return chunks
+
+
+def chunk_of(xyz) -> tuple:
+    "The chunk column (x >> 4, z >> 4) of a position"
+    return (xyz[0] >> 4, xyz[2] >> 4)
+
+class BuildPlan:
+    """
+    Shares one build between several bots. The pending positions are grouped into chunk column regions, which get handed out
+    as contiguous runs balanced by how much work is left in them. Bots claim a position before placing it so no block is placed twice,
+    and a bot that runs out of work steals the biggest region from the busiest bot, one nobody started yet if there is any
+    """
+    def __init__(self, at=None):
+        self.at = at
+        self.lock = threading.Lock()
+        self.pending = {} # region -> positions not done yet
+        self.owner = {} # region -> bot name
+        self.started = set() # regions somebody claimed a position in
+        self.claimed = {} # position -> bot name
+        self.done = set()
+        self.bots = []
+
+    def add_positions(self, positions):
+        "Adds positions that need work. Positions that are done already are ignored"
+        with self.lock:
+            for xyz in positions:
+                if xyz not in self.done:
+                    self.pending.setdefault(chunk_of(xyz), set()).add(xyz)
+
+    def join(self, name: str):
+        "Adds a bot to the build and hands out the unstarted regions again"
+        with self.lock:
+            if name not in self.bots:
+                self.bots.append(name)
+            self._rebalance()
+
+    def leave(self, name: str) -> bool:
+        "Removes a bot from the build, its claims and regions go to the others. Returns whether no bot is left"
+        with self.lock:
+            if name in self.bots:
+                self.bots.remove(name)
+            for xyz in [xyz for xyz, owner in self.claimed.items() if owner == name]:
+                del self.claimed[xyz]
+            if self.bots:
+                self._rebalance()
+            return not self.bots
+
+    def _rebalance(self):
+        load = {name: 0 for name in self.bots}
+        free = []
+        # serpentine over the chunk columns so every bot gets one connected area
+        for region in sorted(self.pending, key=lambda r: (r[0], r[1] if r[0] % 2 == 0 else -r[1])):
+            remaining = len(self.pending[region])
+            if not remaining:
+                continue
+            if region in self.started and self.owner.get(region) in load:
+                load[self.owner[region]] += remaining
+            else:
+                free.append(region)
+        target = (sum(load.values()) + sum(len(self.pending[region]) for region in free)) / len(self.bots)
+        index = 0
+        for region in free:
+            while index < len(self.bots) - 1 and load[self.bots[index]] >= target:
+                index += 1
+            self.owner[region] = self.bots[index]
+            load[self.bots[index]] += len(self.pending[region])
+
+    def owns(self, name: str, xyz) -> bool:
+        return self.owner.get(chunk_of(xyz)) == name
+
+    def is_done(self, xyz) -> bool:
+        return xyz in self.done
+
+    def claim(self, name: str, xyz) -> bool:
+        "Reserves a position for a bot. False if it's done or another bot has it"
+        with self.lock:
+            if xyz in self.done or self.claimed.get(xyz, name) != name:
+                return False
+            self.claimed[xyz] = name
+            self.started.add(chunk_of(xyz))
+            return True
+
+    def complete(self, xyz):
+        with self.lock:
+            self.done.add(xyz)
+            self.claimed.pop(xyz, None)
+            self.pending.get(chunk_of(xyz), set()).discard(xyz)
+
+    def release(self, xyz):
+        "Gives up a claim, for example after a failed placement"
+        with self.lock:
+            self.claimed.pop(xyz, None)
+
+    def remaining(self, name: str) -> int:
+        with self.lock:
+            return sum(len(positions) for region, positions in self.pending.items() if self.owner.get(region) == name)
+
+    def steal(self, name: str) -> bool:
+        """
+        Moves the region with the most work left from the busiest other bot to `name`, preferring regions nobody started yet.
+        A started region moves with its unclaimed positions, the positions the victim claimed stay its own until it completes or releases them.
+        The victim always keeps one region so two idle bots don't hand the same region back and forth. Returns whether there was one
+        """
+        with self.lock:
+            loads = {}
+            for region, positions in self.pending.items():
+                if positions:
+                    loads[self.owner.get(region)] = loads.get(self.owner.get(region), 0) + len(positions)
+            for victim in sorted(loads, key=loads.get, reverse=True):
+                if victim == name:
+                    continue
+                regions = [region for region, positions in self.pending.items() if positions and self.owner.get(region) == victim]
+                unclaimed = lambda region: any(xyz not in self.claimed for xyz in self.pending[region])
+                candidates = [region for region in regions if region not in self.started]
+                if not candidates and len(regions) > 1:
+                    candidates = [region for region in regions if unclaimed(region)]
+                if candidates:
+                    self.owner[max(candidates, key=lambda region: len(self.pending[region]))] = name
+                    return True
+            return False
+
+    def progress(self) -> dict:
+        "How many positions are done, and how many each bot has left"
+        with self.lock:
+            remaining = {name: 0 for name in self.bots}
+            for region, positions in self.pending.items():
+                owner = self.owner.get(region)
+                if owner in remaining:
+                    remaining[owner] += len(positions)
+            return {"done": len(self.done), "remaining": remaining}
+
+
+# seconds per action and per block walked, used until the builder measured its own
+DEFAULT_LATENCIES = {"place": 0.25, "dig": 0.4, "walk": 0.23}
+
+def _neighbour(volume: np.ndarray, direction, fill: bool) -> np.ndarray:
+    "`volume` ([y, z, x]) shifted so every cell holds its neighbour in `direction`, `fill` outside the volume"
+    dx, dy, dz = direction
+    shifted = np.full_like(volume, fill)
+    height, length, width = volume.shape
+    ys, yd = (slice(dy, None), slice(None, height - dy)) if dy >= 0 else (slice(None, dy), slice(-dy, None))
+    zs, zd = (slice(dz, None), slice(None, length - dz)) if dz >= 0 else (slice(None, dz), slice(-dz, None))
+    xs, xd = (slice(dx, None), slice(None, width - dx)) if dx >= 0 else (slice(None, dx), slice(-dx, None))
+    shifted[yd, zd, xd] = volume[ys, zs, xs]
+    return shifted
+
+def estimate_path_length(positions: np.ndarray, step: int) -> float:
+    """
+    Rough walking distance to visit `positions` ((n, 3) array of x, y, z): one standpoint per `step` sized cube with work in it,
+    visited layer by layer in a serpentine like the builder goes through them
+    """
+    if len(positions) == 0:
+        return 0.0
+    cells = np.unique(positions // step, axis=0)
+    x, y, z = cells[:, 0], cells[:, 1], cells[:, 2]
+    z_order = np.where(y % 2 == 0, z, -z)
+    x_order = np.where(z % 2 == 0, x, -x)
+    cells = cells[np.lexsort((x_order, z_order, y))]
+    return float(np.linalg.norm(np.diff(cells, axis=0), axis=1).sum() * step)
+
+def estimate_build(wanted: np.ndarray, current: np.ndarray, start, items: dict, face_masks: dict, needs_below: set,
+                   latencies: dict = None, reach: float = 4.5) -> dict:
+    """
+    Dry run of a build without touching the world. `wanted` and `current` are the schematic and the world as state id volumes ([y, z, x]),
+    `current` may be None for an empty area. `items` maps state ids to the item name placing them (None if there is none),
+    `face_masks` to the six faces they can be placed against (see `Build.get_face_mask`).
+
+    Returns a json serializable dict with the bill of materials, the action counts, the placements that can't be done,
+    the walking distance and the estimated time in seconds
+    """
+    latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+    if current is None:
+        current = np.zeros(wanted.shape, dtype=np.int32)
+    different = wanted != current
+    place = different & (wanted != 0)
+    dig = different & (wanted == 0)
+
+    palette, index = np.unique(wanted, return_inverse=True)
+    index = index.reshape(wanted.shape)
+    place_counts = np.bincount(index[place], minlength=len(palette))
+    materials = {}
+    missing = np.zeros(len(palette), dtype=bool)
+    for i, state_id in enumerate(palette.tolist()):
+        if state_id == 0 or place_counts[i] == 0:
+            continue
+        item = items.get(state_id)
+        if item is None:
+            missing[i] = True
+        else:
+            materials[item] = materials.get(item, 0) + int(place_counts[i])
+
+    # once built the volume is exactly the schematic, the ground below it counts as solid
+    solid = wanted != 0
+    masks = np.array([face_masks.get(state_id, [True] * 6) for state_id in palette.tolist()], dtype=bool).reshape(len(palette), 6)
+    supported = np.zeros(wanted.shape, dtype=bool)
+    for face, direction in enumerate(FACE_DIRECTIONS):
+        supported |= masks[index, face] & _neighbour(solid, direction, fill=direction[1] < 0)
+    below = np.isin(palette, list(needs_below))[index]
+    supported = np.where(below, _neighbour(solid, FACE_DIRECTIONS[0], fill=True), supported)
+    infeasible = place & (missing[index] | ~supported)
+
+    places, digs = int(place.sum()), int(dig.sum())
+    y, z, x = np.nonzero(different)
+    positions = np.stack((x + start[0], y + start[1], z + start[2]), axis=1)
+    path_length = estimate_path_length(positions, max(1, int(reach)))
+    seconds = places * latencies["place"] + digs * latencies["dig"] + path_length * latencies["walk"]
+    return {
+        "size": [int(wanted.shape[2]), int(wanted.shape[0]), int(wanted.shape[1])],
+        "materials": dict(sorted(materials.items(), key=lambda item: -item[1])),
+        "place": places,
+        "dig": digs,
+        "infeasible": int(infeasible.sum()),
+        "path_length": round(path_length, 1),
+        "latencies": latencies,
+        "seconds": round(seconds, 1),
+    }
+
+
+class BuildMetrics:
+    """
+    Phase timers and counters of a build. `snapshot()` gives the live numbers, and with a `path` they get appended to it
+    as JSON lines every `interval` seconds. The `bridge_calls` counter is fed by a `BridgeCounter` and reported per block built
+    """
+    def __init__(self, path: str = None, interval: float = 30):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.last_dump = self.started
+        self.phases = {} # phase -> [count, total seconds, max seconds]
+        self.counters = {}
+        self.errors = {} # reason -> count
+
+    @contextlib.contextmanager
+    def timer(self, phase: str):
+        "Times a phase of the builder"
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                stats = self.phases.setdefault(phase, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+    def count(self, counter: str, amount: int = 1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+        self.maybe_dump()
+
+    def error(self, reason: str):
+        with self.lock:
+            self.errors[reason] = self.errors.get(reason, 0) + 1
+            self.counters["failed"] = self.counters.get("failed", 0) + 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            built = self.counters.get("placed", 0) + self.counters.get("dug", 0)
+            return {
+                "time": time.time(),
+                "elapsed": round(elapsed, 3),
+                "blocks_per_minute": round(built / elapsed * 60, 2) if elapsed else 0.0,
+                "bridge_calls_per_block": round(self.counters.get("bridge_calls", 0) / built, 2) if built else None,
+                "counters": dict(self.counters),
+                "errors": dict(self.errors),
+                "phases": {phase: {"count": count, "total": round(total, 3), "mean": round(total / count, 4), "max": round(longest, 4)}
+                           for phase, (count, total, longest) in self.phases.items()},
+            }
+
+    def maybe_dump(self):
+        if self.path and time.monotonic() - self.last_dump >= self.interval:
+            self.dump()
+
+    def dump(self):
+        "Appends a snapshot to `path`"
+        if not self.path:
+            return
+        self.last_dump = time.monotonic()
+        with open(self.path, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+# values that come back through the bridge as python values, everything else is a handle on a JS object
+_PLAIN = (type(None), bool, int, float, str, bytes, list, tuple, dict)
+
+class BridgeCounter:
+    """
+    Wraps an object on the other side of the JS bridge and calls `count()` for every attribute read and call on it, the round trips
+    the bridge makes. Objects that come back are wrapped as well, and wrapped arguments are unwrapped before they go over
+    """
+    __slots__ = ("_target", "_count")
+
+    def __init__(self, target, count):
+        self._target = target
+        self._count = count
+
+    def __getattr__(self, name):
+        self._count()
+        return self._wrap(getattr(self._target, name))
+
+    def __call__(self, *args, **kwargs):
+        self._count()
+        args = [arg._target if isinstance(arg, BridgeCounter) else arg for arg in args]
+        kwargs = {key: value._target if isinstance(value, BridgeCounter) else value for key, value in kwargs.items()}
+        return self._wrap(self._target(*args, **kwargs))
+
+    def _wrap(self, value):
+        return value if isinstance(value, _PLAIN) else BridgeCounter(value, self._count)
@@ -0,0 +1,315 @@
+"""
+Append-only chat log in SQLite (WAL mode). Messages are queued by the chat handler and written in batches by a background thread,
+so logging a line never touches the disk on the event thread. Queries go through their own connection, with an index on
+(sender, time) and a full-text index on the messages. A `Retention` policy keeps the database bounded, see `ChatLog.compact`
+"""
+import dataclasses
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    time REAL NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_sender_time ON messages (sender, time);
+CREATE INDEX IF NOT EXISTS messages_server_time ON messages (server, time);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (time);
+CREATE TABLE IF NOT EXISTS migrations (
+    path TEXT PRIMARY KEY,
+    time REAL NOT NULL
+);
+"""
+
+# external content table, kept in sync with `messages` by triggers
+FULL_TEXT_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5(message, content='messages', content_rowid='id');
+CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+"""
+
+def _timestamp(value):
+    "Unix time from a number or a datetime"
+    return value.timestamp() if hasattr(value, "timestamp") else value
+
+def _match(words: str) -> str:
+    "A full-text query matching every word of `words`, quoted so punctuation can't break the query syntax"
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words.split())
+
+@dataclasses.dataclass
+class Retention:
+    """
+    How much chat `ChatLog` keeps. Limits that are None don't apply. `max_age` is in seconds, `max_rows_per_sender` counts per server,
+    `max_bytes` is the size of the live data in the database. With an `archive_directory` removed messages are appended to gzipped
+    JSONL segments there, one per server and `segment_format` (strftime, UTC) period, instead of being thrown away
+    """
+    max_age: float = None
+    max_rows_per_sender: int = None
+    max_bytes: int = None
+    archive_directory: str = None
+    segment_format: str = "%Y-%m-%d"
+    interval: float = 600 # seconds between compactions
+    batch_size: int = 2000 # rows removed per transaction, so the writer never waits long
+
+class ChatPage(list):
+    "One page of `ChatLog.query` results, newest first. Pass `cursor` back to get the next page, it's None on the last one"
+    cursor: tuple = None
+
+class ChatLog:
+    """
+    Chat messages keyed by server, sender and time. `append` only queues the message, a writer thread commits
+    everything queued every `flush_interval` seconds or once `batch_size` messages are waiting
+    """
+    def __init__(self, path: str = "chatlog.db", batch_size: int = 256, flush_interval: float = 1.0, retention: Retention = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.lock = threading.Lock() # the writing connection, also used by `clear` and migrations
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL") # only takes for new databases, lets `compact` give space back
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.full_text = self.__setup_full_text()
+        self.reader = sqlite3.connect(path, check_same_thread=False) # WAL lets queries run while the writer commits
+        self.reader_lock = threading.Lock()
+        self.closed = False
+        self.writer = threading.Thread(target=self.__write, daemon=True)
+        self.writer.start()
+        self.retention = retention
+        self.stopping = threading.Event()
+        if retention:
+            threading.Thread(target=self.__compact_periodically, daemon=True).start()
+
+    def __setup_full_text(self) -> bool:
+        "Creates the full-text index if it isn't there. Returns False if this sqlite has no FTS5, searches fall back to LIKE then"
+        if self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+            return True
+        try:
+            with self.connection:
+                self.connection.executescript(FULL_TEXT_SCHEMA)
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def append(self, server: str, sender: str, message: str, at: float = None):
+        "Queues a message, `at` defaults to now"
+        self.queue.put((server, sender, time.time() if at is None else at, message))
+
+    def __write(self):
+        "Commits batches from the queue. None stops the writer, an Event gets set once everything before it is written"
+        while True:
+            rows, waiting, stop = [], None, False
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiting = item
+                    break
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if rows:
+                self.__insert(rows)
+            if waiting:
+                waiting.set()
+            if stop:
+                return
+
+    def __insert(self, rows: list):
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany("INSERT INTO messages (server, sender, time, message) VALUES (?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"Could not write {len(rows)} chat messages: {e}")
+
+    def flush(self):
+        "Blocks until everything queued so far is written"
+        if self.closed:
+            return
+        written = threading.Event()
+        self.queue.put(written)
+        written.wait()
+
+    def close(self):
+        "Writes what is left and closes the database"
+        if self.closed:
+            return
+        self.closed = True
+        self.stopping.set()
+        self.queue.put(None)
+        self.writer.join()
+        with self.lock:
+            self.connection.close()
+        with self.reader_lock:
+            self.reader.close()
+
+    def query(self, server: str = None, sender: str = None, since=None, until=None, contains: str = None, limit: int = 100, cursor: tuple = None) -> ChatPage:
+        """
+        Messages as dicts (server, sender, time, message), newest first. Every filter is optional: `since` and `until` are unix times
+        or datetimes, `contains` matches messages with all of its words. Pages are at most `limit` long, continue from the `cursor`
+        of the previous page
+        """
+        conditions, params = [], []
+        if server is not None:
+            conditions.append("server = ?")
+            params.append(server)
+        if sender is not None:
+            conditions.append("sender = ?")
+            params.append(sender)
+        if since is not None:
+            conditions.append("time >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            conditions.append("time < ?")
+            params.append(_timestamp(until))
+        if contains:
+            if self.full_text:
+                conditions.append("id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+                params.append(_match(contains))
+            else:
+                for word in contains.split():
+                    conditions.append("message LIKE ? ESCAPE '\\'")
+                    params.append("%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if cursor is not None:
+            conditions.append("(time, id) < (?, ?)") # keyset pagination, no OFFSET scans
+            params += list(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        self.flush()
+        with self.reader_lock:
+            rows = self.reader.execute(f"SELECT id, server, sender, time, message FROM messages {where} ORDER BY time DESC, id DESC LIMIT ?",
+                                       params + [limit + 1]).fetchall()
+        page = ChatPage(dict(zip(("server", "sender", "time", "message"), row[1:])) for row in rows[:limit])
+        if len(rows) > limit:
+            page.cursor = (rows[limit - 1][3], rows[limit - 1][0])
+        return page
+
+    def clear(self, server: str = None):
+        "Deletes the messages of one server, or everything"
+        self.flush()
+        with self.lock, self.connection:
+            if server is None:
+                self.connection.execute("DELETE FROM messages")
+            else:
+                self.connection.execute("DELETE FROM messages WHERE server = ?", (server,))
+
+    def __compact_periodically(self):
+        while not self.stopping.wait(self.retention.interval):
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                print(f"Could not compact the chat log: {e}")
+
+    def compact(self, now: float = None) -> int:
+        """
+        Removes what the retention policy doesn't keep: messages older than `max_age`, the oldest messages of senders over
+        `max_rows_per_sender`, then the oldest messages overall until the data fits in `max_bytes`. Runs every `retention.interval`
+        seconds in the background. Returns how many messages were removed
+        """
+        retention = self.retention
+        if retention is None or self.closed:
+            return 0
+        now = time.time() if now is None else now
+        removed = 0
+        if retention.max_age is not None:
+            removed += self.__remove_batches("SELECT id FROM messages WHERE time < ? ORDER BY time LIMIT ?", (now - retention.max_age,))
+        if retention.max_rows_per_sender is not None:
+            with self.lock:
+                over = self.connection.execute("SELECT server, sender FROM messages GROUP BY server, sender HAVING COUNT(*) > ?",
+                                               (retention.max_rows_per_sender,)).fetchall()
+            for server, sender in over:
+                removed += self.__remove_batches("SELECT id FROM messages INDEXED BY messages_sender_time WHERE sender = ? AND server = ? ORDER BY time DESC, id DESC LIMIT ? OFFSET ?",
+                                                 (sender, server), keep=retention.max_rows_per_sender)
+        if retention.max_bytes is not None:
+            while self.used_bytes() > retention.max_bytes:
+                removed_now = self.__remove_batches("SELECT id FROM messages ORDER BY time LIMIT ?", (), once=True)
+                removed += removed_now
+                if removed_now == 0:
+                    break
+        if removed:
+            with self.lock:
+                self.connection.executescript("PRAGMA incremental_vacuum;") # executescript steps it to the end, execute frees one page
+                self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def used_bytes(self) -> int:
+        "Bytes of the database holding data, not counting free pages"
+        with self.lock:
+            page_size, = self.connection.execute("PRAGMA page_size").fetchone()
+            pages, = self.connection.execute("PRAGMA page_count").fetchone()
+            free, = self.connection.execute("PRAGMA freelist_count").fetchone()
+        return (pages - free) * page_size
+
+    def __remove_batches(self, select: str, params: tuple, keep: int = None, once: bool = False) -> int:
+        """
+        Archives and deletes the rows `select` picks, `retention.batch_size` at a time. `select` ends in `LIMIT ?`, or `LIMIT ? OFFSET ?` with `keep`
+        """
+        removed = 0
+        while True:
+            limits = (self.retention.batch_size,) if keep is None else (self.retention.batch_size, keep)
+            with self.lock, self.connection:
+                ids = [row[0] for row in self.connection.execute(select, params + limits)]
+                if not ids:
+                    return removed
+                marks = ",".join("?" * len(ids))
+                if self.retention.archive_directory:
+                    self.__archive(self.connection.execute(f"SELECT server, sender, time, message FROM messages WHERE id IN ({marks}) ORDER BY time, id", ids))
+                self.connection.execute(f"DELETE FROM messages WHERE id IN ({marks})", ids)
+            removed += len(ids)
+            if once or len(ids) < self.retention.batch_size:
+                return removed
+
+    def __archive(self, rows):
+        "Appends rows to the gzipped segment of their server and period, every append is its own gzip member"
+        segments = {}
+        for server, sender, at, message in rows:
+            segment = f"{server}-{time.strftime(self.retention.segment_format, time.gmtime(at))}.jsonl.gz"
+            segments.setdefault(segment, []).append(json.dumps({"server": server, "sender": sender, "time": at, "message": message}))
+        os.makedirs(self.retention.archive_directory, exist_ok=True)
+        for segment, lines in segments.items():
+            with gzip.open(os.path.join(self.retention.archive_directory, segment), "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def migrate_tinydb(self, path: str, server: str) -> int:
+        """
+        Imports a `<server>Database.json` file of the old TinyDB chat logging, once. The old files have no timestamps,
+        so the messages get the time the file was last written, in their original order. Returns how many messages were imported
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            if self.connection.execute("SELECT 1 FROM migrations WHERE path = ?", (path,)).fetchone():
+                return 0
+        with open(path) as f:
+            data = json.load(f)
+        at = os.path.getmtime(path)
+        rows = []
+        for table in data.values():
+            for document in table.values():
+                sender = document.get("username") or "unknown"
+                rows += [(server, sender, at, f"{message}") for message in document.get("messages", [])]
+        self.flush()
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT INTO messages (server, sender, time, message) VALUES (?, ?, ?, ?)", rows)
+            self.connection.execute("INSERT INTO migrations (path, time) VALUES (?, ?)", (path, time.time()))
+        return len(rows)
@@ -0,0 +1,186 @@
+"""
+Chat command dispatching. Command names (one or more words, plus aliases) go in a trie of words, so the longest registered
+name that starts a message wins and the rest of the message becomes its arguments. Commands can be rate limited per sender
+and globally, and cache their results for a while
+"""
+import collections
+import dataclasses
+import time
+from typing import Callable
+
+class ArgumentError(ValueError):
+    "The arguments of a command didn't parse, the message is the usage"
+
+def parse_bool(text: str) -> bool:
+    lowered = text.lower()
+    if lowered in ("true", "yes", "on", "1"):
+        return True
+    if lowered in ("false", "no", "off", "0"):
+        return False
+    raise ValueError(f"not a boolean: {text}")
+
+# parsers for builtin types whose constructor doesn't parse text the way chat means it
+PARSERS = {bool: parse_bool}
+
+class RateLimit:
+    """
+    Token buckets allowing `rate` calls per second with bursts of up to `burst`, one per key (the sender) or a single one for key None.
+    Only the `max_keys` most recently seen keys are remembered
+    """
+    def __init__(self, rate: float, burst: int = 1, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = collections.OrderedDict() # key -> [tokens, last refill]
+
+    def allow(self, key=None, now: float = None) -> bool:
+        "Takes a token for `key`, returns False if there was none"
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(self.burst), now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+class ResultCache:
+    "Results by key for `ttl` seconds, at most `max_size` of them"
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = collections.OrderedDict() # key -> (expires, result)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        "The cached result, or None"
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, result):
+        self.entries[key] = (time.monotonic() + self.ttl, result)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+@dataclasses.dataclass
+class Command:
+    """
+    A registered command. `sender` None means anyone can use it. `arguments` are parsers (types like int or any callable taking
+    the word) applied to the words after the name, a `str` at the end takes the rest of the message. Without `arguments`
+    the callback gets the words as they are. Uses over `sender_limit` or `global_limit` are dropped, see `admit`
+    """
+    name: str
+    callback: Callable
+    sender: str = None
+    arguments: tuple = None
+    aliases: tuple = ()
+    sender_limit: RateLimit = None
+    global_limit: RateLimit = None
+    limited: int = 0 # uses dropped by the rate limits
+
+    def allows(self, sender: str) -> bool:
+        return self.sender is None or self.sender == sender
+
+    def admit(self, sender: str) -> bool:
+        "Whether the rate limits let `sender` use the command now. Checked before parsing, so floods stay cheap"
+        if (self.sender_limit and not self.sender_limit.allow(sender)) or (self.global_limit and not self.global_limit.allow()):
+            self.limited += 1
+            return False
+        return True
+
+    @property
+    def usage(self) -> str:
+        names = " ".join(f"<{getattr(parser, '__name__', 'value')}>" for parser in self.arguments or ())
+        return f"{self.name} {names}".strip()
+
+    def parse(self, words: list) -> list:
+        "The arguments from the words after the name, raises `ArgumentError` with the usage if they don't fit"
+        if self.arguments is None:
+            return words
+        parsers = self.arguments
+        greedy = bool(parsers) and parsers[-1] is str
+        if len(words) < len(parsers) or (len(words) > len(parsers) and not greedy):
+            raise ArgumentError(f"Usage: {self.usage}")
+        if greedy and len(words) > len(parsers):
+            words = words[:len(parsers) - 1] + [" ".join(words[len(parsers) - 1:])]
+        try:
+            return [PARSERS.get(parser, parser)(word) for parser, word in zip(parsers, words)]
+        except (TypeError, ValueError) as e:
+            raise ArgumentError(f"Usage: {self.usage} ({e})")
+
+class CommandDispatcher:
+    """
+    Finds the command a chat message calls. Messages not starting with `prefix` are rejected with a single `startswith`,
+    before anything is split or allocated
+    """
+    def __init__(self, prefix: str = "!"):
+        self.prefix = prefix
+        self.root = {} # word -> (command or None, children)
+        self.commands = {}
+
+    def register(self, command: Command):
+        "Adds a command under its name and aliases. Registering a name or alias again replaces what was there"
+        self.unregister(command.name)
+        self.commands[command.name] = command
+        for name in (command.name, *command.aliases):
+            self.__node(name.split(), create=True)[0] = command
+
+    def unregister(self, name: str):
+        command = self.commands.pop(name, None)
+        if command is None:
+            return
+        for alias in (command.name, *command.aliases):
+            node = self.__node(alias.split())
+            if node is not None and node[0] is command:
+                node[0] = None
+
+    def __node(self, words: list, create: bool = False):
+        children = self.root
+        node = None
+        for word in words:
+            node = children.get(word)
+            if node is None:
+                if not create:
+                    return None
+                node = children[word] = [None, {}]
+            children = node[1]
+        return node
+
+    def match(self, message: str):
+        """
+        The command a message calls, with the words after its name: (command, words), or None if it isn't one.
+        The longest registered name wins, so `region add` beats `region` for "!region add spawn"
+        """
+        if not message.startswith(self.prefix):
+            return None
+        words = message[len(self.prefix):].split()
+        found, used = None, 0
+        children = self.root
+        for i, word in enumerate(words):
+            node = children.get(word)
+            if node is None:
+                break
+            if node[0] is not None:
+                found, used = node[0], i + 1
+            children = node[1]
+        if found is None:
+            return None
+        return found, words[used:]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.commands
+
+    def __len__(self) -> int:
+        return len(self.commands)
@@ -0,0 +1,128 @@
+"""
+Runs event and command handlers off the bridge's callback thread. Every handler gets its own bounded queue and workers,
+so a slow handler only delays itself and never the keepalives or other events
+"""
+import queue
+import threading
+import time
+
+# no process pool: handlers get javascript proxies (the bot, entities, `CommandContext`), which can't be pickled
+EXECUTORS = ("inline", "thread")
+POLICIES = ("block", "drop_oldest", "reject")
+
+class HandlerExecutor:
+    """
+    Calls `function` for every `submit`. `inline` calls it right away on the calling thread, `thread` hands the call to `workers`
+    threads. At most `max_queue` calls wait, when it's full `policy` decides: `drop_oldest` (the default) throws the longest waiting call away,
+    `reject` throws the new one away and `block` waits for room, which stalls the bridge's callback thread when the call comes from there
+    """
+    def __init__(self, function, executor: str = "thread", max_queue: int = 100, policy: str = "drop_oldest", workers: int = 1, name: str = None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}, use one of {', '.join(EXECUTORS)}")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy!r}, use one of {', '.join(POLICIES)}")
+        self.function = function
+        self.executor = executor
+        self.policy = policy
+        self.name = name or getattr(function, "__name__", "handler")
+        self.lock = threading.Lock()
+        self.counters = {"submitted": 0, "completed": 0, "dropped": 0, "rejected": 0, "errors": 0}
+        self.waited = [0.0, 0.0] # total and max seconds between submit and start
+        self.ran = [0.0, 0.0] # total and max seconds running
+        self.max_depth = 0
+        self.queue = queue.Queue(max_queue) if executor != "inline" else None
+        self.workers = [threading.Thread(target=self.__work, name=f"{self.name}-{i}", daemon=True) for i in range(workers if self.queue else 0)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, *args, **kwargs) -> bool:
+        "Queues a call, or makes it when inline. Returns False if it was rejected"
+        self.__count("submitted")
+        item = (time.perf_counter(), args, kwargs)
+        if self.queue is None:
+            self.__run(item)
+            return True
+        if self.policy == "block":
+            self.queue.put(item)
+        elif self.policy == "reject":
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.__count("rejected")
+                return False
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.queue.task_done()
+                        self.__count("dropped")
+                    except queue.Empty:
+                        pass
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    __call__ = submit
+
+    def __work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            self.__run(item)
+            self.queue.task_done()
+
+    def __run(self, item):
+        submitted, args, kwargs = item
+        started = time.perf_counter()
+        try:
+            self.function(*args, **kwargs)
+        except Exception as e:
+            self.__count("errors")
+            print(f"Handler {self.name} failed: {e}")
+        else:
+            self.__count("completed")
+        finished = time.perf_counter()
+        with self.lock:
+            for totals, seconds in ((self.waited, started - submitted), (self.ran, finished - started)):
+                totals[0] += seconds
+                totals[1] = max(totals[1], seconds)
+
+    def __count(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def join(self):
+        "Waits until every queued call ran"
+        if self.queue is not None:
+            self.queue.join()
+
+    def close(self):
+        "Lets the queued calls finish and stops the workers"
+        if self.queue is None:
+            return
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def snapshot(self) -> dict:
+        "Queue depth, counters and latencies in milliseconds"
+        with self.lock:
+            done = self.counters["completed"] + self.counters["errors"]
+            return {
+                "executor": self.executor,
+                "queued": self.queue.qsize() if self.queue is not None else 0,
+                "max_queued": self.max_depth,
+                **self.counters,
+                "wait_ms_avg": round(self.waited[0] / done * 1000, 3) if done else 0.0,
+                "wait_ms_max": round(self.waited[1] * 1000, 3),
+                "run_ms_avg": round(self.ran[0] / done * 1000, 3) if done else 0.0,
+                "run_ms_max": round(self.ran[1] * 1000, 3),
+            }
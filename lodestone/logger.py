@@ -1,11 +1,367 @@
+import atexit
+import collections
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
 import structlog
 
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="%H:%M:%S"),
-        structlog.processors.add_log_level,
-        structlog.dev.ConsoleRenderer(),
-    ]
-)
+try:
+    from webhook import webhook_dispatcher
+except ImportError:
+    from .webhook import webhook_dispatcher
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "critical": 50}
+
+# `skip` has the names of sinks the record shouldn't go to, like ("webhook",) for console only messages.
+# `source` is who logged it, like a bot's username, for sinks that only take one bot's logs
+LogRecord = collections.namedtuple("LogRecord", "time level category message fields skip source")
+
+def render_console(record: LogRecord, renderer=None) -> str:
+    "structlog's console format"
+    event = {"timestamp": datetime.datetime.fromtimestamp(record.time).strftime("%H:%M:%S"), "level": record.level, "event": record.message}
+    if record.category != "general":
+        event["category"] = record.category
+    return (renderer or structlog.dev.ConsoleRenderer())(None, record.level, {**event, **record.fields})
+
+def render_json(record: LogRecord) -> str:
+    "One JSON object"
+    source = {"source": record.source} if record.source is not None else {}
+    return json.dumps({"time": record.time, "level": record.level, "category": record.category, **source, "event": f"{record.message}", **record.fields},
+                      default=str)
+
+class LogSink:
+    """
+    Somewhere log records end up. Every sink has its own queue of at most `max_queue` records and its own thread calling
+    `write` with up to `batch_size` records at a time, so a slow sink only ever drops its own oldest records and never holds
+    up the bot or the other sinks. Only records of at least `level` and (if given) in `categories` and from `sources` are taken.
+    Subclasses implement `write`
+    """
+    name = "sink"
+
+    def __init__(self, level: str = "debug", categories: tuple = None, batch_size: int = 100, max_queue: int = 10000, name: str = None,
+                 sources: tuple = None):
+        self.level = LEVELS[level]
+        self.categories = set(categories) if categories is not None else None
+        self.sources = set(sources) if sources is not None else None
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.name = name or self.name
+        self.records = collections.deque()
+        self.condition = threading.Condition()
+        self.writing = False
+        self.closed = False
+        self.counters = {"written": 0, "dropped": 0, "batches": 0, "errors": 0}
+        self.writer = threading.Thread(target=self.__run, name=f"log sink {self.name}", daemon=True)
+        self.writer.start()
+
+    def accepts(self, record: LogRecord) -> bool:
+        return (LEVELS[record.level] >= self.level and (self.categories is None or record.category in self.categories)
+                and (self.sources is None or record.source in self.sources) and self.name not in record.skip)
+
+    def offer(self, records: list):
+        "Queues the records this sink accepts without waiting, dropping the oldest ones over `max_queue`"
+        records = [record for record in records if self.accepts(record)]
+        if not records:
+            return
+        with self.condition:
+            self.records.extend(records)
+            overflow = len(self.records) - self.max_queue
+            for _ in range(max(overflow, 0)):
+                self.records.popleft()
+            if overflow > 0:
+                self.counters["dropped"] += overflow
+            self.condition.notify_all()
+
+    def write(self, records: list):
+        "Writes a batch of records"
+        raise NotImplementedError
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while not self.records and not self.closed:
+                    self.condition.wait()
+                if not self.records:
+                    return
+                batch = [self.records.popleft() for _ in range(min(self.batch_size, len(self.records)))]
+                self.writing = True
+            try:
+                self.write(batch)
+                counter = "written"
+            except Exception as e:
+                print(f"Log sink {self.name} could not write {len(batch)} records: {e}")
+                counter = "errors"
+            with self.condition:
+                self.counters[counter] += len(batch)
+                self.counters["batches"] += 1
+                self.writing = False
+                self.condition.notify_all()
+
+    def join(self, timeout: float = None) -> bool:
+        "Waits until everything queued is written. Returns False on timeout"
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.records and not self.writing, timeout)
+
+    def close(self, timeout: float = 5):
+        "Writes what is queued (waiting at most `timeout` seconds) and stops the thread"
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.writer.join(timeout)
+
+    def snapshot(self) -> dict:
+        with self.condition:
+            return {"waiting": len(self.records), **self.counters}
+
+class StreamSink(LogSink):
+    "Writes to a stream, stdout by default, with structlog's console format or one JSON object per line (`renderer=\"json\"`)"
+    name = "stdout"
+
+    def __init__(self, renderer: str = "console", stream=sys.stdout, **options):
+        if renderer not in ("console", "json"):
+            raise ValueError(f"Unknown renderer {renderer!r}, use console or json")
+        self.renderer = renderer
+        self.stream = stream
+        self.console_renderer = structlog.dev.ConsoleRenderer()
+        super().__init__(**options)
+
+    def write(self, records: list):
+        if self.renderer == "json":
+            lines = [render_json(record) for record in records]
+        else:
+            lines = [render_console(record, self.console_renderer) for record in records]
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except ValueError:
+            pass # the stream is closed, at exit
+
+class JsonlSink(LogSink):
+    """
+    Appends one JSON object per record to `path`. Once the file would grow past `max_bytes` it's rotated like logging's
+    RotatingFileHandler: path becomes path.1, path.1 becomes path.2 and so on, keeping `backups` old files
+    """
+    name = "jsonl"
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5, **options):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, "a", encoding="utf-8")
+        super().__init__(**options)
+
+    def write(self, records: list):
+        text = "".join(render_json(record) + "\n" for record in records)
+        if self.max_bytes and self.file.tell() and self.file.tell() + len(text.encode()) > self.max_bytes:
+            self.rotate()
+        self.file.write(text)
+        self.file.flush()
+
+    def rotate(self):
+        self.file.close()
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{number}"):
+                os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self, timeout: float = 5):
+        super().close(timeout)
+        self.file.close()
+
+class WebhookSink(LogSink):
+    """
+    Posts records to a Discord webhook as embeds, colored by level, up to 10 per request, through the shared
+    `webhook.WebhookDispatcher`. `thread_name` (a string, or a function returning one like the date) posts into a forum
+    thread, `footer` is an embed footer dict ({"text", "icon_url"}). An `image_url` field becomes the thumbnail.
+    Takes info and up by default
+    """
+    name = "webhook"
+    colors = {"error": 0x992d22, "critical": 0x992d22, "warning": 0xe67e22}
+
+    def __init__(self, url: str, username: str = "Lodestone", avatar_url: str = "https://github.com/SilkePilon/Lodestone/blob/main/chestlogo.png?raw=true",
+                 thread_name=None, footer: dict = None, level: str = "info", **options):
+        self.url = url
+        self.username = username
+        self.avatar_url = avatar_url
+        self.thread_name = thread_name
+        self.footer = footer or {"text": "\u200b", "icon_url": avatar_url}
+        super().__init__(level=level, **options)
+
+    def embed(self, record: LogRecord) -> dict:
+        color = 0x2ecc71 if record.category == "chat" and record.level == "info" else self.colors.get(record.level, 0x3498db)
+        embed = {
+            "description": f"**{record.message}**",
+            "color": color,
+            "timestamp": datetime.datetime.fromtimestamp(record.time, datetime.timezone.utc).isoformat(),
+            "footer": self.footer,
+        }
+        if record.fields.get("image_url"):
+            embed["thumbnail"] = {"url": record.fields["image_url"]}
+        return embed
+
+    def write(self, records: list):
+        thread_name = self.thread_name() if callable(self.thread_name) else self.thread_name
+        dispatcher = webhook_dispatcher()
+        for start in range(0, len(records), 10):
+            dispatcher.send(self.url, embeds=[self.embed(record) for record in records[start:start + 10]], username=self.username,
+                            avatar_url=self.avatar_url, thread_name=thread_name)
+
+def daily_thread() -> str:
+    "Today's date, as forum thread name for `WebhookSink`"
+    return f"{datetime.date.today()}"
+
+class LogPipeline:
+    """
+    Logging off the hot path. `log` only filters and queues, a background thread hands what is queued to the sinks
+    (`LogSink`), which batch and write on their own threads. By default there is one `StreamSink` to stdout.
+    `levels` sets the minimum level per category, `sample` keeps only every nth message of a category, for chatty ones like
+    "emit". When `max_queue` messages are waiting new ones are dropped instead of blocking
+    """
+    def __init__(self, level: str = "info", renderer: str = "console", stream=sys.stdout, path: str = None, levels: dict = None,
+                 sample: dict = None, max_queue: int = 10000, sinks: list = None):
+        self.queue = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.counters = {"queued": 0, "dropped": 0, "filtered": 0, "sampled": 0}
+        self.seen = {} # category -> messages that passed the level filter, for sampling
+        self.sinks = list(sinks) if sinks is not None else [StreamSink(renderer, stream)]
+        self.file_sink = None # the one `configure(path=...)` added
+        self.configure(level=level, path=path, levels=levels or {}, sample={"emit": 100, **(sample or {})})
+        self.distributor = threading.Thread(target=self.__distribute, name="logs", daemon=True)
+        self.distributor.start()
+        atexit.register(self.flush, 2)
+
+    def configure(self, *, level: str = None, renderer: str = None, stream=None, path: str = None, levels: dict = None, sample: dict = None):
+        """
+        Changes the options given, see the class. `renderer` and `stream` apply to the stream sinks, `path` replaces the
+        JSONL file sink. Levels and samples are merged into the current ones
+        """
+        with self.lock:
+            if level is not None:
+                self.level = LEVELS[level]
+            if renderer is not None:
+                if renderer not in ("console", "json"):
+                    raise ValueError(f"Unknown renderer {renderer!r}, use console or json")
+                for sink in self.sinks:
+                    if isinstance(sink, StreamSink):
+                        sink.renderer = renderer
+            if stream is not None:
+                for sink in self.sinks:
+                    if isinstance(sink, StreamSink):
+                        sink.stream = stream
+            if levels is not None:
+                self.levels = {**getattr(self, "levels", {}), **{category: LEVELS[name] for category, name in levels.items()}}
+            if sample is not None:
+                self.sample = {**getattr(self, "sample", {}), **sample}
+        if path is not None:
+            if self.file_sink:
+                self.remove_sink(self.file_sink)
+            self.file_sink = self.add_sink(JsonlSink(path))
+
+    def add_sink(self, sink: LogSink) -> LogSink:
+        with self.lock:
+            self.sinks = [*self.sinks, sink]
+        return sink
+
+    def remove_sink(self, sink: LogSink, timeout: float = 5):
+        "Stops sending records to the sink and closes it once it wrote what it has"
+        with self.lock:
+            self.sinks = [other for other in self.sinks if other is not sink]
+        sink.close(timeout)
+
+    def enabled(self, level: str, category: str = "general") -> bool:
+        return LEVELS[level] >= self.levels.get(category, self.level)
+
+    def log(self, level: str, message, category: str = "general", skip: tuple = (), source: str = None, **fields) -> bool:
+        """
+        Queues a message without waiting. Returns whether it was queued (not filtered, sampled out or dropped).
+        `skip` names sinks it shouldn't go to, `source` is who logs it (see `LogRecord`)
+        """
+        with self.lock:
+            if LEVELS[level] < self.levels.get(category, self.level):
+                self.counters["filtered"] += 1
+                return False
+            every = self.sample.get(category)
+            if every and every > 1:
+                seen = self.seen.get(category, 0)
+                self.seen[category] = seen + 1
+                if seen % every:
+                    self.counters["sampled"] += 1
+                    return False
+            try: # never waits, so it's fine under the lock
+                self.queue.put_nowait(LogRecord(time.time(), level, category, message, fields, skip, source))
+            except queue.Full:
+                self.counters["dropped"] += 1
+                return False
+            self.counters["queued"] += 1
+            return True
+
+    def __distribute(self):
+        while True:
+            items = [self.queue.get()]
+            while True: # everything waiting goes to the sinks at once
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in items if isinstance(item, LogRecord)]
+            sinks = self.sinks
+            for sink in sinks:
+                sink.offer(records)
+            for item in items:
+                if isinstance(item, tuple) and not isinstance(item, LogRecord): # (flushed event, timeout) from `flush`
+                    flushed, deadline = item
+                    for sink in sinks:
+                        sink.join(max(deadline - time.monotonic(), 0) if deadline else None)
+                    flushed.set()
+
+    def flush(self, timeout: float = None) -> bool:
+        "Waits until every sink wrote everything queued so far. Returns False on timeout"
+        flushed = threading.Event()
+        self.queue.put((flushed, time.monotonic() + timeout if timeout is not None else None))
+        return flushed.wait(timeout)
+
+    def snapshot(self) -> dict:
+        "Pipeline counters, plus queue depth and counters of every sink by name"
+        return {"waiting": self.queue.qsize(), **self.counters, "sinks": {sink.name: sink.snapshot() for sink in self.sinks}}
+
+class Logger:
+    "The structlog style front of a `LogPipeline`, messages go to `category` and come from `source`"
+    def __init__(self, pipeline: LogPipeline, category: str = "general", source: str = None):
+        self.pipeline = pipeline
+        self.category = category
+        self.source = source
+
+    def bind(self, category: str = None, source: str = None) -> 'Logger':
+        return Logger(self.pipeline, category or self.category, source or self.source)
+
+    def log(self, level: str, message, category: str = None, skip: tuple = (), **fields):
+        return self.pipeline.log(level, message, category or self.category, skip, self.source, **fields)
+
+    def debug(self, message, category: str = None, skip: tuple = (), **fields):
+        return self.pipeline.log("debug", message, category or self.category, skip, self.source, **fields)
+
+    def info(self, message, category: str = None, skip: tuple = (), **fields):
+        return self.pipeline.log("info", message, category or self.category, skip, self.source, **fields)
+
+    def warning(self, message, category: str = None, skip: tuple = (), **fields):
+        return self.pipeline.log("warning", message, category or self.category, skip, self.source, **fields)
+
+    warn = warning
+
+    def error(self, message, category: str = None, skip: tuple = (), **fields):
+        return self.pipeline.log("error", message, category or self.category, skip, self.source, **fields)
+
+    def critical(self, message, category: str = None, skip: tuple = (), **fields):
+        return self.pipeline.log("critical", message, category or self.category, skip, self.source, **fields)
 
-logger = structlog.getLogger(__name__)
+pipeline = LogPipeline()
+logger = Logger(pipeline)
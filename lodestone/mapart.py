@@ -0,0 +1,225 @@
+import functools
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+try:
+    from schematics import Schematic
+except ImportError:
+    from .schematics import Schematic
+
+MAP_SIZE = 128
+
+# map base colors: (rgb, block that shows it, first version with the block)
+BASE_COLORS = [
+    ((127, 178, 56), "minecraft:grass_block", (1, 13)),
+    ((247, 233, 163), "minecraft:sandstone", (1, 13)),
+    ((199, 199, 199), "minecraft:mushroom_stem", (1, 13)),
+    ((255, 0, 0), "minecraft:redstone_block", (1, 13)),
+    ((160, 160, 255), "minecraft:packed_ice", (1, 13)),
+    ((167, 167, 167), "minecraft:iron_block", (1, 13)),
+    ((0, 124, 0), "minecraft:oak_leaves[persistent=true]", (1, 13)),
+    ((255, 255, 255), "minecraft:snow_block", (1, 13)),
+    ((164, 168, 184), "minecraft:clay", (1, 13)),
+    ((151, 109, 77), "minecraft:dirt", (1, 13)),
+    ((112, 112, 112), "minecraft:cobblestone", (1, 13)),
+    ((143, 119, 72), "minecraft:oak_planks", (1, 13)),
+    ((255, 252, 245), "minecraft:quartz_block", (1, 13)),
+    ((216, 127, 51), "minecraft:orange_wool", (1, 13)),
+    ((178, 76, 216), "minecraft:magenta_wool", (1, 13)),
+    ((102, 153, 216), "minecraft:light_blue_wool", (1, 13)),
+    ((229, 229, 51), "minecraft:yellow_wool", (1, 13)),
+    ((127, 204, 25), "minecraft:lime_wool", (1, 13)),
+    ((242, 127, 165), "minecraft:pink_wool", (1, 13)),
+    ((76, 76, 76), "minecraft:gray_wool", (1, 13)),
+    ((153, 153, 153), "minecraft:light_gray_wool", (1, 13)),
+    ((76, 127, 153), "minecraft:cyan_wool", (1, 13)),
+    ((127, 63, 178), "minecraft:purple_wool", (1, 13)),
+    ((51, 76, 178), "minecraft:blue_wool", (1, 13)),
+    ((102, 76, 51), "minecraft:brown_wool", (1, 13)),
+    ((102, 127, 51), "minecraft:green_wool", (1, 13)),
+    ((153, 51, 51), "minecraft:red_wool", (1, 13)),
+    ((25, 25, 25), "minecraft:black_wool", (1, 13)),
+    ((250, 238, 77), "minecraft:gold_block", (1, 13)),
+    ((92, 219, 213), "minecraft:diamond_block", (1, 13)),
+    ((74, 128, 255), "minecraft:lapis_block", (1, 13)),
+    ((0, 217, 58), "minecraft:emerald_block", (1, 13)),
+    ((129, 86, 49), "minecraft:spruce_planks", (1, 13)),
+    ((112, 2, 0), "minecraft:netherrack", (1, 13)),
+    ((209, 177, 161), "minecraft:white_terracotta", (1, 13)),
+    ((159, 82, 36), "minecraft:orange_terracotta", (1, 13)),
+    ((149, 87, 108), "minecraft:magenta_terracotta", (1, 13)),
+    ((112, 108, 138), "minecraft:light_blue_terracotta", (1, 13)),
+    ((186, 133, 36), "minecraft:yellow_terracotta", (1, 13)),
+    ((103, 117, 53), "minecraft:lime_terracotta", (1, 13)),
+    ((160, 77, 78), "minecraft:pink_terracotta", (1, 13)),
+    ((57, 41, 35), "minecraft:gray_terracotta", (1, 13)),
+    ((135, 107, 98), "minecraft:light_gray_terracotta", (1, 13)),
+    ((87, 92, 92), "minecraft:cyan_terracotta", (1, 13)),
+    ((122, 73, 88), "minecraft:purple_terracotta", (1, 13)),
+    ((76, 62, 92), "minecraft:blue_terracotta", (1, 13)),
+    ((76, 50, 35), "minecraft:brown_terracotta", (1, 13)),
+    ((76, 82, 42), "minecraft:green_terracotta", (1, 13)),
+    ((142, 60, 46), "minecraft:red_terracotta", (1, 13)),
+    ((37, 22, 16), "minecraft:black_terracotta", (1, 13)),
+    ((189, 48, 49), "minecraft:crimson_nylium", (1, 16)),
+    ((148, 63, 97), "minecraft:crimson_planks", (1, 16)),
+    ((92, 25, 29), "minecraft:crimson_hyphae[axis=y]", (1, 16)),
+    ((22, 126, 134), "minecraft:warped_nylium", (1, 16)),
+    ((58, 142, 140), "minecraft:warped_planks", (1, 16)),
+    ((86, 44, 62), "minecraft:warped_hyphae[axis=y]", (1, 16)),
+    ((20, 180, 133), "minecraft:warped_wart_block", (1, 16)),
+    ((100, 100, 100), "minecraft:cobbled_deepslate", (1, 17)),
+    ((216, 175, 147), "minecraft:raw_iron_block", (1, 17)),
+]
+
+# brightness of a block lower than, level with and higher than the block north of it
+SHADES = (180, 220, 255)
+FLAT_SHADE = 1
+
+BAYER_4 = np.array([[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]) / 16 - 0.5
+
+def parse_version(version: str) -> tuple:
+    return tuple(int(part) for part in version.split(".")[:2])
+
+@functools.lru_cache(maxsize=None)
+def map_palette(version: str, staircase: bool = False) -> tuple:
+    """
+    The map colors that can be built in a version, as (colors, base color index, shade index) arrays.
+    Flat map art only gets the middle shade, staircased map art all three
+    """
+    major = parse_version(version)
+    if major < (1, 13):
+        raise ValueError(f"Map art needs 1.13 or newer, got {version}")
+    shades = range(len(SHADES)) if staircase else (FLAT_SHADE,)
+    colors, bases, levels = [], [], []
+    for base, (rgb, _, since) in enumerate(BASE_COLORS):
+        if since > major:
+            continue
+        for shade in shades:
+            colors.append([channel * SHADES[shade] // 255 for channel in rgb])
+            bases.append(base)
+            levels.append(shade)
+    return np.array(colors, dtype=np.float32), np.array(bases), np.array(levels)
+
+@functools.lru_cache(maxsize=None)
+def palette_tree(version: str, staircase: bool = False):
+    "KD-tree over the map palette of a version, or None without scipy"
+    if cKDTree is None:
+        return None
+    return cKDTree(map_palette(version, staircase)[0])
+
+@functools.lru_cache(maxsize=None)
+def palette_spread(version: str, staircase: bool = False) -> float:
+    "Average distance from a map color to the closest other one"
+    colors = map_palette(version, staircase)[0]
+    distances = np.linalg.norm(colors[:, None, :] - colors[None, :, :], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    return float(distances.min(axis=1).mean())
+
+def nearest_colors(pixels: np.ndarray, version: str, staircase: bool = False) -> np.ndarray:
+    "Index into `map_palette` of the closest map color for every rgb row of `pixels`"
+    tree = palette_tree(version, staircase)
+    if tree is not None:
+        return tree.query(pixels)[1]
+    colors = map_palette(version, staircase)[0]
+    norms = (colors ** 2).sum(axis=1)
+    nearest = np.empty(len(pixels), dtype=np.intp)
+    for start in range(0, len(pixels), 65536): # keeps the distance matrix small
+        # |p - c|^2 without the |p|^2 that is the same for every color, as one matrix product
+        nearest[start:start + 65536] = (norms - 2 * pixels[start:start + 65536] @ colors.T).argmin(axis=1)
+    return nearest
+
+def load_image(image, maps=(1, 1)) -> np.ndarray:
+    "An image file (needs Pillow), PIL image or rgb array, resized to `maps` (wide, high) maps of 128x128, as a float array [z, x, rgb]"
+    width, height = maps[0] * MAP_SIZE, maps[1] * MAP_SIZE
+    if isinstance(image, np.ndarray):
+        pixels = image[..., :3].astype(np.float32)
+        if pixels.shape[:2] != (height, width):
+            raise ValueError(f"Expected a {width}x{height} image, got {pixels.shape[1]}x{pixels.shape[0]}")
+        return pixels
+    if Image is None:
+        raise ImportError("Loading images needs Pillow, install it with `pip install pillow`")
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    return np.asarray(image.convert("RGB").resize((width, height), Image.LANCZOS), dtype=np.float32)
+
+def quantize(pixels: np.ndarray, version: str, dither: float = 0.0, staircase: bool = False) -> np.ndarray:
+    """
+    Maps every pixel of an rgb array [z, x, rgb] to the index of its closest map color.
+    `dither` is the strength of ordered dithering, relative to the distance between neighbouring map colors.
+    Each distinct color is only looked up once
+    """
+    if dither:
+        height, width = pixels.shape[:2]
+        threshold = np.tile(BAYER_4, (height // 4 + 1, width // 4 + 1))[:height, :width]
+        pixels = pixels + threshold[..., None] * palette_spread(version, staircase) * dither
+    pixels = np.clip(np.rint(pixels), 0, 255).astype(np.uint32)
+    packed = pixels[..., 0] << 16 | pixels[..., 1] << 8 | pixels[..., 2]
+    unique, inverse = np.unique(packed.ravel(), return_inverse=True)
+    rgb = np.stack((unique >> 16, unique >> 8 & 0xFF, unique & 0xFF), axis=1).astype(np.float32)
+    return nearest_colors(rgb, version, staircase)[inverse].reshape(packed.shape)
+
+def staircase_heights(shades: np.ndarray) -> tuple:
+    """
+    Block heights [z, x] that give every block its shade, and the heights [x] of the reference row north of the image.
+    A block only has to be lower, level with or higher than the one north of it, so every run is kept as low as it goes
+    (the lowest heights meeting all the steps, from a pass down and a pass up each column)
+    """
+    steps = shades.astype(np.int32) - FLAT_SHADE # -1 lower, 0 level, 1 higher than the block north of it
+    length, width = steps.shape
+    down = np.zeros((length + 1, width), dtype=np.int32) # row 0 is the reference row
+    for z in range(length):
+        down[z + 1] = np.where(steps[z] > 0, down[z] + 1, np.where(steps[z] == 0, down[z], 0))
+    up = np.zeros((length + 1, width), dtype=np.int32)
+    for z in range(length - 1, -1, -1):
+        up[z] = np.where(steps[z] < 0, up[z + 1] + 1, np.where(steps[z] == 0, up[z + 1], 0))
+    heights = np.maximum(down, up)
+    return heights[1:], heights[0]
+
+def image_to_schematic(image, version: str, maps=(1, 1), dither: float = 0.0, staircase: bool = False,
+                       base: str = "minecraft:cobblestone", max_height: int = 384) -> Schematic:
+    """
+    Turns an image into a map art schematic of `maps` (wide, high) maps for a version.
+    North of the image is a row of `base` blocks that the top row is shaded against. Staircased map art puts `base` under
+    every block that would float otherwise, and raises a ValueError if it gets higher than `max_height`
+    """
+    pixels = load_image(image, maps)
+    nearest = quantize(pixels, version, dither, staircase)
+    _, bases, levels = map_palette(version, staircase)
+    base_colors = bases[nearest]
+    length, width = base_colors.shape
+
+    # air, the base block and the colors that are used
+    used = np.unique(base_colors)
+    palette = ["minecraft:air", base] + [BASE_COLORS[color][1] for color in used.tolist()]
+    remap = np.zeros(len(BASE_COLORS), dtype=np.uint8)
+    remap[used] = np.arange(2, len(used) + 2)
+    if staircase:
+        heights, reference = staircase_heights(levels[nearest])
+    else:
+        heights = np.zeros((length, width), dtype=np.int32)
+        reference = np.zeros(width, dtype=np.int32)
+    if int(heights.max()) + 2 > max_height:
+        raise ValueError(f"The staircase would be {int(heights.max()) + 2} blocks high, more than {max_height}. Build it flat or with dithering")
+    heights = heights + 1 # room for a base block below
+    reference = reference + 1
+
+    # palette indices fit in a byte, which keeps a 2048x2048 staircase small
+    blocks = np.zeros((int(max(heights.max(), reference.max())) + 1, length + 1, width), dtype=np.uint8)
+    z, x = np.indices((length, width))
+    blocks[heights, z + 1, x] = remap[base_colors]
+    blocks[heights - 1, z + 1, x] = 1
+    blocks[reference, 0, np.arange(width)] = 1
+    if not staircase:
+        blocks = blocks[1:] # flat map art doesn't need anything below
+    return Schematic(blocks, palette, (0, 0, 0))
@@ -0,0 +1,153 @@
+"""
+Outbound chat scheduling. Messages wait in priority lanes and go out through a token bucket, so bursts never get the bot
+kicked for spam. Long messages are split to the chat length limit and duplicates already waiting are sent once
+"""
+import collections
+import threading
+import time
+
+CHAT_LENGTH_LIMIT = 256
+PRIORITIES = ("high", "normal", "low") # lanes, emptied in this order
+
+def split_message(text: str, limit: int = CHAT_LENGTH_LIMIT) -> list:
+    "Splits text into parts of at most `limit` characters, between words where possible"
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current = ""
+    for word in text.split(" "):
+        while len(word) > limit: # no space to break at
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(word[:limit])
+            word = word[limit:]
+        if not current:
+            current = word
+        elif len(current) + 1 + len(word) <= limit:
+            current += " " + word
+        else:
+            parts.append(current)
+            current = word
+    if current:
+        parts.append(current)
+    return parts
+
+class ChatScheduler:
+    """
+    Sends chat messages, whispers and commands from a background thread. At most `rate` messages per second go out on average,
+    with bursts of up to `burst`. `send(kind, target, text)` does the actual sending, `kind` is "chat", "whisper" or "command"
+    """
+    def __init__(self, send, rate: float = 1.0, burst: int = 5, limit: int = CHAT_LENGTH_LIMIT):
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.limit = limit
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.lanes = {priority: collections.deque() for priority in PRIORITIES}
+        self.waiting = set() # (kind, target, text) of queued messages, for coalescing
+        self.condition = threading.Condition()
+        self.closed = False
+        self.sending = False
+        self.counters = {"queued": 0, "sent": 0, "coalesced": 0, "split": 0, "errors": 0}
+        self.latency = [0.0, 0.0] # total and max seconds from queueing to sending
+        self.sender = threading.Thread(target=self.__send_loop, daemon=True)
+        self.sender.start()
+
+    def submit(self, kind: str, text: str, target: str = None, priority: str = "normal") -> int:
+        """
+        Queues a message. Chat and whispers longer than the limit are split, commands are never split since the server
+        would read the parts as separate commands. Returns how many messages were queued, after coalescing
+        """
+        if priority not in self.lanes:
+            raise ValueError(f"Unknown priority {priority!r}, use one of {', '.join(PRIORITIES)}")
+        limit = self.limit - len(f"/tell {target} ") if kind == "whisper" else self.limit
+        parts = [text] if kind == "command" else split_message(text, max(limit, 1))
+        queued = 0
+        with self.condition:
+            if len(parts) > 1:
+                self.counters["split"] += 1
+            for part in parts:
+                key = (kind, target, part)
+                if key in self.waiting:
+                    self.counters["coalesced"] += 1
+                    continue
+                self.waiting.add(key)
+                self.lanes[priority].append((key, time.monotonic()))
+                queued += 1
+            self.counters["queued"] += queued
+            self.condition.notify_all() # `join` waits on the condition too
+        return queued
+
+    def __next(self):
+        "The oldest message of the most important lane, waits until there is one. None once closed"
+        with self.condition:
+            while not self.closed and not any(self.lanes.values()):
+                self.condition.wait()
+            if self.closed:
+                return None
+            lane = next(lane for lane in self.lanes.values() if lane)
+            key, queued = lane.popleft()
+            self.waiting.discard(key)
+            self.sending = True
+            return key, queued
+
+    def __take_token(self):
+        "Waits until the bucket has a token and takes it"
+        while True:
+            now = time.monotonic()
+            self.tokens = min(float(self.burst), self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+    def __send_loop(self):
+        while True:
+            self.__take_token() # before picking, so a high priority message queued meanwhile still goes first
+            item = self.__next()
+            if item is None:
+                return
+            (kind, target, text), queued = item
+            try:
+                self.send(kind, target, text)
+                counter = "sent"
+            except Exception as e:
+                print(f"Could not send {text!r}: {e}")
+                counter = "errors"
+            waited = time.monotonic() - queued
+            with self.condition:
+                self.counters[counter] += 1
+                self.latency[0] += waited
+                self.latency[1] = max(self.latency[1], waited)
+                self.sending = False
+                self.condition.notify_all()
+
+    def join(self, timeout: float = None) -> bool:
+        "Waits until everything queued is sent. Returns False on timeout"
+        with self.condition:
+            return self.condition.wait_for(lambda: self.closed or not (self.sending or any(self.lanes.values())), timeout)
+
+    def close(self, timeout: float = 5) -> bool:
+        """
+        Stops sending after waiting up to `timeout` seconds for what is queued to go out, like `LogPipeline.flush`.
+        Whatever is left after that is dropped. Returns whether everything got sent
+        """
+        sent = self.join(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        return sent
+
+    def snapshot(self) -> dict:
+        "Queue depth per lane, counters and send latency in milliseconds"
+        with self.condition:
+            done = self.counters["sent"] + self.counters["errors"]
+            return {
+                "depth": {priority: len(lane) for priority, lane in self.lanes.items()},
+                **self.counters,
+                "latency_ms_avg": round(self.latency[0] / done * 1000, 3) if done else 0.0,
+                "latency_ms_max": round(self.latency[1] * 1000, 3),
+            }
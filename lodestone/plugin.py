@@ -2,12 +2,10 @@ import lodestone
 from discord import Embed
 import datetime
 import aiohttp
-from discord import SyncWebhook
 from rich.console import Console
 import asyncio
 import ast
 import inspect
-from numba import jit
 from javascript import require
 import time
 import os
@@ -16,10 +14,24 @@ import json
 from types import SimpleNamespace
 import asyncio
 from math import sqrt
+from collections import OrderedDict
 import asyncio
 from rich.console import Console
 import aiofiles
-import urllib.request
+import numpy as np
+
+try:
+    from building import greedy_boxes, is_gravity_block, ActionGraph, FACE_DIRECTIONS, BuildCheckpoint, file_hash, BuildPlan, estimate_build, DEFAULT_LATENCIES, chunk_of, BuildMetrics, FaceTable, HALVES, BridgeCounter
+    from schematics import read_schematic
+    from tables import StateTables
+    from mapart import image_to_schematic, MAP_SIZE
+    from utils import send_webhook
+except ImportError:
+    from .building import greedy_boxes, is_gravity_block, ActionGraph, FACE_DIRECTIONS, BuildCheckpoint, file_hash, BuildPlan, estimate_build, DEFAULT_LATENCIES, chunk_of, BuildMetrics, FaceTable, HALVES, BridgeCounter
+    from .schematics import read_schematic
+    from .tables import StateTables
+    from .mapart import image_to_schematic, MAP_SIZE
+    from .utils import send_webhook
 class plugins:
     class discord:
         """
@@ -47,7 +59,6 @@ class plugins:
         def main(self):
             @self.bot.on('discord_webhook') # this part of the code is ran when bot.emit('discord_webhook') is called
             def discord_webhook(bot, message:str, webhook:str, use_discord_forums:bool=False):
-                hook = SyncWebhook.from_url(url=webhook) # connect to the webhook
                 use_discord_forums:bool=False
                 color=0x3498db
                 embed = Embed(title="", description=f"**{message}**", color=color) # make the embed
@@ -58,19 +69,20 @@ class plugins:
                     embed.set_footer(text='\u200b', icon_url="https://github.com/Project-Lodestone/Lodestone/blob/main/chestlogo.png?raw=true") # fallback footer image
                 if use_discord_forums:
                     today = datetime.date.today() # get the current date
-                    hook.send(content=f"{today}", thread_name=f"{today}", username="Lodestone", avatar_url="https://github.com/Project-Lodestone/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed) # send the message in a forums channel
+                    send_webhook(webhook, content=f"{today}", thread_name=f"{today}", username="Lodestone", avatar_url="https://github.com/Project-Lodestone/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed) # send the message in a forums channel
                 else:
-                    hook.send(content=f" ", username="Lodestone", avatar_url="https://github.com/Project-Lodestone/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed) # send the message in a normal channel
+                    send_webhook(webhook, username="Lodestone", avatar_url="https://github.com/Project-Lodestone/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed) # send the message in a normal channel, queued so it never blocks the bot
     class schematic:
         """
         Build in map art plugin
         """
+        plans = {} # shared builds by file, see `build_schematic_shared`
+        plans_lock = threading.Lock()
+        
         def __init__(self, bot: lodestone.Bot):
             "The injection method"
             self.bot = bot
             global Vec3
-            global facingData
-            global interactable
             global schematic2schem
             global path
             global fs
@@ -78,8 +90,6 @@ class plugins:
             global mcData
             global Item
             Vec3  = require('vec3').Vec3
-            facingData = json.load(urllib.request.urlopen("https://raw.githubusercontent.com/the-lodestone-project/Lodestone/main/lodestone/facingData.json"))
-            interactable = json.load(urllib.request.urlopen("https://raw.githubusercontent.com/the-lodestone-project/Lodestone/main/lodestone/facingData.json"))
             schematic2schem = require('schematic2schem')
             path = require('path')
             fs = require('fs').promises
@@ -88,6 +98,22 @@ class plugins:
             mcData = require('minecraft-data')(bot.bot.version)
             Item = require('prismarine-item')(bot.bot.version)
             self.console = Console()
+            self.multi_place = True # place everything in reach before pathing again
+            self.reach = 4.5
+            self.equipped_id = None
+            self.hotbar = OrderedDict() # item id -> hotbar slot, least recently used first. Creative only, reset every build
+            self.creative = True # whether the bot is in creative, checked at the start of every build
+            self.provision_types = 9 # item types to preload from the upcoming actions
+            self.prefetch_threshold = 64 # walk to the next unloaded chunk once this few actions are left
+            self.prefetch_range = 32
+            self.loaded_columns = set() # chunk columns (x >> 4, z >> 4) the bot has loaded, see `track_columns`
+            self.metrics = BuildMetrics() # of the current build, see `run_build`
+            self.js_bot = BridgeCounter(bot.bot, lambda: self.metrics.count("bridge_calls")) # `bot.bot` counting its bridge calls into the metrics
+            self.metrics_path = "build_metrics.jsonl" # where the metrics get dumped while building, None to turn it off
+            self.metrics_interval = 30
+            self.max_retries = 3
+            self.build_mode = "place" # "place" or "command" (needs operator permissions)
+            self.latencies = dict(DEFAULT_LATENCIES) # measured while building, used by `estimate`
             self.code = inspect.getsource(inspect.getmodule(self.__class__))
             self.tree = ast.parse(self.code)
             self.events = []
@@ -104,19 +130,70 @@ class plugins:
             self.start()
         
     
+        class PythonSchematic:
+            """
+            A schematic read in python (see `lodestone.schematics`) with the palette resolved to state ids of a version.
+            Has the parts of the prismarine-schematic interface the builder uses, plus the whole volume as `states`
+            """
+            def __init__(self, schematic, version):
+                Block = require('prismarine-block')(version)
+                legacy = None
+                state_ids = []
+                for state in schematic.palette:
+                    if state.startswith("legacy:"):
+                        if legacy is None:
+                            legacy = require('minecraft-data').legacy.pc.blocks
+                        state = legacy[state.removeprefix("legacy:")] or "minecraft:air"
+                    try:
+                        state_ids.append(Block.fromString(state, 0).stateId)
+                    except:
+                        print(f"unknown block state {state}, using air")
+                        state_ids.append(0)
+                self.states = np.asarray(state_ids, dtype=np.int32)[schematic.blocks]
+                self.palette = sorted(set(state_ids))
+                self.version = version
+                self.offset = Vec3(*schematic.offset)
+                self.size = Vec3(*schematic.size)
+            
+            def getBlockStateId(self, pos):
+                return int(self.states[pos.y - self.offset.y, pos.z - self.offset.z, pos.x - self.offset.x])
+        
         class Build:
-            def __init__(self, schematic, world, at):
+            def __init__(self, schematic, world, at, checkpoint: BuildCheckpoint = None, chunks: set = None, diff: bool = True, stream: bool = False,
+                         loaded: set = None):
+                """
+                Diffs the schematic placed at `at` against the world. With a `checkpoint` progress gets saved to disk,
+                and `chunks` limits the diff to those chunk columns (x >> 4, z >> 4) when resuming.
+                Without `diff` no actions are made, for estimates. With `stream` the diff runs in the background, see `stream_actions`.
+                `loaded` is the set of loaded chunk columns kept up to date from the chunk events (see `track_columns`), without it the world gets asked
+                """
                 self.schematic = schematic
-                self.world = world 
+                self.loaded = loaded
+                self.checkpoint = checkpoint
+                self.plan: BuildPlan = None
+                self.metrics = BuildMetrics() # bridge calls of the diff until the builder takes over, see `builder`
+                self.world = BridgeCounter(world, lambda: self.metrics.count("bridge_calls"))
                 self.at = at
                 self.min = at.plus(schematic.offset)
                 self.max = self.min.plus(schematic.size)
+                self.start = (self.min.x, self.min.y, self.min.z)
+                states = getattr(schematic, "states", None)
+                self.states = states if isinstance(states, np.ndarray) else None # python side volume, if there is one
                 
                 
                 
-                self.actions = []
+                self.actions = {}
                 self.error_actions = []
-                self.update_actions()
+                self.retries = {}
+                self.air = set()
+                self.world_states = None # the world around the area as known from diffing, see `update_actions`
+                self.graph = ActionGraph()
+                # chunk columns (x >> 4, z >> 4) of the build area, the work units
+                self.units = {(cx, cz) for cx in range(self.min.x >> 4, ((self.max.x - 1) >> 4) + 1) for cz in range(self.min.z >> 4, ((self.max.z - 1) >> 4) + 1)}
+                self.undiffed = set(self.units)
+                self.lock = threading.RLock() # the actions and the graph, while `stream_actions` adds to them
+                self.producing = False
+                self.produced = threading.Event()
 
                 # Cache of blockstate to block
                 Block = require('prismarine-block')(schematic.version)
@@ -124,38 +201,249 @@ class plugins:
                 self.blocks = {}
                 self.properties = {}
                 self.items = {}
+                self.state_strings = {}
+                self.face_masks = {}
+                self.halves = {}
+                self.face_table = FaceTable(lambda state_id: Block.fromStateId(state_id, 0).shapes.valueOf())
+                self.tables = StateTables.for_version(schematic.version, lambda: mcData.blocksArray.valueOf())
+                self.needs_below = set() # gravity blocks and upper halves
                 for state_id in schematic.palette:
                     try:
                         block = Block.fromStateId(state_id, 0)
                         self.blocks[state_id] = block
                         self.properties[state_id] = block.getProperties()
                         self.items[state_id] = mcData.itemsByName[block.name]
+                        if is_gravity_block(block.name) or self.properties[state_id].half == 'upper':
+                            self.needs_below.add(state_id)
                     except: 
                         print("got error with state id " + str(state_id))
                         continue
                     
+                if diff and stream:
+                    self.stream_actions(chunks)
+                elif diff:
+                    self.update_actions(chunks)
                 # How many actions?
                 # print(len(self.actions))
             
-            def update_actions(self):
-                self.actions = []
+            def update_actions(self, chunks: set = None):
+                """
+                Diffs the whole build area again, or only the chunk columns in `chunks`. Only chunks that are loaded get diffed,
+                the others are left in `self.undiffed` for `diff_loaded` once the bot gets close enough
+                """
+                units = self.reset_actions(chunks)
+                found = []
+                for chunk in self.ordered_units(units):
+                    if self.is_loaded(chunk):
+                        found += self.diff_chunk(chunk)
+                        self.undiffed.discard(chunk)
+                with self.lock:
+                    for action in found:
+                        self.actions[action['xyz']] = action
+                    self.graph.add_many(found, self.get_dependencies)
+                if self.checkpoint:
+                    self.checkpoint.save()
+            
+            def reset_actions(self, chunks: set = None) -> set:
+                "Forgets every action before diffing again. Returns the chunk columns to diff"
+                with self.lock:
+                    self.actions = {}
+                    self.air = set()
+                    # state ids of the area and a one block border around it, -1 where unknown
+                    size = self.schematic.size
+                    self.world_states = np.full((size.y + 2, size.z + 2, size.x + 2), -1, dtype=np.int32)
+                    if chunks is not None: # the chunks that aren't diffed again are done, so they hold what the schematic has
+                        self.world_states[1:-1, 1:-1, 1:-1] = self.volume()
+                    units = self.units if chunks is None else self.units & set(chunks)
+                    self.undiffed = set(units)
+                    self.graph = ActionGraph()
+                    self.retries = {}
+                    self.error_actions = []
+                return units
+            
+            def stream_actions(self, chunks: set = None):
+                """
+                Diffs in a background thread, one chunk column at a time in build order, so building can start on the first columns
+                while the rest are still diffed. `producing` is set while it runs and `produced` every time a column is added
+                """
+                units = self.reset_actions(chunks)
+                self.producing = True
+                def produce():
+                    try:
+                        for chunk in self.ordered_units(units):
+                            if self.is_loaded(chunk) and self.add_chunk(chunk):
+                                self.produced.set()
+                    except Exception as e:
+                        print(f"Stopped generating actions: {e}")
+                    finally:
+                        self.producing = False
+                        self.produced.set()
+                        if self.checkpoint:
+                            self.checkpoint.save()
+                threading.Thread(target=produce, daemon=True).start()
+            
+            def wait_for_actions(self, timeout: float = 1):
+                "Waits until `stream_actions` added a chunk column or finished"
+                self.produced.wait(timeout)
+                self.produced.clear()
+            
+            def add_chunk(self, chunk) -> int:
+                "Diffs a chunk column that wasn't diffed yet and adds its actions to the graph. Returns how many actions were added"
+                with self.lock:
+                    if chunk not in self.undiffed:
+                        return 0 # done already, or being diffed by another thread
+                    self.undiffed.discard(chunk)
+                found = self.diff_chunk(chunk)
+                with self.lock:
+                    for action in found:
+                        self.actions[action['xyz']] = action
+                    self.graph.add_many(found, self.get_dependencies)
+                    if self.plan:
+                        self.plan.add_positions([action['xyz'] for action in found])
+                return len(found)
+            
+            def ordered_units(self, units):
+                "Chunk columns in a serpentine, the order they get built in"
+                return sorted(units, key=lambda chunk: (chunk[0], chunk[1] if chunk[0] % 2 == 0 else -chunk[1]))
+            
+            def is_loaded(self, chunk) -> bool:
+                if self.loaded is not None:
+                    return chunk in self.loaded
+                return self.world.getColumnAt(Vec3(chunk[0] * 16, 0, chunk[1] * 16)) is not None
+            
+            def loaded_units(self) -> set:
+                "The chunk columns of the build that are loaded right now"
+                return {chunk for chunk in self.units if self.is_loaded(chunk)}
+            
+            def diff_chunk(self, chunk) -> list:
+                "Diffs the part of the build in one chunk column against the world. Returns the actions, without adding them"
+                new_actions = []
                 cursor = Vec3(0,0,0)
-                for cursor.y in range(self.min.y, self.max.y):
-                    for cursor.z in range(self.min.z, self.max.z):
-                        for cursor.x in range(self.min.x, self.max.x):
+                # the border around the area gets read too, for `get_feasible_faces`
+                x_range = range(self.min.x - 1 if chunk[0] * 16 <= self.min.x else chunk[0] * 16, self.max.x + 1 if chunk[0] * 16 + 16 >= self.max.x else chunk[0] * 16 + 16)
+                z_range = range(self.min.z - 1 if chunk[1] * 16 <= self.min.z else chunk[1] * 16, self.max.z + 1 if chunk[1] * 16 + 16 >= self.max.z else chunk[1] * 16 + 16)
+                sx, sy, sz = self.start
+                for y in range(self.min.y - 1, self.max.y + 1):
+                    cursor.y = y
+                    for z in z_range:
+                        cursor.z = z
+                        for x in x_range:
+                            cursor.x = x
+                            if not (sy <= y < self.max.y and sz <= z < self.max.z and sx <= x < self.max.x):
+                                try:
+                                    state_in_world = self.world.getBlockStateId(cursor)
+                                    self.world_states[y - sy + 1, z - sz + 1, x - sx + 1] = -1 if state_in_world is None else state_in_world
+                                except:
+                                    pass
+                                continue
                             try:
                                 state_in_world = self.world.getBlockStateId(cursor)
-                                new_vec3 = SimpleNamespace(x=cursor.x-self.at.x, y=cursor.y-self.at.y, z=cursor.z-self.at.z)
-                                
-                                wanted_state = self.schematic.getBlockStateId(Vec3(new_vec3.x, new_vec3.y, new_vec3.z))
+                                self.world_states[y - sy + 1, z - sz + 1, x - sx + 1] = -1 if state_in_world is None else state_in_world
+                                if state_in_world == 0:
+                                    self.air.add((x, y, z))
+                                if self.states is not None:
+                                    wanted_state = int(self.states[y - self.start[1], z - self.start[2], x - self.start[0]])
+                                else:
+                                    new_vec3 = SimpleNamespace(x=x-self.at.x, y=y-self.at.y, z=z-self.at.z)
+                                    
+                                    wanted_state = self.schematic.getBlockStateId(Vec3(new_vec3.x, new_vec3.y, new_vec3.z))
+                                if self.checkpoint:
+                                    self.checkpoint.set_completed((x, y, z), state_in_world == wanted_state)
                                 if state_in_world != wanted_state:
+                                    xyz = (x, y, z)
                                     if wanted_state == 0:
-                                        self.actions.append({'type': 'dig', 'pos': cursor.clone()})
+                                        new_actions.append({'type': 'dig', 'pos': cursor.clone(), 'xyz': xyz})
                                     else:
-                                        self.actions.append({'type': 'place', 'pos': cursor.clone(), 'state': wanted_state})
+                                        new_actions.append({'type': 'place', 'pos': cursor.clone(), 'xyz': xyz, 'state': wanted_state})
                             except:
                                 print(f"cant get data about block at {cursor}")
+                return new_actions
+            
+            def diff_loaded(self) -> int:
+                "Diffs the chunk columns that got loaded since, adding their actions to the graph. Returns how many actions were added"
+                with self.lock:
+                    undiffed = self.ordered_units(self.undiffed)
+                added = sum(self.add_chunk(chunk) for chunk in undiffed if self.is_loaded(chunk))
+                if added and self.checkpoint:
+                    self.checkpoint.save()
+                return added
+            
+            def get_dependencies(self, action):
+                """
+                Positions of the placements this action has to wait for: the block below for gravity blocks and upper halves,
+                otherwise one planned neighbour to place against if nothing in the world supports it yet
+                """
+                if action['type'] != 'place':
+                    return []
+                x, y, z = action['xyz']
+                if action['state'] in self.needs_below:
+                    return [(x, y - 1, z)]
+                planned = []
+                for (dx, dy, dz), can_face in zip(FACE_DIRECTIONS, self.get_face_mask(action['state'])):
+                    if not can_face:
+                        continue
+                    neighbour = (x + dx, y + dy, z + dz)
+                    if neighbour not in self.actions:
+                        if neighbour not in self.air:
+                            return [] # there is already something to place against
+                    elif self.actions[neighbour]['type'] == 'place':
+                        planned.append(neighbour)
+                return planned[:1]
 
+            def volume(self):
+                """
+                The schematic as a state id volume [y, z, x]. Schematics loaded through prismarine-schematic are copied over in one go
+                from their palette and block indices (stored y, z, x like ours), block by block only if those don't add up
+                """
+                if self.states is None:
+                    size = self.schematic.size
+                    try:
+                        palette = np.asarray(self.schematic.palette.valueOf(), dtype=np.int32)
+                        indices = np.asarray(self.schematic.blocks.valueOf(), dtype=np.int64)
+                        self.states = palette[indices].reshape(size.y, size.z, size.x)
+                        return self.states
+                    except Exception as e:
+                        print(f"Reading the schematic block by block: {e}")
+                    self.states = np.zeros((size.y, size.z, size.x), dtype=np.int32)
+                    for y in range(size.y):
+                        for z in range(size.z):
+                            for x in range(size.x):
+                                self.states[y, z, x] = self.schematic.getBlockStateId(self.schematic.offset.offset(x, y, z))
+                return self.states
+            
+            def world_volume(self):
+                "The blocks in the world where the schematic goes, as a state id volume [y, z, x]. Unloaded blocks count as air"
+                height, length, width = self.volume().shape
+                current = np.zeros((height, length, width), dtype=np.int32)
+                cursor = Vec3(0,0,0)
+                for y in range(height):
+                    cursor.y = self.min.y + y
+                    for z in range(length):
+                        cursor.z = self.min.z + z
+                        for x in range(width):
+                            cursor.x = self.min.x + x
+                            try:
+                                current[y, z, x] = self.world.getBlockStateId(cursor) or 0
+                            except:
+                                pass
+                return current
+            
+            def estimate(self, latencies: dict = None, reach: float = 4.5, against_world: bool = False):
+                """
+                Materials, action counts, infeasible placements, path length and time of this build without placing anything (see `estimate_build`).
+                `against_world` diffs against the blocks in the world instead of an empty area, which is a lot slower as every block is read from the world
+                """
+                return estimate_build(
+                    self.volume(),
+                    self.world_volume() if against_world else None,
+                    self.start,
+                    {state_id: self.items[state_id].name if self.items.get(state_id) else None for state_id in self.schematic.palette},
+                    {state_id: self.get_face_mask(state_id) for state_id in self.properties},
+                    self.needs_below,
+                    latencies,
+                    reach,
+                )
+            
             def update_block(self, pos):
                 # is in area?
                 self.update_actions()
@@ -163,13 +451,25 @@ class plugins:
             def get_item_for_state(self, state_id):
                 return self.items[state_id]
             
+            def get_state_string(self, state_id):
+                "The block state as used in commands, like `minecraft:oak_stairs[facing=north,half=bottom]`"
+                if state_id == 0:
+                    return "minecraft:air"
+                if state_id not in self.state_strings:
+                    block = self.blocks[state_id]
+                    properties = self.properties[state_id].valueOf()
+                    state = ",".join(f"{key}={str(value).lower() if isinstance(value, bool) else value}" for key, value in properties.items())
+                    self.state_strings[state_id] = f"minecraft:{block.name}" + (f"[{state}]" if state else "")
+                return self.state_strings[state_id]
+            
             
             def get_facing(self, state_id, facing):
                 if not facing: 
                     return {'facing': None, 'face_direction': False, 'is3D': False}
-                block = self.blocks[state_id]
-                data = facingData[block.name]
-                if data['inverted'] == 'true' or data['inverted'] == True:
+                data = self.tables.get_facing(state_id)
+                if data is None:
+                    return {'facing': None, 'face_direction': False, 'is3D': False}
+                if data['inverted']:
                     if facing == 'up': facing = 'down'
                     elif facing == 'down': facing = 'up'
                     elif facing == 'north': facing = 'south'
@@ -179,22 +479,10 @@ class plugins:
                 return {'facing': facing, 'face_direction': data['faceDirection'], 'is3D': data['is3D']}
             
             
-            def get_shape_face_centers(self, shapes, direction, half=None):
-                faces = []
-                for shape in shapes:
-                    halfsize = Vec3(shape[3] - shape[0], shape[4] - shape[1], shape[5] - shape[2]).scale(0.5)
-                    center = Vec3(shape[0] + shape[3], shape[1] + shape[4], shape[2] + shape[5]).scale(0.5)
-                    center = center.offset(halfsize.x * direction.x, halfsize.y * direction.y, halfsize.z * direction.z)
-                    if half == 'top' and center.y <= 0.5:
-                        if abs(direction.y) == 0: center.y += halfsize.y - 0.001
-                        if center.y <= 0.5: continue
-                    elif half == 'bottom' and center.y >= 0.5:
-                        if abs(direction.y) == 0: center.y -= halfsize.y - 0.001
-                        if center.y >= 0.5: continue
-                    faces.append(center)
-                return faces
-            
-            def get_possible_directions(self, state_id, pos):
+            def get_face_mask(self, state_id):
+                "Which of the six faces (down, up, north, south, west, east) the block can be placed against, based on its properties"
+                if state_id in self.face_masks:
+                    return self.face_masks[state_id]
                 faces = [True] * 6
                 properties = self.properties[state_id]
                 block = self.blocks[state_id]
@@ -206,7 +494,7 @@ class plugins:
                     elif properties.axis == 'z':
                         faces[0] = faces[1] = faces[4] = faces[5] = False
                 if properties.half == 'upper': 
-                    return []
+                    faces = [False] * 6
                 if properties.half == 'top' or properties.type == 'top':
                     faces[0] = faces[1] = False
                 if properties.half == 'mcbottom' or properties.type == 'mcbottom':
@@ -232,53 +520,152 @@ class plugins:
                     faces[0] = faces[2] = faces[3] = faces[4] = faces[5] = False
                 if block.material == 'plant':
                     faces[1] = faces[2] = faces[3] = faces[4] = faces[5] = False
-                    
-                dirs = []
-                face_dirs = [Vec3(0, -1, 0), Vec3(0, 1, 0), Vec3(0, 0, -1), Vec3(0, 0, 1), Vec3(-1, 0, 0), Vec3(1, 0, 0)]
-                for i, can_face in enumerate(faces):
-                    if can_face:
-                        dirs.append(face_dirs[i])
-                        
-                half = properties.half if properties.half else properties.type
-                dirs = [dir for dir in dirs if self.get_shape_face_centers(self.world.getBlock(pos.plus(dir)).shapes, dir.scaled(-1), half)]
-                # dirs = []
-                # for dir in dirs:
-                #     pos_vec_python = SimpleNamespace(x=pos.x+dir.x, y=pos.y+dir.y, z=pos.z+dir.z)
-                #     pos_vec = Vec3(pos_vec_python.x, pos_vec_python.y, pos_vec_python.z)
-                #     dir_vec = Vec3(dir.x, dir.y, dir.z)
-                    
-                #     if getShapeFaceCenters(self.world.getBlock(pos_vec).shapes, 
-                #                             -dir_vec, 
-                #                             half):
-                #         dirs.append(dir)
-                # print(dirs)
-                return dirs
+                self.face_masks[state_id] = faces
+                return faces
+            
+            def get_half(self, state_id):
+                "Index of the half (the `half` or `type` property) of a state in the face tables, see `lodestone.building.HALVES`"
+                if state_id not in self.halves:
+                    properties = self.properties[state_id]
+                    self.halves[state_id] = HALVES.get(properties.half if properties.half else properties.type, 0)
+                return self.halves[state_id]
+            
+            def get_feasible_faces(self, actions):
+                """
+                Which faces ((n, 6) bools in FACE_DIRECTIONS order) a batch of placements can go against right now,
+                from their face masks and the shapes of the neighbours in `world_states`
+                """
+                positions = np.array([action['xyz'] for action in actions], dtype=np.int64).reshape(-1, 3) - np.array(self.start) + 1
+                neighbours = positions[:, None, :] + np.array(FACE_DIRECTIONS)[None, :, :]
+                neighbour_states = np.maximum(self.world_states[neighbours[..., 1], neighbours[..., 2], neighbours[..., 0]], 0) # unknown counts as air
+                states, inverse = np.unique(np.array([action['state'] for action in actions], dtype=np.int64), return_inverse=True)
+                masks = np.array([self.get_face_mask(state_id) for state_id in states.tolist()], dtype=bool).reshape(-1, 6)[inverse]
+                halves = np.array([self.get_half(state_id) for state_id in states.tolist()], dtype=np.int64)[inverse]
+                return masks & self.face_table.faces(neighbour_states, halves)
+            
+            def get_possible_directions(self, state_id, xyz):
+                "The directions (as Vec3) of the neighbours a block can be placed against at `xyz`"
+                faces = self.get_feasible_faces([{'xyz': xyz, 'state': state_id}])[0]
+                return [Vec3(*FACE_DIRECTIONS[i]) for i in np.flatnonzero(faces).tolist()]
+            
+            def set_world_state(self, xyz, state_id):
+                x, y, z = xyz
+                if self.world_states is not None:
+                    self.world_states[y - self.start[1] + 1, z - self.start[2] + 1, x - self.start[0] + 1] = state_id
+                if state_id == 0:
+                    self.air.add(xyz)
+                else:
+                    self.air.discard(xyz)
 
             def remove_action(self, action):
-                try:
-                    self.actions.remove(action)
-                except:
-                    pass
+                "Marks an action as done"
+                with self.lock:
+                    self.actions.pop(action['xyz'], None)
+                    self.set_world_state(action['xyz'], action['state'] if action['type'] == 'place' else 0)
+                    self.graph.complete(action['xyz'])
+                if self.checkpoint:
+                    self.checkpoint.mark_done(action['xyz'])
+                if self.plan:
+                    self.plan.complete(action['xyz'])
             
+            def fail_action(self, action):
+                if self.plan:
+                    self.plan.release(action['xyz'])
+                with self.lock:
+                    if self.actions.pop(action['xyz'], None) is None:
+                        return # not pending (anymore)
+                    self.graph.fail(action['xyz'])
+                    self.error_actions.append(action)
+                    self.retries[action['xyz']] = self.retries.get(action['xyz'], 0) + 1
+                if self.checkpoint:
+                    self.checkpoint.mark_error(action['xyz'])
             
-            def get_available_actions(self):
-                filtered_actions = [action for action in self.actions if action['type'] == 'dig' or len(self.get_possible_directions(action['state'], action['pos'])) > 0]
-                return filtered_actions
+            def retry_errors(self, max_retries):
+                "Puts failed actions back up for building unless they failed `max_retries` times already. Returns how many"
+                with self.lock:
+                    retrying = [action for action in self.error_actions if self.retries[action['xyz']] < max_retries]
+                    self.error_actions = [action for action in self.error_actions if self.retries[action['xyz']] >= max_retries]
+                    for action in retrying:
+                        self.actions[action['xyz']] = action
+                        self.graph.retry(action['xyz'])
+                return len(retrying)
+            
+            def get_available_actions(self, keep=None):
+                "Actions with all their dependencies built that can be placed right now. `keep` optionally filters them before the placement check"
+                with self.lock:
+                    ready = [action for action in self.graph.ready() if keep is None or keep(action)]
+                places = [action for action in ready if action['type'] == 'place']
+                if not places:
+                    return ready
+                placeable = iter(self.get_feasible_faces(places).any(axis=1).tolist())
+                return [action for action in ready if action['type'] == 'dig' or next(placeable)]
+        
+        def hotbar_slot(self, id, keep=()):
+            """
+            The hotbar slot (0-8) for an item, filling it in creative if the item isn't there yet.
+            Evicts the least recently used slot whose item isn't in `keep`
+            """
+            if id in self.hotbar:
+                self.hotbar.move_to_end(id)
+                return self.hotbar[id]
+            used = set(self.hotbar.values())
+            free = [slot for slot in range(9) if slot not in used]
+            if free:
+                slot = free[0]
+            else:
+                evict = next((item for item in self.hotbar if item not in keep), next(iter(self.hotbar)))
+                slot = self.hotbar.pop(evict)
+                if evict == self.equipped_id:
+                    self.equipped_id = None
+            self.bot.bot.creative.setInventorySlot(36 + slot, Item(id, 64))
+            self.hotbar[id] = slot
+            return slot
+        
+        def provision(self, build: Build, actions):
+            """
+            Loads the hotbar with the first `self.provision_types` item types of the upcoming actions in one go,
+            so equipping them later is just a hotbar switch. Only in creative
+            """
+            if not self.creative:
+                return
+            wanted = []
+            for action in actions:
+                if action['type'] != 'place':
+                    continue
+                item = build.get_item_for_state(action['state'])
+                if item is not None and item.id not in wanted:
+                    wanted.append(item.id)
+                    if len(wanted) == min(self.provision_types, 9):
+                        break
+            for id in wanted:
+                self.hotbar_slot(id, keep=wanted)
         
         def equip_item(self, id):
-            # if len(int(mcbot.bot.inventory.items())) > 30:
-            #     mcbot.chat("/clear")
-            #     wait(1000)
-                
-            if not any(x.type == id for x in self.bot.inventory.items()):
-                slot = self.bot.bot.inventory.firstEmptyInventorySlot()
-                if slot is None:
-                    slot = 36
-                self.bot.bot.creative.setInventorySlot(slot, Item(id, 1))
-            item = next(x for x in self.bot.inventory.items() if x.type==id)
-            self.bot.bot.equip(item, "hand")
-
-            # /fill ~-20 ~ ~-20 ~20 ~10 ~20 minecraft:air
+            """
+            Holds an item. In creative from the hotbar (see `hotbar_slot`), refilling the slot if it doesn't hold the item anymore,
+            for example after dying or the inventory being changed. Otherwise it has to be in the inventory
+            """
+            held = self.js_bot.heldItem
+            if id == self.equipped_id and held is not None and held.type == id:
+                return # already holding it
+            self.equipped_id = None
+            if not self.creative:
+                item = next((item for item in self.bot.inventory.items() if item.type == id), None)
+                if item is None:
+                    raise Exception(f"No item {id} in the inventory")
+                self.js_bot.equip(item, "hand")
+                self.equipped_id = id
+                return
+            slot = self.hotbar_slot(id)
+            self.js_bot.setQuickBarSlot(slot)
+            held = self.js_bot.heldItem
+            if held is None or held.type != id:
+                self.js_bot.creative.setInventorySlot(36 + slot, Item(id, 64))
+            self.equipped_id = id
+        
+        def record_latency(self, kind, seconds):
+            "Moving average of how long `kind` (place, dig, or walk per block) takes, for `estimate`"
+            self.latencies[kind] += (seconds - self.latencies[kind]) * 0.1
             
         def closest_action(self, actions):
             origin = self.bot.entity.position.offset(0.5, 0.5, 0.5)
@@ -291,409 +678,493 @@ class plugins:
                     closest = action
             return action
         
+        def bot_position(self):
+            position = self.bot.entity.position
+            return (position.x, position.y, position.z)
+        
+        def eye_position(self):
+            return self.bot.bot.entity.position.floored().offset(0.5, 1.6, 0.5)
+        
+        def sort_by_distance(self, actions, origin):
+            "Sorts actions in place by distance to `origin` (an x, y, z tuple) using the python side coordinates"
+            ox, oy, oz = origin
+            actions.sort(key=lambda a: (a['xyz'][0] + 0.5 - ox) ** 2 + (a['xyz'][1] + 0.5 - oy) ** 2 + (a['xyz'][2] + 0.5 - oz) ** 2)
+        
+        def make_goal(self, build: Build, action):
+            properties = build.properties[action["state"]]
+            half = properties["half"] if "half" in properties else properties["type"]
+            faces = build.get_possible_directions(action["state"], action["xyz"])
+            facing_data = build.get_facing(action["state"], properties["facing"])
+            return self.bot.goals.GoalPlaceBlock(action["pos"], self.bot.world, {
+                "faces": faces,
+                "facing": facing_data["facing"],
+                "facing3D": facing_data["is3D"],
+                "half": half
+            })
+        
+        def place_action(self, build: Build, action, faceAndRef):
+            """
+            Places the block of an action from where the bot is standing, using the face and reference of `GoalPlaceBlock.getFaceAndRef`
+            """
+            started = time.perf_counter()
+            item = build.get_item_for_state(action["state"])
+            with self.metrics.timer("equip"):
+                self.equip_item(item.id) # equip after pathfinder
+            
+            with self.metrics.timer("lookAt"):
+                self.js_bot.lookAt(faceAndRef.to, True)
+            
+            refBlock = self.js_bot.blockAt(faceAndRef.ref)
+            sneak = False
+            if build.tables.is_interactable(refBlock.stateId):
+                sneak = True
+            
+            if sneak: 
+                self.bot.set_control_state("sneak", True)
+            try:
+                with self.metrics.timer("placeBlock"):
+                    self.js_bot.placeBlock(refBlock, faceAndRef.face.scaled(-1))
+                self.record_latency("place", time.perf_counter() - started)
+            except:
+                self.hotbar.pop(self.equipped_id, None) # the held stack might be gone
+                self.equipped_id = None
+                raise
+            finally:
+                if sneak: 
+                    self.bot.set_control_state("sneak", False)
+        
+        def dig_action(self, action) -> bool:
+            "Breaks the block of a dig action from where the bot is standing. Returns whether there is air now"
+            started = time.perf_counter()
+            block = self.js_bot.blockAt(action["pos"])
+            if block is not None and block.type != 0:
+                with self.metrics.timer("dig"):
+                    self.js_bot.dig(block, True)
+                self.record_latency("dig", time.perf_counter() - started)
+            return self.js_bot.world.getBlockStateId(action["pos"]) == 0
+        
+        def action_failed(self, build: Build, actions, action, reason="error"):
+            try:
+                actions.remove(action)
+            except:
+                pass
+            build.fail_action(action)
+            self.metrics.error(reason)
+            print(f"Got an error while trying to place block at {action['pos']}")
+        
+        def place_within_reach(self, build: Build, actions, status):
+            """
+            Places every action that can be reached from the current standpoint without pathing again.
+            Actions that can't be placed from here are left for the pathfinder
+            """
+            eye = self.eye_position()
+            ex, ey, ez = eye.x, eye.y, eye.z
+            reach = self.reach ** 2
+            placed = 0
+            self.sort_by_distance(actions, (ex, ey, ez))
+            for action in list(actions):
+                x, y, z = action['xyz']
+                if (x + 0.5 - ex) ** 2 + (y + 0.5 - ey) ** 2 + (z + 0.5 - ez) ** 2 > reach:
+                    break # sorted, so everything after this is out of reach too
+                if action["type"] != "place":
+                    continue
+                if build.plan and not build.plan.claim(self.bot.username, action['xyz']):
+                    continue
+                done = False
+                try:
+                    try:
+                        with self.metrics.timer("verification"):
+                            goal = self.make_goal(build, action)
+                            faceAndRef = goal.getFaceAndRef(eye)
+                    except:
+                        continue
+                    if not faceAndRef:
+                        continue
+                    try:
+                        self.place_action(build, action, faceAndRef)
+                    except Exception as e:
+                        print(e)
+                        self.action_failed(build, actions, action, type(e).__name__)
+                        continue
+                    actions.remove(action)
+                    build.remove_action(action)
+                    done = True
+                finally:
+                    if not done and build.plan:
+                        build.plan.release(action['xyz']) # left for the pathfinder, or for another bot
+                self.metrics.count("placed")
+                placed += 1
+                status.update(f"[bold]Building schematic! |{len(actions)} left| placed {placed} from this spot\n")
+            return placed
+        
+        def command_build(self, build: Build, status, passes=3):
+            """
+            Builds with /fill and /setblock instead of placing blocks one by one. Needs operator permissions.
+            The actions are merged into cuboids of the same state, and the area is diffed again after every pass.
+            The commands are paced by the bot's chat rate (`ls_chat_rate`) and go behind chat so responses aren't held up.
+            Anything still wrong after `passes` passes is left in `build.actions` for the normal builder
+            """
+            while build.producing:
+                status.update("[bold]Generating actions...\n")
+                build.wait_for_actions(1)
+            for attempt in range(passes):
+                cells = {action['xyz']: action['state'] if action['type'] == 'place' else 0 for action in build.actions.values()}
+                if not cells:
+                    break
+                boxes = greedy_boxes(cells)
+                for i, (state, start, end) in enumerate(boxes):
+                    status.update(f"[bold]Sending commands! |{i}/{len(boxes)}| for {len(cells)} blocks (pass {attempt + 1})\n")
+                    block = build.get_state_string(state)
+                    if start == end:
+                        self.bot.command("setblock", *map(str, start), block, priority="low")
+                    else:
+                        self.bot.command("fill", *map(str, start), *map(str, end), block, priority="low")
+                status.update("[bold]Checking the results...\n")
+                self.bot.wait_for_chat() # the commands are queued, see `Bot.chat`
+                time.sleep(1) # let the server catch up
+                with self.metrics.timer("verification"):
+                    build.update_actions()
+        
+        def loaded_actions(self, build: Build):
+            """
+            The available actions of a build in loaded chunks. For shared builds only the ones in regions this bot owns, after dropping what other bots built already.
+            Steals a region from the busiest bot when this one runs out
+            """
+            loaded = build.loaded_units()
+            if build.plan is None:
+                return build.get_available_actions(lambda action: chunk_of(action['xyz']) in loaded)
+            plan = build.plan
+            name = self.bot.username
+            with build.lock:
+                done = [action for xyz, action in build.actions.items() if plan.is_done(xyz)]
+            for action in done:
+                build.remove_action(action)
+            mine = lambda action: chunk_of(action['xyz']) in loaded and plan.owns(name, action['xyz'])
+            actions = build.get_available_actions(mine)
+            while not actions and plan.steal(name):
+                actions = build.get_available_actions(mine)
+            return actions
+        
+        def prefetch(self, build: Build) -> bool:
+            "Walks to the closest chunk column of the build that wasn't loaded yet and waits for the chunks to load. Returns whether it got diffed"
+            unloaded = [chunk for chunk in build.undiffed if not build.is_loaded(chunk)]
+            if not unloaded:
+                return False
+            x, _, z = self.bot_position()
+            chunk = min(unloaded, key=lambda c: (c[0] * 16 + 8 - x) ** 2 + (c[1] * 16 + 8 - z) ** 2)
+            try:
+                self.bot.bot.pathfinder.goto(self.bot.goals.GoalNearXZ(chunk[0] * 16 + 8, chunk[1] * 16 + 8, self.prefetch_range), timeout=1000)
+                self.bot.bot.waitForChunksToLoad()
+            except Exception as e:
+                print(e)
+            build.diff_loaded()
+            return chunk not in build.undiffed
+        
+        def available_actions(self, build: Build):
+            """
+            The available actions of a build, see `loaded_actions`. Chunks that are not loaded are never diffed or built,
+            when the work in loaded chunks runs low the bot goes to load the next ones first. While `Build.stream_actions` is still diffing
+            the loaded chunks it takes what is there so far
+            """
+            if not build.producing:
+                build.diff_loaded()
+            actions = self.loaded_actions(build)
+            while build.undiffed and not build.producing and (not actions or len(build.actions) <= self.prefetch_threshold):
+                if not self.prefetch(build):
+                    break
+                actions = self.loaded_actions(build)
+            return actions
+        
+        def shared_build(self, file, plan: BuildPlan):
+            with self.console.status("[bold]Loading schematic...\n") as status:
+                schematic = self.load_schematic(file)
+                at = Vec3(*plan.at)
+                status.update("[bold]Generating actions...\n")
+                build_file = self.Build(schematic, self.bot.world, at, loaded=self.loaded_columns)
+                build_file.plan = plan
+                plan.add_positions(build_file.actions)
+                plan.join(self.bot.username)
+                status.update(f"[bold]Joined shared build with {len(plan.bots)} bots\n")
+                self.run_build(build_file, status)
+                print(f"{self.bot.username} is done with its part: {plan.progress()}")
+        
         def builder(self, build: Build, actions, status):
+            """
+            Builds the available actions closest first. Actions become available in dependency order (see `Build.get_dependencies`),
+            failed ones are retried up to `self.max_retries` times once nothing else is left
+            """
+            diffed, build.metrics = build.metrics, self.metrics
+            if diffed is not self.metrics:
+                self.metrics.count("bridge_calls", diffed.counters.get("bridge_calls", 0))
             layer = 1
-            while len(build.actions) > 0:
+            while len(build.actions) > 0 or len(build.error_actions) > 0 or len(build.undiffed) > 0 or build.producing:
+                action = None # the action being built, for the error handling below
                 try:
                     
                     
-
+                    
                     if len(actions) == 0:
                         status.update("[bold]Ran out of actions. Getting some new ones!\n")
-                        actions = build.get_available_actions()
+                        with self.metrics.timer("selection"):
+                            actions = self.available_actions(build)
+                            self.sort_by_distance(actions, self.bot_position())
+                        with self.metrics.timer("provision"):
+                            self.provision(build, actions)
                         layer += 1
+                        if len(actions) == 0 and build.producing:
+                            status.update("[bold]Waiting for actions...\n")
+                            build.wait_for_actions(1)
+                            continue
+                        if len(actions) == 0:
+                            # nothing is ready: retry failed placements, then break up dependency cycles
+                            retrying = build.retry_errors(self.max_retries)
+                            self.metrics.count("retries", retrying)
+                            if retrying == 0 and build.graph.release_blocked() == 0:
+                                break
+                            continue
                         status.update(f"[bold]{len(actions)} available actions\n")
                         
-
                     
-                    def distance_squared(p1, p2):
-                        return (p1.x - p2.x) ** 2 + (p1.y - p2.y) ** 2 + (p1.z - p2.z) ** 2
-
-                    # Assuming bot.entity.position is also a Vec3 object
-                    actions.sort(key=lambda a: distance_squared(Vec3(a['pos'].x + 0.5, a['pos'].y + 0.5, a['pos'].z + 0.5), self.bot.entity.position))
-
+                    with self.metrics.timer("selection"):
+                        self.sort_by_distance(actions, self.bot_position())
+                    
                     action = actions[0]
-
+                    if build.plan and not build.plan.claim(self.bot.username, action['xyz']):
+                        actions.remove(action) # another bot is on it
+                        continue
+                    
                     
                     
                     status.update(f"[bold]Building schematic! |{len(actions)} for layer {layer}| |{len(build.actions)}| errors: {len(build.error_actions)}\n")
                     
                     if action["type"] == "place":
-
-                        item = build.get_item_for_state(action["state"])
-                        # try:
-                        #     print(f"Selecting {item.displayName}")
-                        # except:
-                        #     print(f"Got an error while trying to place block at {action['pos']}")
-                        #     continue
-                        
-                        properties = build.properties[action["state"]]
-                        half = properties["half"] if "half" in properties else properties["type"]
-
-                        faces = build.get_possible_directions(action["state"], action["pos"])
-
-                        for face in faces:
-                            block = self.bot.bot.blockAt(action["pos"].plus(face))
-
-                        facing_data = build.get_facing(action["state"], properties["facing"])
-                        facing = facing_data["facing"]
-                        is3D = facing_data["is3D"]
                         try:
-                            goal = self.bot.goals.GoalPlaceBlock(action["pos"], self.bot.world, {
-                                "faces": faces,
-                                "facing": facing,
-                                "facing3D": is3D,
-                                "half": half
-                            })
+                            goal = self.make_goal(build, action)
                         except:
-                            try:
-                                actions.remove(action)
-                            except:
-                                pass
-                            build.remove_action(action)
-                            build.error_actions.append(action)
-                            print(f"Got an error while trying to place block at {action['pos']}")
+                            self.action_failed(build, actions, action, "no goal")
                             continue
                         
-                        max_loops = 23
+                        before = self.bot_position()
+                        started = time.perf_counter()
+                        with self.metrics.timer("pathfinding"):
+                            self.bot.bot.pathfinder.goto(goal, timeout=1000)
+                        walked = sqrt(sum((a - b) ** 2 for a, b in zip(before, self.bot_position())))
+                        if walked > 1:
+                            self.record_latency("walk", (time.perf_counter() - started) / walked)
                         
+                        with self.metrics.timer("verification"):
+                            faceAndRef = goal.getFaceAndRef(self.eye_position())
+                        if not faceAndRef:
+                            self.action_failed(build, actions, action, "no face in reach")
+                            continue
                         
-                        # if not goal.isEnd(self.bot.entity.position.floored()):
-                        #     print("path 1")
-                        #     # mcbot.pathfinder.setMovements(mcbot.movements)
-                        #     while True:
-                        #         print("path 2")
-                        #         max_loops += 1
-                        #         if max_loops == 23:
-                        #             break
-                        #         try:
-                        
-                        self.bot.bot.pathfinder.goto(goal, timeout=1000)
-                            #         break
-                            #     except Exception as e:
-                            #         print(e)
-                            #         time.sleep(1)
-                            #         continue
-                            # if max_loops == 23:
-                            #     actions.remove(action)
-                            #     build.remove_action(action)
-                            #     print(f"Got an error while trying to place block at {action['pos']}")
-                            #     continue
                         try:
-                            self.equip_item(item.id) # equip after pathfinder
+                            self.place_action(build, action, faceAndRef)
                         except Exception as e:
                             print(e)
+                            self.action_failed(build, actions, action, type(e).__name__)
                             continue
-                        # TODO: faceAndRef = goal.get_face_and_ref(mcbot.entity.position.offset(0, 1.6, 0))
-                        
-                        faceAndRef = goal.getFaceAndRef(self.bot.bot.entity.position.floored().offset(0.5, 1.6, 0.5))
-                        if not faceAndRef:
-                            try:
-                                actions.remove(action)
-                            except:
-                                pass
-                            build.remove_action(action)
-                            build.error_actions.append(action)
-                            print(f"Got an error while trying to place block at {action['pos']}")
-                            continue
-                                
-                        self.bot.bot.lookAt(faceAndRef.to, True)
-                        
-                        refBlock = self.bot.bot.blockAt(faceAndRef.ref)
-                        sneak = False
-                        if dict(interactable).get(refBlock.name) != None:
-                            sneak = True
-                        
-                        try:
-                            delta = faceAndRef.to.minus(faceAndRef.ref)
-                        except:
-                            delta = Vec3(0.5, 0.5, 0.5)
-                        
-
-                        
-                        if sneak: 
-                            self.bot.set_control_state("sneak", True)
-                        
+                        self.metrics.count("placed")
+                    
+                    elif action["type"] == "dig":
+                        x, y, z = action["xyz"]
+                        with self.metrics.timer("pathfinding"):
+                            self.bot.bot.pathfinder.goto(self.bot.goals.GoalBreakBlock(x, y, z, self.bot.bot), timeout=1000)
                         try:
-                            self.bot.bot.placeBlock(refBlock, faceAndRef.face.scaled(-1))
+                            broken = self.dig_action(action)
                         except Exception as e:
                             print(e)
-                            try:
-                                actions.remove(action)
-                            except:
-                                pass
-                            build.remove_action(action)
-                            build.error_actions.append(action)
-                            print(f"Got an error while trying to place block at {action['pos']}")
+                            self.action_failed(build, actions, action, type(e).__name__)
                             continue
-
-                        if sneak: 
-                            self.bot.set_control_state("sneak", False)
-                    
-                        block = self.bot.bot.world.getBlock(action["pos"])
-                        if block.stateId != action["state"]:
-                            pass
-                    
+                        if not broken:
+                            self.action_failed(build, actions, action, "not broken")
+                            continue
+                        self.metrics.count("dug")
                     
-
-                    try:
-                        actions.remove(action)
-                    except:
-                        pass
-                    build.remove_action(action)
-                except Exception as e:
-                    print(e)
                     try:
                         actions.remove(action)
                     except:
                         pass
                     build.remove_action(action)
-                    build.error_actions.append(action)
-                    print(f"GOT A BIG ERROR {action['pos']}")
-                    continue
-            while len(build.error_actions) > 0:
-                actions = build.error_actions
-                try:
-                    
-                    
-
-                    if len(actions) == 0:
-                        status.update("[bold]Ran out of actions. Getting some new ones!\n")
-                        actions = build.get_available_actions()
-                        layer += 1
-                        status.update(f"[bold]{len(actions)} available actions\n")
-                        
-
-                    
-                    def distance_squared(p1, p2):
-                        return (p1.x - p2.x) ** 2 + (p1.y - p2.y) ** 2 + (p1.z - p2.z) ** 2
-
-                    # Assuming bot.entity.position is also a Vec3 object
-                    actions.sort(key=lambda a: distance_squared(Vec3(a['pos'].x + 0.5, a['pos'].y + 0.5, a['pos'].z + 0.5), self.bot.entity.position))
-
-                    action = actions[0]
-
-                    
+                    action = None # done, errors from here on aren't about it
                     
-                    status.update(f"[bold]Building schematic! |{len(actions)} for layer {layer}| |{len(build.actions)}|\n")
-                    
-                    if action["type"] == "place":
-                        try:
-                            item = build.get_item_for_state(action["state"])
-                            # try:
-                            #     print(f"Selecting {item.displayName}")
-                            # except:
-                            #     print(f"Got an error while trying to place block at {action['pos']}")
-                            #     continue
-                            
-                            properties = build.properties[action["state"]]
-                            half = properties["half"] if "half" in properties else properties["type"]
-
-                            faces = build.get_possible_directions(action["state"], action["pos"])
-
-                            for face in faces:
-                                block = self.bot.bot.blockAt(action["pos"].plus(face))
-                            try:
-                                facing_data = build.get_facing(action["state"], properties["facing"])
-                                facing = facing_data["facing"]
-                                is3D = facing_data["is3D"]
-                            except:
-                                try:
-                                    actions.remove(action)
-                                except:
-                                    pass
-                                build.remove_action(action)
-                                build.error_actions.append(action)
-                                print(f"Got an error while trying to place block at {action['pos']}")
-                                continue
-                            try:
-                                goal = self.bot.goals.GoalPlaceBlock(action["pos"], self.bot.world, {
-                                    "faces": faces,
-                                    "facing": facing,
-                                    "facing3D": is3D,
-                                    "half": half
-                                })
-                            except:
-                                try:
-                                    actions.remove(action)
-                                except:
-                                    pass
-                                build.remove_action(action)
-                                build.error_actions.append(action)
-                                print(f"Got an error while trying to place block at {action['pos']}")
-                                continue
-                            
-                            max_loops = 23
-                            
-                            
-                            # if not goal.isEnd(self.bot.entity.position.floored()):
-                            #     print("path 1")
-                            #     # mcbot.pathfinder.setMovements(mcbot.movements)
-                            #     while True:
-                            #         print("path 2")
-                            #         max_loops += 1
-                            #         if max_loops == 23:
-                            #             break
-                            #         try:
-                            while not self.bot.bot.entity.onGround:
-                                time.sleep(1)
-                            try:
-                                self.bot.bot.pathfinder.goto(goal)
-                            except:
-                                try:
-                                    actions.remove(action)
-                                except:
-                                    pass
-                                build.remove_action(action)
-                                build.error_actions.append(action)
-                                print(f"Got an error while trying to place block at {action['pos']}")
-                                continue
-                                #         break
-                                #     except Exception as e:
-                                #         print(e)
-                                #         time.sleep(1)
-                                #         continue
-                                # if max_loops == 23:
-                                #     actions.remove(action)
-                                #     build.remove_action(action)
-                                #     print(f"Got an error while trying to place block at {action['pos']}")
-                                #     continue
-                            try:
-                                self.equip_item(item.id) # equip after pathfinder
-                            except Exception as e:
-                                print(e)
-                                continue
-                            # TODO: faceAndRef = goal.get_face_and_ref(mcbot.entity.position.offset(0, 1.6, 0))
-                            
-                            faceAndRef = goal.getFaceAndRef(self.bot.bot.entity.position.floored().offset(0.5, 1.6, 0.5))
-                            if not faceAndRef:
-                                try:
-                                    actions.remove(action)
-                                except:
-                                    pass
-                                build.remove_action(action)
-                                build.error_actions.append(action)
-                                print(f"Got an error while trying to place block at {action['pos']}")
-                                continue
-                                    
-                            self.bot.bot.lookAt(faceAndRef.to, True)
-                            
-                            refBlock = self.bot.bot.blockAt(faceAndRef.ref)
-                            sneak = False
-                            try:
-                                if dict(interactable).get(refBlock.name) != None:
-                                    sneak = True
-                            except:
-                                pass
-                            try:
-                                delta = faceAndRef.to.minus(faceAndRef.ref)
-                            except:
-                                delta = Vec3(0.5, 0.5, 0.5)
-                            
-                            print(delta)
-                            
-                            if sneak: 
-                                self.bot.set_control_state("sneak", True)
-                            
-                            try:
-                                self.bot.bot.placeBlock(refBlock, faceAndRef.face.scaled(-1))
-                            except Exception as e:
-                                print(e)
-                                try:
-                                    actions.remove(action)
-                                except:
-                                    pass
-                                build.remove_action(action)
-                                build.error_actions.append(action)
-                                print(f"Got an error while trying to place block at {action['pos']}")
-                                continue
-
-                            if sneak: 
-                                self.bot.set_control_state("sneak", False)
-                        
-                            block = self.bot.bot.world.getBlock(action["pos"])
-                        except:
-                            try:
-                                actions.remove(action)
-                            except:
-                                pass
-                            build.error_actions.append(action)
-                            build.remove_action(action)
-                            time.sleep(0.1)
-                        
-                    
-                    
-
-                    try:
-                        actions.remove(action)
-                    except:
-                        pass
-                    build.remove_action(action)
-                    time.sleep(0.1)
+                    if self.multi_place:
+                        self.place_within_reach(build, actions, status)
                 except Exception as e:
                     print(e)
-                    try:
-                        actions.remove(action)
-                    except:
-                        pass
-                    build.remove_action(action)
-                    build.error_actions.append(action)
+                    if action is None:
+                        self.metrics.error(type(e).__name__)
+                        continue
+                    self.action_failed(build, actions, action, type(e).__name__)
                     print(f"GOT A BIG ERROR {action['pos']}")
                     continue
+            if build.checkpoint:
+                build.checkpoint.flush()
+            self.metrics.dump()
+            left, failed = list(build.actions), [action['xyz'] for action in build.error_actions]
+            if build.plan:
+                # the other bots' positions are theirs to report
+                name = self.bot.username
+                mine = lambda xyz: build.plan.owns(name, xyz) and not build.plan.is_done(xyz)
+                left, failed = [xyz for xyz in left if mine(xyz)], [xyz for xyz in failed if mine(xyz)]
+            if len(left) > 0 or len(failed) > 0:
+                print(f"Could not build {len(left)} blocks, {len(failed)} failed {self.max_retries} times")
+            if len(build.undiffed) > 0:
+                print(f"Could not load {len(build.undiffed)} chunks of the build")
                 
         
         
+        def load_schematic(self, file):
+            "Reads .schem, .schematic and .litematic files in python, anything else goes through prismarine-schematic"
+            if file.endswith(('.schem', '.schematic', '.litematic')):
+                return self.PythonSchematic(read_schematic(file), self.bot.bot.version)
+            return Schematic.read(fs.readFile(path.resolve(f'{file}')), self.bot.bot.version)
+        
+        def estimate(self, file, at=None, against_world=False):
+            """
+            Estimates building `file` at `at` (the bot's position by default) without placing a block, see `Build.estimate`.
+            Uses the latencies measured by earlier builds
+            """
+            schematic = self.load_schematic(file)
+            if at is None:
+                at = self.bot.entity.position.floored()
+            build = self.Build(schematic, self.bot.world, at, diff=False)
+            return build.estimate(self.latencies, self.reach, against_world)
+        
+        def map_origin(self, position):
+            "Where map art has to start so the image lines up with the map grid: the north west corner of the map `position` is in, one row further north for the reference row"
+            x = (position.x + 64) // MAP_SIZE * MAP_SIZE - 64
+            z = (position.z + 64) // MAP_SIZE * MAP_SIZE - 64
+            return Vec3(x, position.y, z - 1)
+        
+        def new_checkpoint(self, file, schematic, at):
+            start = at.plus(schematic.offset)
+            size = schematic.size
+            return BuildCheckpoint(f"{file}.checkpoint", file_hash(file), (at.x, at.y, at.z), (start.x, start.y, start.z), (size.x, size.y, size.z))
+        
+        def run_build(self, build: Build, status, mode=None):
+            self.metrics = BuildMetrics(self.metrics_path, self.metrics_interval)
+            self.creative = self.bot.bot.game.gameMode == "creative"
+            self.hotbar.clear() # whatever was provisioned before may be gone
+            self.equipped_id = None
+            self.bot.movements.digCost = 10
+
+            self.bot.movements.maxDropDown = 256
+            
+
+            self.bot.pathfinder.searchRadius = 100
+            self.bot.movements.scafoldingBlocks.push(self.bot.bot.registry.itemsByName.dirt.id)
+            self.bot.movements.canPlace = False
+            if (mode or self.build_mode) == "command":
+                self.command_build(build, status)
+            actions = self.available_actions(build)
+            self.sort_by_distance(actions, self.bot_position())
+            self.provision(build, actions)
+            status.update(f"[bold]{len(actions)} available actions\n")
+            
+            self.builder(build=build, actions=actions, status=status)
+        
+        def track_columns(self):
+            """
+            Keeps `loaded_columns` up to date from the chunk load and unload events, starting from the columns loaded already,
+            so the builder never has to ask the world chunk by chunk
+            """
+            @self.bot.on('chunkColumnLoad')
+            def chunk_column_load(bot, point):
+                self.loaded_columns.add((int(point.x) >> 4, int(point.z) >> 4))
+            
+            @self.bot.on('chunkColumnUnload')
+            def chunk_column_unload(bot, point):
+                self.loaded_columns.discard((int(point.x) >> 4, int(point.z) >> 4))
+            
+            for column in self.bot.world.getColumns():
+                self.loaded_columns.add((int(column.chunkX), int(column.chunkZ)))
+        
         def start(self, file=""):
-            @self.bot.on('build_schematic')
-            def build_scematic(bot, file):
+            self.track_columns()
+            
+            @self.bot.on('build_schematic', executor="thread")
+            def build_scematic(bot, file, mode=None):
                 with self.console.status("[bold]Loading schematic...\n") as status:
                         
                     os.environ["REQ_TIMEOUT"] = f"{self.bot.check_timeout_interval}"
 
                     
-                    schematic = Schematic.read(fs.readFile(path.resolve(f'{file}')), bot.version)
+                    schematic = self.load_schematic(file)
                     # while not mcbot.bot.entity.onGround:
                     #   wait(100)
 
                     at = self.bot.entity.position.floored()
                     print(f'Building at {at.x, at.y, at.z}')
                     status.update("[bold]Generating actions...\n")
-                    build_file = self.Build(schematic, bot.world, at)
-                    status.update("[bold]Generarated actions\n")
-                    self.bot.movements.digCost = 10
-
-                    self.bot.movements.maxDropDown = 256
-                    
-
-                    self.bot.pathfinder.searchRadius = 100
-                    self.bot.movements.scafoldingBlocks.push(self.bot.bot.registry.itemsByName.dirt.id)
-                    self.bot.movements.canPlace = False
-                    actions = build_file.get_available_actions()
-                    status.update(f"[bold]{len(actions)} available actions\n")
-                    
-                    
-                    
-                    
-                    print(os.environ["REQ_TIMEOUT"])
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(self.builder(build=build_file, actions=actions, status=status))
-                    # self.builder(build=build_file, actions=actions, status=status)
-                    # task = asyncio.create_task(self.builder(build=build_file, actions=actions, status=status))
-                    # await task
-                    # _thread = threading.Thread(target=between_callback, args=("some text"))
-                    # _thread.start()
-            
-                
-
-
-                
-        
-        
-                     
-        
+                    build_file = self.Build(schematic, bot.world, at, checkpoint=self.new_checkpoint(file, schematic, at), stream=True, loaded=self.loaded_columns)
+                    self.run_build(build_file, status, mode)
             
+            @self.bot.on('build_estimate')
+            def build_estimate(bot, file, against_world=False, output=None):
+                """
+                Prints the materials, action counts and time estimate of building `file` here as json, and writes it to `output` if given
+                """
+                with self.console.status("[bold]Estimating...\n"):
+                    estimate = self.estimate(file, against_world=against_world)
+                if output:
+                    with open(output, "w") as f:
+                        json.dump(estimate, f, indent=4)
+                self.console.print_json(data=estimate)
+                return estimate
             
+            @self.bot.on('build_map_art', executor="thread")
+            def build_map_art(bot, image, maps=(1, 1), dither=0.0, staircase=False, mode=None):
+                """
+                Builds an image as map art of `maps` (wide, high) maps, lined up with the map grid the bot stands in (see `lodestone.mapart`)
+                """
+                with self.console.status("[bold]Making map art...\n") as status:
+                    os.environ["REQ_TIMEOUT"] = f"{self.bot.check_timeout_interval}"
+                    
+                    schematic = self.PythonSchematic(image_to_schematic(image, self.bot.bot.version, maps, dither, staircase), self.bot.bot.version)
+                    at = self.map_origin(self.bot.entity.position.floored())
+                    print(f'Building map art at {at.x, at.y, at.z}')
+                    status.update("[bold]Generating actions...\n")
+                    build_file = self.Build(schematic, bot.world, at, stream=True, loaded=self.loaded_columns)
+                    self.run_build(build_file, status, mode)
             
+            @self.bot.on('build_schematic_shared', executor="thread")
+            def build_schematic_shared(bot, file):
+                """
+                Builds a schematic together with every other bot that gets this event for the same file.
+                The build is placed at the position of the first bot, the others join in wherever they are. Once every bot left the plan is dropped
+                """
+                with self.plans_lock:
+                    plan = self.plans.setdefault(file, BuildPlan())
+                    if plan.at is None:
+                        at = self.bot.entity.position.floored()
+                        plan.at = (at.x, at.y, at.z)
+                    plan.join(self.bot.username) # counts as a member while loading so the plan isn't dropped under it
+                try:
+                    self.shared_build(file, plan)
+                finally:
+                    with self.plans_lock:
+                        # the next build of this file starts over at a new position
+                        if plan.leave(self.bot.username) and self.plans.get(file) is plan:
+                            del self.plans[file]
             
-        
+            @self.bot.on('resume_schematic', executor="thread")
+            def resume_schematic(bot, file, mode=None):
+                with self.console.status("[bold]Loading checkpoint...\n") as status:
+                    os.environ["REQ_TIMEOUT"] = f"{self.bot.check_timeout_interval}"
+                    
+                    checkpoint = BuildCheckpoint.load(f"{file}.checkpoint")
+                    if checkpoint is None:
+                        print(f"No checkpoint found for {file}, start it with build_schematic")
+                        return
+                    if checkpoint.schematic_hash != file_hash(file):
+                        print(f"{file} changed since the checkpoint was made, start it again with build_schematic")
+                        return
+                    
+                    schematic = self.load_schematic(file)
+                    at = Vec3(*checkpoint.at)
+                    chunks = checkpoint.incomplete_chunks()
+                    print(f'Resuming at {checkpoint.at}')
+                    status.update(f"[bold]Rediffing {len(chunks)} unfinished chunks...\n")
+                    build_file = self.Build(schematic, bot.world, at, checkpoint=checkpoint, chunks=chunks, stream=True, loaded=self.loaded_columns)
+                    self.run_build(build_file, status, mode)
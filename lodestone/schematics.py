@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "lodestone", "schematics")
+
+TAG_END, TAG_BYTE, TAG_SHORT, TAG_INT, TAG_LONG, TAG_FLOAT, TAG_DOUBLE, TAG_BYTE_ARRAY, TAG_STRING, TAG_LIST, TAG_COMPOUND, TAG_INT_ARRAY, TAG_LONG_ARRAY = range(13)
+
+class NBTReader:
+    """
+    Reads NBT straight from a (decompressing) stream. Byte, int and long arrays are read in one go into numpy arrays
+    """
+    _scalars = {
+        TAG_BYTE: struct.Struct(">b"),
+        TAG_SHORT: struct.Struct(">h"),
+        TAG_INT: struct.Struct(">i"),
+        TAG_LONG: struct.Struct(">q"),
+        TAG_FLOAT: struct.Struct(">f"),
+        TAG_DOUBLE: struct.Struct(">d"),
+    }
+    _arrays = {
+        TAG_BYTE_ARRAY: np.dtype(">i1"),
+        TAG_INT_ARRAY: np.dtype(">i4"),
+        TAG_LONG_ARRAY: np.dtype(">i8"),
+    }
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        if len(data) < size:
+            raise EOFError("NBT data ended early")
+        return data
+
+    def read_root(self):
+        "Returns the name and the payload of the root tag"
+        tag = self.read(1)[0]
+        if tag != TAG_COMPOUND:
+            raise ValueError(f"Expected a compound as the root tag, got tag type {tag}")
+        return self.read_string(), self.read_payload(tag)
+
+    def read_string(self) -> str:
+        (length,) = struct.unpack(">H", self.read(2))
+        return self.read(length).decode("utf-8", errors="replace")
+
+    def read_payload(self, tag: int):
+        if tag in self._scalars:
+            scalar = self._scalars[tag]
+            return scalar.unpack(self.read(scalar.size))[0]
+        if tag in self._arrays:
+            dtype = self._arrays[tag]
+            (length,) = struct.unpack(">i", self.read(4))
+            return np.frombuffer(self.read(length * dtype.itemsize), dtype=dtype)
+        if tag == TAG_STRING:
+            return self.read_string()
+        if tag == TAG_LIST:
+            element = self.read(1)[0]
+            (length,) = struct.unpack(">i", self.read(4))
+            return [self.read_payload(element) for _ in range(length)]
+        if tag == TAG_COMPOUND:
+            compound = {}
+            while True:
+                child = self.read(1)[0]
+                if child == TAG_END:
+                    return compound
+                name = self.read_string()
+                compound[name] = self.read_payload(child)
+        raise ValueError(f"Unknown NBT tag type {tag}")
+
+def read_nbt(file: str):
+    "Reads a (gzipped) NBT file, decompressing while parsing"
+    with open(file, "rb") as raw:
+        compressed = raw.read(2) == b"\x1f\x8b"
+    stream = gzip.open(file, "rb") if compressed else open(file, "rb")
+    with stream:
+        return NBTReader(stream).read_root()
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    "Decodes a byte array of unsigned LEB128 varints, as used by the Sponge format"
+    data = data.astype(np.uint8, copy=False)
+    if not (data & 0x80).any():
+        return data.astype(np.int32) # every palette index fits in one byte
+    ends = np.flatnonzero((data & 0x80) == 0)
+    data = data[:ends[-1] + 1]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = 7 * (np.arange(len(data)) - starts[group])
+    return np.add.reduceat((data.astype(np.int64) & 0x7F) << shift, starts).astype(np.int32)
+
+def unpack_spanning(longs: np.ndarray, bits: int, count: int) -> np.ndarray:
+    "Unpacks `count` values of `bits` bits from a long array where values may span two longs, as Litematica stores them"
+    words = longs.astype(np.uint64)
+    index = np.arange(count, dtype=np.uint64) * np.uint64(bits)
+    word = index >> np.uint64(6)
+    offset = index & np.uint64(63)
+    values = words[word] >> offset
+    spill = offset + np.uint64(bits) > np.uint64(64)
+    values[spill] |= words[word[spill] + np.uint64(1)] << (np.uint64(64) - offset[spill])
+    return (values & np.uint64((1 << bits) - 1)).astype(np.int32)
+
+def block_state_string(name: str, properties: dict = None) -> str:
+    if not properties:
+        return name
+    return name + "[" + ",".join(f"{key}={value}" for key, value in sorted(properties.items())) + "]"
+
+class Schematic:
+    """
+    A schematic as a numpy volume of palette indices, indexed [y, z, x].
+    `palette` holds block states as strings like `minecraft:oak_stairs[facing=north,half=bottom]`, or `legacy:<id>:<meta>` for MCEdit files
+    """
+    def __init__(self, blocks: np.ndarray, palette: list, offset=(0, 0, 0)):
+        self.blocks = blocks
+        self.palette = palette
+        self.offset = tuple(int(value) for value in offset)
+
+    @property
+    def size(self) -> tuple:
+        "(x, y, z) size of the volume"
+        height, length, width = self.blocks.shape
+        return (width, height, length)
+
+    def __repr__(self):
+        return f"Schematic(size={self.size}, offset={self.offset}, palette={len(self.palette)} states)"
+
+def _we_offset(compound: dict) -> tuple:
+    return tuple(compound.get(f"WEOffset{axis}", 0) for axis in "XYZ")
+
+def _read_sponge(root: dict) -> Schematic:
+    if "Schematic" in root: # version 3 nests everything
+        root = root["Schematic"]
+    width, height, length = (root[key] & 0xFFFF for key in ("Width", "Height", "Length"))
+    if "Blocks" in root: # version 3
+        palette_tag, data = root["Blocks"]["Palette"], root["Blocks"]["Data"]
+    else:
+        palette_tag, data = root["Palette"], root["BlockData"]
+    palette = [None] * (max(palette_tag.values()) + 1)
+    for state, index in palette_tag.items():
+        palette[index] = state
+    palette = [(state if ":" in state.split("[")[0] else "minecraft:" + state) if state else "minecraft:air" for state in palette]
+    blocks = decode_varints(data)[:width * height * length].reshape(height, length, width)
+    return Schematic(blocks, palette, _we_offset(root.get("Metadata", {})))
+
+def _read_mcedit(root: dict) -> Schematic:
+    width, height, length = (root[key] & 0xFFFF for key in ("Width", "Height", "Length"))
+    volume = width * height * length
+    ids = root["Blocks"][:volume].astype(np.uint8).astype(np.int32)
+    if "AddBlocks" in root: # the high 4 bits of the block ids, two per byte with the even index in the low nibble
+        add = root["AddBlocks"].astype(np.uint8)
+        nibbles = np.empty(len(add) * 2, dtype=np.int32)
+        nibbles[0::2] = add & 0x0F
+        nibbles[1::2] = add >> 4
+        ids |= nibbles[:volume] << 8
+    keys = ids << 4 | (root["Data"][:volume].astype(np.uint8) & 0x0F)
+    unique, blocks = np.unique(keys, return_inverse=True)
+    palette = [f"legacy:{key >> 4}:{key & 0x0F}" for key in unique.tolist()]
+    return Schematic(blocks.astype(np.int32).reshape(height, length, width), palette, _we_offset(root))
+
+def _read_litematica(root: dict) -> Schematic:
+    regions = []
+    for region in root["Regions"].values():
+        position = [region["Position"][axis] for axis in "xyz"]
+        size = [region["Size"][axis] for axis in "xyz"]
+        # negative sizes grow the other way from the position
+        start = [p + s + 1 if s < 0 else p for p, s in zip(position, size)]
+        size = [abs(s) for s in size]
+        palette = [block_state_string(entry["Name"], entry.get("Properties")) for entry in region["BlockStatePalette"]]
+        bits = max(2, (len(palette) - 1).bit_length())
+        indices = unpack_spanning(region["BlockStates"], bits, size[0] * size[1] * size[2])
+        regions.append((start, size, palette, indices.reshape(size[1], size[2], size[0])))
+
+    low = [min(start[axis] for start, *_ in regions) for axis in range(3)]
+    high = [max(start[axis] + size[axis] for start, size, *_ in regions) for axis in range(3)]
+    lookup = {"minecraft:air": 0}
+    blocks = np.zeros((high[1] - low[1], high[2] - low[2], high[0] - low[0]), dtype=np.int32)
+    for start, size, region_palette, indices in regions:
+        remap = np.array([lookup.setdefault(state, len(lookup)) for state in region_palette], dtype=np.int32)
+        x, y, z = (start[axis] - low[axis] for axis in range(3))
+        blocks[y:y + size[1], z:z + size[2], x:x + size[0]] = remap[indices]
+    palette = sorted(lookup, key=lookup.get)
+    return Schematic(blocks, palette, (0, 0, 0))
+
+def _cache_key(file: str) -> str:
+    info = os.stat(file)
+    return hashlib.sha1(f"{os.path.abspath(file)}:{info.st_size}:{info.st_mtime_ns}".encode()).hexdigest()
+
+def read_schematic(file: str, cache: bool = True) -> Schematic:
+    """
+    Reads a Sponge `.schem`, MCEdit `.schematic` or Litematica `.litematic` file.
+    With `cache` the volume is stored under `CACHE_DIRECTORY` and memory mapped on the next load of the same (unchanged) file
+    """
+    if cache:
+        key = os.path.join(CACHE_DIRECTORY, _cache_key(file))
+        if os.path.exists(key + ".json") and os.path.exists(key + ".npy"):
+            with open(key + ".json") as f:
+                meta = json.load(f)
+            return Schematic(np.load(key + ".npy", mmap_mode="r"), meta["palette"], meta["offset"])
+
+    _, root = read_nbt(file)
+    if file.endswith(".litematic") or "Regions" in root:
+        schematic = _read_litematica(root)
+    elif isinstance(root.get("Blocks"), np.ndarray):
+        schematic = _read_mcedit(root)
+    else:
+        schematic = _read_sponge(root)
+
+    if cache:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        np.save(key + ".npy", np.ascontiguousarray(schematic.blocks))
+        with open(key + ".json", "w") as f:
+            json.dump({"palette": schematic.palette, "offset": schematic.offset}, f)
+    return schematic
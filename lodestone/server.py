@@ -1,6 +1,5 @@
 from rich.console import Console
 from discord import Embed
-import structlog
 import datetime
 import sys
 import re
@@ -14,10 +13,12 @@ import subprocess
 
 try:
     from utils import send_webhook
+    from logger import logger, pipeline, WebhookSink, daily_thread
 except ImportError:
     from .utils import send_webhook
+    from .logger import logger, pipeline, WebhookSink, daily_thread
 
-logger = structlog.get_logger()
+logger = logger.bind("server")
 
 filestruc = "/"
 if os.name == 'nt':
@@ -85,6 +86,7 @@ class Server:
 
         self.local_max_entities = maxEntities
         self.disable_logs = ls_disable_logs
+        self.logger = logger.bind(source=installPath) # the webhook sink of this server only takes its own records
         self.skip_checks = ls_skip_checks
         self.discord_webhook = ls_discord_webhook
         self.use_discord_forums = ls_use_discord_forums
@@ -127,7 +129,9 @@ class Server:
                     send_webhook(ls_discord_webhook, content="", username="Lodestone", avatar_url="https://github.com/SilkePilon/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed)
                 except Exception as e:
                     print(e)
-                    logger.error(f"Detected that you are using a Forums channel but 'useDiscordForums' is set to False. Please change 'useDiscordForums' to True or provide a webhook url for a text channel.")
+                    self.logger.error(f"Detected that you are using a Forums channel but 'useDiscordForums' is set to False. Please change 'useDiscordForums' to True or provide a webhook url for a text channel.")
+            # server logs go to the same webhook in the background, batched
+            self.webhook_sink = pipeline.add_sink(WebhookSink(ls_discord_webhook, categories=("server",), sources=(installPath,), thread_name=daily_thread if ls_use_discord_forums else None))
 
         self.python_command = self.__check_python_command()
         if not ls_skip_checks:
@@ -151,46 +155,16 @@ class Server:
                 sys.exit(1)
 
     def __logging(self, message, icon="💾", error=False, info=False, warning=False, chat=False, image_url="", console=True, discord=True):
+        "Queues a log message for the console and the discord webhook sinks, see `logger.LogPipeline`"
         if not self.disable_logs:
-            if self.discord_webhook and discord:
-                from discord import Embed
-                color = 0x3498db
-                if error:
-                    color = 0x992d22
-                elif info:
-                    color = 0x3498db
-                elif warning:
-                    color = 0xe67e22
-                elif chat:
-                    color = 0x2ecc71
-                embed = Embed(title="", description=f"**[{icon}] {message}**", color=color)
-                embed.timestamp = datetime.datetime.utcnow()
-                if image_url != "":
-                    embed.set_thumbnail(url=image_url)
-                try:
-                    embed.set_footer(text=f'{self.bot.username}', icon_url=f"https://mc-heads.net/avatar/{self.bot.username}/600.png")
-                except:
-                    embed.set_footer(text='\u200b', icon_url="https://github.com/SilkePilon/Lodestone/blob/main/chestlogo.png?raw=true")
-                if self.use_discord_forums:
-                    today = date.today()
-                    send_webhook(self.discord_webhook, content=f"{today}", thread_name=f"{today}", username="Lodestone", avatar_url="https://github.com/SilkePilon/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed)
-                else:
-                    try:
-                        send_webhook(self.discord_webhook, content=f"", username="Lodestone", avatar_url="https://github.com/SilkePilon/Lodestone/blob/main/chestlogo.png?raw=true", embed=embed)
-                    except Exception as e:
-                        print(e)
-                        logger.error(f"Detected that you are using a Forums channel but 'useDiscordForums' is set to False. Please change 'useDiscordForums' to True or provide a webhook url for a text channel.")
-            if console:
-                if error:
-                    logger.error(f"[{icon}] {message}")
-                elif info:
-                    logger.info(f"[{icon}] {message}")
-                elif warning:
-                    logger.warning(f"[{icon}] {message}")
-                elif chat:
-                    logger.info(f"[{icon}] {message}")
-                else:
-                    logger.info(f"[{icon}] {message}")
+            skip = ()
+            if not console:
+                skip += ("stdout",)
+            if not discord:
+                skip += ("webhook",)
+            level = "error" if error else "warning" if warning else "info"
+            fields = {"image_url": image_url} if image_url else {}
+            self.logger.log(level, f"[{icon}] {message}", skip=skip, **fields)
 
     def __versions_check(self):
         with self.console.status("[bold green]Checking versions..."):
@@ -207,7 +181,7 @@ class Server:
             if int(node_version[:2]) >= 18:
                 pass
             else:
-                logger.warning(f"""
+                self.logger.warning(f"""
                                 Detected node version {node_version[:2]} which isn't supported!
                                 This may cause problems. Please update to node 18 or above!
                                 """)
@@ -0,0 +1,319 @@
+"""
+A simulated world and bot with the parts of the mineflayer API the schematic builder uses, for benchmarks and tests without a server.
+Time is simulated too: every action advances `SimClock` by the cost in `SimBot.costs`
+"""
+import math
+from types import SimpleNamespace
+
+# simulated seconds per action, walking is per block
+DEFAULT_COSTS = {"path": 0.05, "walk": 0.23, "look": 0.05, "place": 0.1, "equip": 0.05, "creative": 0.1, "command": 0.1, "chunk": 0.5, "dig": 0.4}
+
+FULL_BLOCK = [[0, 0, 0, 1, 1, 1]]
+
+def _xyz(pos) -> tuple:
+    return (int(math.floor(pos.x)), int(math.floor(pos.y)), int(math.floor(pos.z)))
+
+class SimVec3:
+    "The part of the vec3 package the builder uses"
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+    def offset(self, dx, dy, dz):
+        return SimVec3(self.x + dx, self.y + dy, self.z + dz)
+
+    def plus(self, other):
+        return self.offset(other.x, other.y, other.z)
+
+    def minus(self, other):
+        return self.offset(-other.x, -other.y, -other.z)
+
+    def scaled(self, scale):
+        return SimVec3(self.x * scale, self.y * scale, self.z * scale)
+
+    scale = scaled
+
+    def floored(self):
+        return SimVec3(*_xyz(self))
+
+    def clone(self):
+        return SimVec3(self.x, self.y, self.z)
+
+    def distanceTo(self, other):
+        return math.sqrt(self.distanceSquared(other))
+
+    def distanceSquared(self, other):
+        return (self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2
+
+    def __repr__(self):
+        return f"({self.x}, {self.y}, {self.z})"
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class _JsList(list):
+    "A list with `push`, for the bits of javascript arrays the builder touches"
+    def push(self, *items):
+        self.extend(items)
+
+class SimWorld:
+    """
+    Block state ids by position. Everything below `ground_y` is `ground_state`, everything else air until placed.
+    With a `view_distance` (in chunks) only the chunks around the bot are loaded, otherwise `getColumnAt` finds every chunk
+    and `getColumns` and the chunk events cover 32 chunks around the bot
+    """
+    def __init__(self, ground_y: int = 0, ground_state: int = 1, view_distance: int = None):
+        self.blocks = {}
+        self.ground_y = ground_y
+        self.ground_state = ground_state
+        self.view_distance = view_distance
+        self.bot = None
+        self.columns = set() # loaded as of the last `update_view`
+        self.intended = lambda xyz: None # the state a placement at a position puts down, see `SimBot.placeBlock`
+
+    def intend(self, states, start):
+        "Placements put down the state of `states` (a [y, z, x] volume starting at `start`) at their position"
+        height, length, width = states.shape
+        def intended(xyz):
+            x, y, z = xyz[0] - start[0], xyz[1] - start[1], xyz[2] - start[2]
+            if 0 <= x < width and 0 <= y < height and 0 <= z < length:
+                return int(states[y, z, x])
+            return None
+        self.intended = intended
+
+    def state_at(self, xyz) -> int:
+        state = self.blocks.get(xyz)
+        if state is None:
+            return self.ground_state if xyz[1] < self.ground_y else 0
+        return state
+
+    def set_state(self, xyz, state: int):
+        self.blocks[xyz] = state
+
+    def getBlockStateId(self, pos):
+        return self.state_at(_xyz(pos))
+
+    def getBlock(self, pos):
+        xyz = _xyz(pos)
+        state = self.state_at(xyz)
+        return SimpleNamespace(stateId=state, type=state, name="air" if state == 0 else "block", position=SimVec3(*xyz),
+                               shapes=FULL_BLOCK if state != 0 else [])
+
+    def getColumnAt(self, pos):
+        if self.view_distance is None or self.bot is None:
+            return True
+        x, _, z = _xyz(self.bot.entity.position)
+        if max(abs((int(pos.x) >> 4) - (x >> 4)), abs((int(pos.z) >> 4) - (z >> 4))) <= self.view_distance:
+            return True
+        return None
+
+    def columns_around_bot(self) -> set:
+        if self.bot is None:
+            return set()
+        x, _, z = _xyz(self.bot.entity.position)
+        distance = 32 if self.view_distance is None else self.view_distance
+        return {(cx, cz) for cx in range((x >> 4) - distance, (x >> 4) + distance + 1) for cz in range((z >> 4) - distance, (z >> 4) + distance + 1)}
+
+    def getColumns(self):
+        return [SimpleNamespace(chunkX=cx, chunkZ=cz) for cx, cz in self.columns_around_bot()]
+
+    def update_view(self):
+        "Emits `chunkColumnLoad` and `chunkColumnUnload` on the bot for the chunks that came into or left the view since the last call"
+        columns = self.columns_around_bot()
+        for cx, cz in self.columns - columns:
+            self.bot.emit("chunkColumnUnload", SimVec3(cx * 16, 0, cz * 16))
+        for cx, cz in columns - self.columns:
+            self.bot.emit("chunkColumnLoad", SimVec3(cx * 16, 0, cz * 16))
+        self.columns = columns
+
+class SimGoals:
+    "Python versions of the mineflayer-pathfinder goals the builder uses"
+    def __init__(self, reach: float = 4.5):
+        self.reach = reach
+
+    def GoalPlaceBlock(self, pos, world, options):
+        return SimpleNamespace(kind="place", pos=pos, world=world, options=options,
+                               getFaceAndRef=lambda eye: self.face_and_ref(pos, world, options, eye))
+
+    def GoalBreakBlock(self, x, y, z, bot, options=None):
+        return SimpleNamespace(kind="break", pos=SimVec3(x, y, z))
+
+    def GoalNearXZ(self, x, z, range):
+        return SimpleNamespace(kind="near_xz", x=x, z=z, range=range)
+
+    def face_and_ref(self, pos, world, options, eye):
+        "The first face in `options['faces']` with a block to place against in reach, like `GoalPlaceBlock.getFaceAndRef`"
+        x, y, z = _xyz(pos)
+        for face in options["faces"]:
+            ref = (x + int(face.x), y + int(face.y), z + int(face.z))
+            if world.state_at(ref) == 0:
+                continue
+            to = SimVec3(x + 0.5 + face.x * 0.5, y + 0.5 + face.y * 0.5, z + 0.5 + face.z * 0.5)
+            if to.distanceTo(eye) <= self.reach:
+                return SimpleNamespace(face=SimVec3(face.x, face.y, face.z), ref=SimVec3(*ref), to=to)
+        return None
+
+class SimPathfinder:
+    def __init__(self, bot):
+        self.bot = bot
+        self.searchRadius = 100
+
+    def goto(self, goal, timeout=None):
+        "Moves the bot next to the goal, costing the path planning plus the straight line walking distance"
+        position = self.bot.entity.position
+        if goal.kind == "near_xz":
+            target = SimVec3(goal.x, position.y, goal.z)
+            keep = goal.range
+        else:
+            target = SimVec3(goal.pos.x + 0.5, goal.pos.y, goal.pos.z + 0.5)
+            keep = self.bot.goals.reach - 1.5
+        distance = position.distanceTo(target)
+        self.bot.clock.advance(self.bot.costs["path"])
+        if distance <= keep:
+            return
+        travel = distance - keep
+        scale = travel / distance
+        self.bot.entity.position = position.offset((target.x - position.x) * scale, (target.y - position.y) * scale, (target.z - position.z) * scale)
+        self.bot.clock.advance(travel * self.bot.costs["walk"])
+        self.bot.world.update_view()
+
+    def setGoal(self, goal, dynamic=False):
+        if goal is not None:
+            self.goto(goal)
+
+class SimMineflayer:
+    "The mineflayer bot (`Bot.bot`) part of `SimBot`"
+    def __init__(self, owner, version: str, registry=None):
+        self.owner = owner
+        self.version = version
+        self.registry = registry
+        self.entity = owner.entity
+        self.pathfinder = SimPathfinder(owner)
+        self.game = SimpleNamespace(gameMode="creative")
+        self.creative = SimpleNamespace(setInventorySlot=self.set_inventory_slot)
+        self.inventory = SimpleNamespace(slots=[None] * 46, items=lambda: [item for item in self.inventory.slots if item is not None],
+                                         firstEmptyInventorySlot=lambda: next((i for i in range(9, 45) if self.inventory.slots[i] is None), None))
+        self.quickBarSlot = 0
+
+    @property
+    def heldItem(self):
+        return self.inventory.slots[36 + self.quickBarSlot]
+
+    def set_inventory_slot(self, slot, item):
+        self.inventory.slots[slot] = SimpleNamespace(type=int(item.type), count=int(item.count)) if item is not None else None
+        self.owner.clock.advance(self.owner.costs["creative"])
+
+    def setQuickBarSlot(self, slot):
+        self.quickBarSlot = slot
+        self.owner.clock.advance(self.owner.costs["equip"])
+
+    def equip(self, item, destination):
+        "Swaps the item into the held hotbar slot"
+        slot = self.inventory.slots.index(item)
+        held = 36 + self.quickBarSlot
+        self.inventory.slots[slot], self.inventory.slots[held] = self.inventory.slots[held], self.inventory.slots[slot]
+        self.owner.clock.advance(self.owner.costs["equip"])
+
+    def lookAt(self, point, force=False):
+        self.owner.clock.advance(self.owner.costs["look"])
+
+    def blockAt(self, pos):
+        return self.owner.world.getBlock(pos)
+
+    def placeBlock(self, reference, face):
+        """
+        Puts down the state `world.intended` gives for the position, after checking there is something to place against,
+        the spot is free, it's in reach and the right item is held
+        """
+        target = _xyz(reference.position.plus(face))
+        world = self.owner.world
+        if world.state_at(_xyz(reference.position)) == 0:
+            raise Exception(f"No block to place against at {reference.position}")
+        if world.state_at(target) != 0:
+            raise Exception(f"Block at {target} is in the way")
+        eye = self.entity.position.offset(0, 1.6, 0)
+        if eye.distanceTo(SimVec3(target[0] + 0.5, target[1] + 0.5, target[2] + 0.5)) > self.owner.goals.reach + 1:
+            raise Exception(f"{target} is out of reach")
+        state = world.intended(target)
+        item = self.owner.item_for_state(state) if state else None
+        if state is None or (item is not None and (self.heldItem is None or self.heldItem.type != item)):
+            raise Exception(f"Holding the wrong item for {target}")
+        world.set_state(target, state)
+        self.owner.clock.advance(self.owner.costs["place"])
+        self.owner.placed += 1
+
+    def dig(self, block, force_look=False):
+        "Breaks a block in reach"
+        eye = self.entity.position.offset(0, 1.6, 0)
+        position = block.position
+        if eye.distanceTo(SimVec3(position.x + 0.5, position.y + 0.5, position.z + 0.5)) > self.owner.goals.reach + 1:
+            raise Exception(f"{position} is out of reach")
+        self.owner.world.set_state(_xyz(position), 0)
+        self.owner.clock.advance(self.owner.costs["dig"])
+
+    def waitForChunksToLoad(self):
+        self.owner.clock.advance(self.owner.costs["chunk"])
+
+    def emit(self, event, *params):
+        self.owner.emit(event, *params)
+
+class SimBot:
+    """
+    Stands in for `lodestone.Bot` with a `SimWorld`. Event handlers registered with `on` get called by `emit` straight away.
+    `item_for_state` maps a state id to the item id placing it, None skips the held item check
+    """
+    def __init__(self, world: SimWorld, version: str = "1.20.1", position=(0, 0, 0), costs: dict = None, registry=None,
+                 item_for_state=None, username: str = "SimBot"):
+        self.world = world
+        world.bot = self
+        self.username = username
+        self.clock = SimClock()
+        self.costs = {**DEFAULT_COSTS, **(costs or {})}
+        self.entity = SimpleNamespace(position=SimVec3(*position))
+        world.columns = world.columns_around_bot() # loaded from the start
+        self.goals = SimGoals()
+        self.item_for_state = item_for_state or (lambda state: None)
+        self.bot = SimMineflayer(self, version, registry)
+        self.pathfinder = self.bot.pathfinder
+        self.movements = SimpleNamespace(digCost=1, maxDropDown=4, canPlace=True, scafoldingBlocks=_JsList())
+        self.check_timeout_interval = 60
+        self.loaded_events = {}
+        self.loaded_plugins = {}
+        self.handlers = {}
+        self.commands = []
+        self.controls = {}
+        self.placed = 0
+
+    @property
+    def inventory(self):
+        return self.bot.inventory
+
+    def on(self, event: str, **options):
+        "Handlers always run inline here, `options` (the executor settings of `Bot.on`) are ignored"
+        def inner(function):
+            self.handlers.setdefault(event, []).append(function)
+        return inner
+
+    def emit(self, event: str, *params):
+        for handler in self.handlers.get(event, []):
+            handler(self, *params)
+
+    def set_control_state(self, control, state):
+        self.controls[control] = state
+
+    def command(self, command: str, *args, priority: str = "high"):
+        self.commands.append((command, *args))
+        self.clock.advance(self.costs["command"])
+
+    def chat(self, message: str):
+        pass
+
+    def wait_for_chat(self, timeout: float = None) -> bool:
+        return True # commands are sent straight away
+
+    def blocks_per_minute(self) -> float:
+        "Placed blocks per simulated minute"
+        return self.placed / self.clock.now * 60 if self.clock.now else 0.0
@@ -0,0 +1,106 @@
+import functools
+import hashlib
+import json
+import os
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "lodestone", "tables")
+TABLES_FORMAT = 1 # bump when `StateTables.compile` changes what it makes
+BUNDLED_TABLES = ("facingData.json", "interactable.json")
+
+def _true(value) -> bool:
+    return value is True or value == "true"
+
+@functools.lru_cache(maxsize=None)
+def facing_data() -> dict:
+    "The bundled facing data by block name"
+    with open(os.path.join(PACKAGE_DIRECTORY, "facingData.json")) as f:
+        return json.load(f)
+
+@functools.lru_cache(maxsize=None)
+def interactable_blocks() -> frozenset:
+    "Names of the blocks that open something when clicked, so placing against them needs sneaking"
+    with open(os.path.join(PACKAGE_DIRECTORY, "interactable.json")) as f:
+        return frozenset(json.load(f))
+
+@functools.lru_cache(maxsize=None)
+def tables_key() -> str:
+    "Identifies the compiled tables: the format and a hash of the bundled tables they are compiled from"
+    digest = hashlib.sha1(f"{TABLES_FORMAT}".encode())
+    for name in BUNDLED_TABLES:
+        with open(os.path.join(PACKAGE_DIRECTORY, name), "rb") as f:
+            digest.update(f.read())
+    return f"v{TABLES_FORMAT}-{digest.hexdigest()[:12]}"
+
+class StateTables:
+    """
+    Facing and interactable data by block state id for one version, compiled from the bundled tables.
+    Compiled once from the minecraft-data block list and cached on disk, so lookups are plain list indexing
+    """
+    _loaded = {}
+
+    def __init__(self, entries: list, ranges: list):
+        self.entries = entries
+        self.ranges = ranges
+        size = max((end for _, end, _, _ in ranges), default=-1) + 1
+        self.facing = [None] * size
+        self.interactable = bytearray(size)
+        for start, end, entry, interactable in ranges:
+            for state_id in range(start, end + 1):
+                self.facing[state_id] = entries[entry] if entry >= 0 else None
+                self.interactable[state_id] = interactable
+
+    def get_facing(self, state_id: int):
+        "The facing entry (`is3D`, `faceDirection`, `inverted`) of a state, or None"
+        return self.facing[state_id] if 0 <= state_id < len(self.facing) else None
+
+    def is_interactable(self, state_id: int) -> bool:
+        return 0 <= state_id < len(self.interactable) and bool(self.interactable[state_id])
+
+    @staticmethod
+    def compile(blocks: list) -> tuple:
+        """
+        Compiles the entries and state id ranges from a minecraft-data `blocksArray`.
+        Versions before 1.13 have no state ids, there it's `id << 4 | metadata` like prismarine-block
+        """
+        facing = facing_data()
+        interactable = interactable_blocks()
+        entries = []
+        ranges = []
+        for block in blocks:
+            name = block["name"]
+            data = facing.get(name)
+            if data is None and name not in interactable:
+                continue
+            entry = -1
+            if data is not None:
+                data = {"is3D": _true(data["is3D"]), "faceDirection": _true(data["faceDirection"]), "inverted": _true(data["inverted"])}
+                if data not in entries:
+                    entries.append(data)
+                entry = entries.index(data)
+            start = block.get("minStateId", block["id"] << 4)
+            end = block.get("maxStateId", block["id"] << 4 | 15)
+            ranges.append([start, end, entry, int(name in interactable)])
+        return entries, ranges
+
+    @classmethod
+    def for_version(cls, version: str, blocks=None):
+        """
+        The tables of a version. Loaded from the disk cache, or compiled from `blocks()` (returning the minecraft-data `blocksArray`) the first time.
+        The cache is per `tables_key`, so changed bundled tables or compile logic are compiled again
+        """
+        if version in cls._loaded:
+            return cls._loaded[version]
+        cached = os.path.join(CACHE_DIRECTORY, f"{version}-{tables_key()}.json")
+        if os.path.exists(cached):
+            with open(cached) as f:
+                data = json.load(f)
+            entries, ranges = data["entries"], data["ranges"]
+        else:
+            entries, ranges = cls.compile(blocks())
+            os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+            with open(cached + ".tmp", "w") as f:
+                json.dump({"entries": entries, "ranges": ranges}, f)
+            os.replace(cached + ".tmp", cached)
+        cls._loaded[version] = cls(entries, ranges)
+        return cls._loaded[version]
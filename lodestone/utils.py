@@ -1,8 +1,12 @@
-import discord
-import aiohttp
 import structlog
 from rich.console import Console
 import asyncio
+
+try:
+    from webhook import webhook_dispatcher
+except ImportError:
+    from .webhook import webhook_dispatcher
+
 logger = structlog.get_logger()
 console = Console()
 
@@ -97,8 +101,8 @@ def cprop(cap = "camel", proxy_name = ""):
     return decorator
 
 def send_webhook(webhook, *args, **kwargs):
-    async def send_webhook__(webhook, *args, **kwargs):
-        async with aiohttp.ClientSession() as session:
-            await discord.Webhook.from_url(webhook, session=session).send(*args, **kwargs)
-
-    return asyncio.run(send_webhook__(webhook, *args, **kwargs))
+    """
+    Queues a webhook message (content, embed, embeds, username, avatar_url, thread_name) and returns straight away,
+    see `webhook.WebhookDispatcher`
+    """
+    return webhook_dispatcher().send(webhook, *args, **kwargs)
@@ -0,0 +1,173 @@
+"""
+Background Discord webhook sending. Messages are queued per webhook and posted from one asyncio loop in a daemon thread,
+with a persistent aiohttp session per webhook, up to 10 embeds per request and Discord's rate limits respected,
+so sending a log line never waits on the network
+"""
+import asyncio
+import collections
+import functools
+import threading
+
+import aiohttp
+
+MAX_EMBEDS = 10 # per webhook request, Discord's limit
+
+class _WebhookQueue:
+    def __init__(self):
+        self.messages = collections.deque()
+        self.wake = asyncio.Event()
+        self.sending = 0
+
+class WebhookDispatcher:
+    """
+    Posts webhook messages in the background. Every webhook url gets its own queue of at most `max_queue` messages (the oldest
+    is dropped when it's full), session and worker. Queued embed-only messages with the same username, avatar and thread
+    are merged into one request. 429s wait `retry_after` and retry, other failures retry up to `max_retries` times.
+    Messages with a `thread_name` (forum channels) create the thread once and post the following ones into it
+    """
+    def __init__(self, max_queue: int = 1000, max_retries: int = 5, timeout: float = 10):
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.queues = {}
+        self.threads = {} # (url, thread name) -> thread id
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.counters = {"queued": 0, "sent": 0, "requests": 0, "dropped": 0, "rate_limited": 0, "retries": 0, "errors": 0}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="webhooks", daemon=True)
+        self.thread.start()
+
+    def send(self, url: str, content: str = "", *, embed=None, embeds: list = None, username: str = None, avatar_url: str = None,
+             thread_name: str = None) -> bool:
+        "Queues a message, embeds can be discord.py `Embed`s or dicts. Returns False if an older message had to be dropped for it"
+        embeds = [*(embeds or ()), *([embed] if embed is not None else [])]
+        message = {
+            "content": content or "",
+            "embeds": [item.to_dict() if hasattr(item, "to_dict") else item for item in embeds],
+            "username": username,
+            "avatar_url": avatar_url,
+            "thread_name": thread_name,
+        }
+        dropped = False
+        with self.lock:
+            queue = self.queues.get(url)
+            if queue is None:
+                queue = self.queues[url] = _WebhookQueue()
+                asyncio.run_coroutine_threadsafe(self.__work(url, queue), self.loop)
+            if len(queue.messages) >= self.max_queue:
+                queue.messages.popleft()
+                self.counters["dropped"] += 1
+                dropped = True
+            queue.messages.append(message)
+            self.counters["queued"] += 1
+        self.loop.call_soon_threadsafe(queue.wake.set)
+        return not dropped
+
+    def __take_batch(self, queue: _WebhookQueue) -> list:
+        "The next messages to post together: the first one plus following embed-only messages going to the same place"
+        first = queue.messages.popleft()
+        batch = [first]
+        key = (first["username"], first["avatar_url"], first["thread_name"])
+        embeds = len(first["embeds"])
+        while queue.messages and not first["content"] and first["embeds"]:
+            following = queue.messages[0]
+            if following["content"] or not following["embeds"] or (following["username"], following["avatar_url"], following["thread_name"]) != key:
+                break
+            if embeds + len(following["embeds"]) > MAX_EMBEDS:
+                break
+            embeds += len(following["embeds"])
+            batch.append(queue.messages.popleft())
+        return batch
+
+    async def __work(self, url: str, queue: _WebhookQueue):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            while True:
+                await queue.wake.wait()
+                queue.wake.clear()
+                while True:
+                    with self.lock:
+                        if not queue.messages:
+                            break
+                        batch = self.__take_batch(queue)
+                        queue.sending = len(batch)
+                    try:
+                        await self.__post(session, url, batch)
+                    finally:
+                        with self.lock:
+                            queue.sending = 0
+                            self.idle.notify_all()
+
+    async def __post(self, session: aiohttp.ClientSession, url: str, batch: list):
+        first = batch[0]
+        payload = {"content": first["content"], "embeds": [embed for message in batch for embed in message["embeds"]]}
+        for field in ("username", "avatar_url"):
+            if first[field]:
+                payload[field] = first[field]
+        params = {}
+        thread_name = first["thread_name"]
+        if thread_name:
+            thread_id = self.threads.get((url, thread_name))
+            if thread_id:
+                params["thread_id"] = thread_id
+            else:
+                payload["thread_name"] = thread_name
+                params["wait"] = "true" # the response has the new thread's id
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.__count("retries")
+            try:
+                async with session.post(url, json=payload, params=params) as response:
+                    self.__count("requests")
+                    if response.status == 429:
+                        self.__count("rate_limited")
+                        data = await response.json(content_type=None)
+                        await asyncio.sleep(float(data.get("retry_after", response.headers.get("Retry-After", 1))))
+                        continue
+                    if response.status >= 500:
+                        await asyncio.sleep(min(2 ** attempt * 0.5, 30))
+                        continue
+                    if response.status >= 400:
+                        print(f"Webhook rejected {len(batch)} messages ({response.status}): {await response.text()}")
+                        break
+                    if "thread_name" in payload:
+                        data = await response.json(content_type=None)
+                        self.threads[(url, thread_name)] = data.get("channel_id")
+                    self.__count("sent", len(batch))
+                    if response.headers.get("X-RateLimit-Remaining") == "0": # out of requests for now, wait before the next one
+                        await asyncio.sleep(float(response.headers.get("X-RateLimit-Reset-After", 1)))
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Could not reach webhook: {e}")
+                await asyncio.sleep(min(2 ** attempt * 0.5, 30))
+        self.__count("errors", len(batch))
+
+    def __count(self, counter: str, amount: int = 1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def flush(self, timeout: float = None) -> bool:
+        "Waits until every queued message is posted (or given up on). Returns False on timeout"
+        with self.idle:
+            return self.idle.wait_for(lambda: all(not queue.messages and not queue.sending for queue in self.queues.values()), timeout)
+
+    def close(self, timeout: float = 5):
+        "Posts what is queued (waiting at most `timeout` seconds), then closes the sessions and stops the loop"
+        self.flush(timeout)
+        async def stop():
+            workers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def snapshot(self) -> dict:
+        "Queue depth per webhook and counters"
+        with self.lock:
+            return {"depth": {url: len(queue.messages) for url, queue in self.queues.items()}, **self.counters}
+
+@functools.lru_cache(maxsize=None)
+def webhook_dispatcher() -> WebhookDispatcher:
+    "The dispatcher shared by everything in lodestone that sends webhooks"
+    return WebhookDispatcher()
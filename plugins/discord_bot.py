@@ -1,40 +1,40 @@
 import lodestone
 import re
-from discord import SyncWebhook, Embed
+from discord import Embed
 import datetime
-from types import FunctionType
+from lodestone.utils import send_webhook
+from lodestone.logger import pipeline, WebhookSink, daily_thread
 
 class DiscordWebhook:
     def __init__(self, bot: lodestone.Bot):
         "The injection method"
         self.bot = bot
         self.webhook_url = None
-        self.bot_log: FunctionType = self.bot.log
-        self.bot_log = FunctionType(
-            self.bot_log.__code__,
-            self.bot_log.__globals__,
-            self.bot_log.__name__,
-            self.bot_log.__defaults__,
-            self.bot_log.__closure__
-        )
-        self.bot_log.__dict__.update(self.bot.log.__dict__)
-        self.thread = 0
+        self.sink = None # posts the bot's logs, see `set_webhook`
+        self.thread = None # name of the forum thread posts go to
 
     def set_webhook(self, webhook_url, use_discord_forums = False):
         self.webhook_url = webhook_url
+        if self.sink:
+            pipeline.flush(5) # what the old sink still has to post
+            pipeline.remove_sink(self.sink)
+        # every log of this bot goes to the webhook from now on, batched in the background
+        username = self.bot.local_username
+        self.sink = pipeline.add_sink(WebhookSink(webhook_url, categories=("bot", "chat"), sources=(username,),
+                                                  thread_name=daily_thread if use_discord_forums else None,
+                                                  avatar_url="https://github.com/Project-Lodestone/Lodestone/blob/main/chestlogo.png?raw=true",
+                                                  footer={"text": username, "icon_url": f"https://mc-heads.net/avatar/{username}/600.png"}))
         self.bot.emit("discord_webhook", "Webhook set up!", use_discord_forums)
 
     def log(self, message, icon="🤖", error=False, info=False, warning=False, chat=False, console=True):
-        self.bot_log(message, icon, error, info, warning, chat, console)
-        self.send_discord(message, True)
+        "Same as `bot.log`, kept for plugins calling it. The webhook sink posts the message"
+        self.bot.log(message, icon, error, info, warning, chat, console=console)
 
     def send_discord(self, message: str, thread = None):
         if self.webhook_url is None or not re.fullmatch("(https://|http://|)(canary.|ptb.|www\.|)discord.com/api/webhooks/\d+/[a-zA-Z-0-9]+", self.webhook_url):
             raise ValueError(
                 "Webhook URL is missing or invalid"
             )
-        hook = SyncWebhook.from_url(url=self.webhook_url)  # connect to the webhook
-
         color = 0x3498db
         embed = Embed(title="", description=f"**{message}**", color=color)  # make the embed
         embed.timestamp = datetime.datetime.utcnow()
@@ -48,19 +48,11 @@ class DiscordWebhook:
             embed.set_footer(text='\u200b',
                              icon_url=avatar_url)  # fallback footer image
 
-        if thread:
-            if isinstance(thread, str):
-                self.thread = hook.send(content="", thread_name=f"{thread}", username="Lodestone",
-                          avatar_url=avatar_url,
-                          embed=embed, wait=True).thread  # send the message in a forums channel
-            else:
-                self.thread = hook.send(content="", thread=self.thread, username="Lodestone",
-                                        avatar_url=avatar_url,
-                                        embed=embed, wait=True).thread  # send the message in a forums channel
-        else:
-            hook.send(content=f" ", username="Lodestone",
-                      avatar_url=avatar_url,
-                      embed=embed)  # send the message in a normal channel
+        if isinstance(thread, str):
+            self.thread = thread # the dispatcher creates the thread once and keeps posting into it
+        # queued in the background, a burst of log lines goes out as a few requests of up to 10 embeds
+        send_webhook(self.webhook_url, username="Lodestone", avatar_url=avatar_url, embed=embed,
+                     thread_name=self.thread if thread else None)
 
     def on_discord_webhook(self, message: str, use_discord_forums: bool = False):
         today = datetime.date.today()
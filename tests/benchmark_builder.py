@@ -0,0 +1,119 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from javascript import require
+from rich.console import Console
+from rich.table import Table
+
+import lodestone
+from lodestone.mapart import image_to_schematic
+from lodestone.schematics import Schematic
+from lodestone.simulation import SimBot, SimWorld
+
+"""
+Benchmark the schematic builder against a simulated world and bot (see `lodestone.simulation`), no server needed.
+Runs fixed schematics through action generation, selection and placement, and reports actions/sec and simulated blocks/min.
+
+    python tests/benchmark_builder.py --save results.json
+    python tests/benchmark_builder.py --baseline results.json  # exits with 1 if anything got slower than the tolerance
+"""
+
+parser = argparse.ArgumentParser(description="Benchmark the schematic builder in a simulated world")
+parser.add_argument("--version", default="1.20.1")
+parser.add_argument("--baseline", help="results of an earlier run to compare against")
+parser.add_argument("--save", help="where to write the results")
+parser.add_argument("--tolerance", type=float, default=0.2, help="how much slower than the baseline is a regression")
+args = parser.parse_args()
+
+def cube():
+    "16x16x16 of stone"
+    return Schematic(np.ones((16, 16, 16), dtype=np.int32), ["minecraft:air", "minecraft:stone"])
+
+def house():
+    "24x8x24 plank walls with glass windows, a stone floor and a flat roof"
+    blocks = np.zeros((8, 24, 24), dtype=np.int32)
+    blocks[:, [0, -1], :] = blocks[:, :, [0, -1]] = 2
+    blocks[3:5, [0, -1], 4:20:3] = blocks[3:5, 4:20:3, [0, -1]] = 3
+    blocks[0] = 1
+    blocks[-1] = 2
+    return Schematic(blocks, ["minecraft:air", "minecraft:stone", "minecraft:oak_planks", "minecraft:glass"])
+
+def map_art():
+    "One map of flat map art from seeded noise"
+    pixels = np.random.default_rng(0).integers(0, 256, (128, 128, 3))
+    return image_to_schematic(pixels, args.version, dither=1.0)
+
+SCHEMATICS = {"cube": cube, "house": house, "map_art": map_art}
+
+console = Console()
+mcData = require("minecraft-data")(args.version)
+Block = require("prismarine-block")(args.version)
+
+def benchmark(name, make_schematic):
+    world = SimWorld(ground_y=0, ground_state=Block.fromString("minecraft:stone", 0).stateId, view_distance=4)
+    item_ids = {}
+    def item_for_state(state):
+        if state not in item_ids:
+            item = mcData.itemsByName[Block.fromStateId(state, 0).name]
+            item_ids[state] = item.id if item else None
+        return item_ids[state]
+    bot = SimBot(world, args.version, position=(0, 0, -2), registry=mcData, item_for_state=item_for_state)
+    plugin = lodestone.plugins.schematic(bot)
+    plugin.metrics_path = None
+    at = bot.entity.position.offset(0, 0, 2).floored()
+
+    schematic = plugin.PythonSchematic(make_schematic(), args.version)
+    started = time.perf_counter()
+    build = plugin.Build(schematic, world, at, loaded=plugin.loaded_columns)
+    generation = time.perf_counter() - started
+    world.intend(build.states, build.start)
+    generated = len(build.actions)
+
+    started = time.perf_counter()
+    actions = plugin.available_actions(build)
+    selection = time.perf_counter() - started
+
+    with console.status(f"[bold]Building {name}...\n") as status:
+        started = time.perf_counter()
+        plugin.builder(build, actions, status)
+        placement = time.perf_counter() - started
+
+    return {
+        "actions": generated,
+        "generation_per_second": round(generated / generation, 1),
+        "selection_per_second": round(len(actions) / selection, 1) if selection else None,
+        "placements_per_second": round(bot.placed / placement, 1) if placement else None,
+        "simulated_blocks_per_minute": round(bot.blocks_per_minute(), 1),
+        "placed": bot.placed,
+        "failed": len(build.actions) + len(build.error_actions),
+        "metrics": plugin.metrics.snapshot(),
+    }
+
+results = {name: benchmark(name, make_schematic) for name, make_schematic in SCHEMATICS.items()}
+
+table = Table("schematic", "actions", "generated/s", "selected/s", "placed/s", "sim blocks/min", "failed")
+for name, result in results.items():
+    table.add_row(name, str(result["actions"]), str(result["generation_per_second"]), str(result["selection_per_second"]),
+                  str(result["placements_per_second"]), str(result["simulated_blocks_per_minute"]), str(result["failed"]))
+console.print(table)
+
+if args.save:
+    with open(args.save, "w") as f:
+        json.dump(results, f, indent=4)
+
+if args.baseline:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, result in results.items():
+        for key in ("generation_per_second", "selection_per_second", "placements_per_second", "simulated_blocks_per_minute"):
+            before, after = baseline.get(name, {}).get(key), result[key]
+            if before and after is not None and after < before * (1 - args.tolerance):
+                regressions.append(f"{name} {key}: {before} -> {after}")
+    if regressions:
+        console.print("[bold red]Regressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+    console.print("[bold green]No regressions")
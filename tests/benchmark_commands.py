@@ -0,0 +1,82 @@
+import argparse
+import random
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+from lodestone.commands import ArgumentError, Command, CommandDispatcher, RateLimit
+
+"""
+Benchmark the chat command path (`lodestone.commands`): how many chat messages per second get matched, parsed and dispatched.
+Runs a mix of normal chat, commands with typed arguments, wrong arguments and unknown commands through a dispatcher with
+a few hundred registered commands, the same steps `Bot` takes for every chat message.
+
+    python tests/benchmark_commands.py --messages 500000
+"""
+
+parser = argparse.ArgumentParser(description="Benchmark chat command dispatching")
+parser.add_argument("--messages", type=int, default=200000)
+parser.add_argument("--commands", type=int, default=300, help="extra commands to register next to the ones used")
+parser.add_argument("--prefix", default="!")
+args = parser.parse_args()
+
+console = Console()
+random.seed(0)
+
+called = {"count": 0}
+def callback(*_):
+    called["count"] += 1
+
+dispatcher = CommandDispatcher(args.prefix)
+dispatcher.register(Command("tp", callback, arguments=(int, int, int), aliases=("teleport",)))
+dispatcher.register(Command("say", callback, arguments=(str,)))
+dispatcher.register(Command("region add", callback, arguments=(str,)))
+dispatcher.register(Command("region", callback))
+dispatcher.register(Command("version", callback))
+dispatcher.register(Command("owner only", callback, sender="Owner"))
+dispatcher.register(Command("stats", callback, arguments=(str,), sender_limit=RateLimit(0.5, 3), global_limit=RateLimit(5, 10)))
+for i in range(args.commands):
+    dispatcher.register(Command(f"command{i}", callback, arguments=(int,)))
+
+WORDS = ["hello", "anyone", "selling", "diamonds", "at", "spawn", "lol", "where", "is", "the", "base", "gg"]
+MIXES = {
+    "chat": lambda: " ".join(random.choices(WORDS, k=random.randint(1, 12))),
+    "command": lambda: random.choice([f"{args.prefix}tp 1 64 -3", f"{args.prefix}teleport 10 70 10", f"{args.prefix}say hello there everyone",
+                                      f"{args.prefix}region add spawn", f"{args.prefix}region", f"{args.prefix}version",
+                                      f"{args.prefix}command{random.randrange(args.commands)} 5"]),
+    "bad arguments": lambda: random.choice([f"{args.prefix}tp 1 two 3", f"{args.prefix}tp 1", f"{args.prefix}command1 x"]),
+    "unknown": lambda: f"{args.prefix}{random.choice(WORDS)} {random.choice(WORDS)}",
+    "flood (rate limited)": lambda: f"{args.prefix}stats {random.choice(WORDS)}",
+}
+
+def handle(sender, message):
+    "What the `chat` handler of `Bot` does with a message"
+    matched = dispatcher.match(message)
+    if matched:
+        command, words = matched
+        if command.allows(sender) and command.admit(sender):
+            try:
+                arguments = command.parse(words)
+            except ArgumentError:
+                return
+            command.callback(sender, command.name, arguments)
+
+def run(messages):
+    started = time.perf_counter()
+    for sender, message in messages:
+        handle(sender, message)
+    return len(messages) / (time.perf_counter() - started)
+
+table = Table("messages", "messages/s", "µs/message")
+results = {}
+for name, make in MIXES.items():
+    messages = [(random.choice(["Steve", "Alex", "Owner"]), make()) for _ in range(args.messages)]
+    results[name] = run(messages)
+mixed = [(random.choice(["Steve", "Alex", "Owner"]), MIXES["chat"]() if random.random() < 0.9 else MIXES["command"]()) for _ in range(args.messages)]
+results["90% chat, 10% commands"] = run(mixed)
+
+for name, rate in results.items():
+    table.add_row(name, f"{rate:,.0f}", f"{1e6 / rate:.2f}")
+console.print(table)
+console.print(f"{called['count']} callbacks ran")
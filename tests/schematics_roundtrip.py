@@ -0,0 +1,49 @@
+import gzip
+import os
+import struct
+import tempfile
+
+from lodestone.schematics import read_schematic
+
+"""
+Writes a small MCEdit schematic with AddBlocks and checks that reading it gives back the same block ids.
+
+    python tests/schematics_roundtrip.py
+"""
+
+def tag(kind: int, name: str, payload: bytes) -> bytes:
+    encoded = name.encode()
+    return bytes([kind]) + struct.pack(">H", len(encoded)) + encoded + payload
+
+def short(name: str, value: int) -> bytes:
+    return tag(2, name, struct.pack(">h", value))
+
+def byte_array(name: str, values: list) -> bytes:
+    return tag(7, name, struct.pack(">i", len(values)) + bytes(values))
+
+def string(name: str, value: str) -> bytes:
+    encoded = value.encode()
+    return tag(8, name, struct.pack(">H", len(encoded)) + encoded)
+
+# two blocks next to each other, ids above 255 so both need their AddBlocks nibble
+ids = [0x105, 0x20A]
+data = [3, 0]
+add = (ids[0] >> 8) | (ids[1] >> 8) << 4 # even index in the low nibble, odd index in the high one
+root = tag(10, "Schematic", b"".join([
+    short("Width", 2), short("Height", 1), short("Length", 1),
+    string("Materials", "Alpha"),
+    byte_array("Blocks", [block & 0xFF for block in ids]),
+    byte_array("Data", data),
+    byte_array("AddBlocks", [add]),
+]) + b"\x00")
+
+with tempfile.TemporaryDirectory() as directory:
+    file = os.path.join(directory, "addblocks.schematic")
+    with gzip.open(file, "wb") as f:
+        f.write(root)
+    schematic = read_schematic(file, cache=False)
+
+states = [schematic.palette[index] for index in schematic.blocks.reshape(-1).tolist()]
+expected = [f"legacy:{block}:{meta}" for block, meta in zip(ids, data)]
+assert states == expected, f"read {states}, expected {expected}"
+print(f"AddBlocks round trip ok: {states}")
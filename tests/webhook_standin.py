@@ -0,0 +1,84 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rich.console import Console
+
+from lodestone.webhook import WebhookDispatcher
+
+"""
+Run the webhook dispatcher (`lodestone.webhook`) against a local stand-in for Discord, no network or real webhook needed.
+The stand-in rate limits like Discord does: every `--limit`th request gets a 429 with `retry_after`.
+Checks that every embed arrives exactly once, in order, in requests of at most 10 embeds, and that sending never blocked.
+
+    python tests/webhook_standin.py --messages 500
+"""
+
+parser = argparse.ArgumentParser(description="Test the webhook dispatcher against a local Discord stand-in")
+parser.add_argument("--messages", type=int, default=300)
+parser.add_argument("--limit", type=int, default=5, help="every this many requests is answered with a 429")
+parser.add_argument("--retry-after", type=float, default=0.2)
+args = parser.parse_args()
+
+console = Console()
+received = []
+requests = {"count": 0, "rate_limited": 0, "threads": 0}
+lock = threading.Lock()
+
+class DiscordStandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with lock:
+            requests["count"] += 1
+            limited = requests["count"] % args.limit == 0
+            if limited:
+                requests["rate_limited"] += 1
+            elif "thread_name" in payload:
+                requests["threads"] += 1
+            if not limited:
+                received.append(payload)
+        if limited:
+            self.reply(429, {"message": "You are being rate limited.", "retry_after": args.retry_after, "global": False})
+        elif len(payload.get("embeds", [])) > 10:
+            self.reply(400, {"message": "Too many embeds"})
+        else:
+            self.reply(200, {"id": "1", "channel_id": "4242"})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), DiscordStandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{server.server_address[1]}/api/webhooks/1/token"
+
+dispatcher = WebhookDispatcher()
+started = time.perf_counter()
+slowest = 0.0
+for i in range(args.messages):
+    before = time.perf_counter()
+    dispatcher.send(url, embed={"description": f"log line {i}"}, username="Lodestone", thread_name="forum" if i % 50 == 0 and i else None)
+    slowest = max(slowest, time.perf_counter() - before)
+queued = time.perf_counter() - started
+dispatcher.flush(timeout=60)
+total = time.perf_counter() - started
+
+lines = [embed["description"] for payload in received for embed in payload.get("embeds", [])]
+expected = [f"log line {i}" for i in range(args.messages)]
+console.print(f"queued {args.messages} messages in {queued * 1000:.1f} ms (slowest send {slowest * 1000:.3f} ms), all posted after {total:.2f} s")
+console.print(f"{requests['count']} requests, {requests['rate_limited']} rate limited, {requests['threads']} threads created")
+console.print(dispatcher.snapshot())
+ok = sorted(lines) == sorted(expected) and max(len(payload.get("embeds", [])) for payload in received) <= 10
+console.print("[bold green]Every embed arrived once" if ok else "[bold red]Embeds were lost, duplicated or over-batched")
+dispatcher.close()
+server.shutdown()
+raise SystemExit(0 if ok else 1)